@@ -0,0 +1,105 @@
+# coding: utf8
+"""
+Benchmark of the compact dtypes (Transformation.compact_dtypes):
+memory of the dataframes and time of the value_counts/pivot paths used by the reports,
+before and after the conversion.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_compact_dtypes
+    python -m benchmarks.bench_compact_dtypes --month 2023-02 --repeat 50
+"""
+import argparse
+import os
+import time
+from typing import Callable, Dict
+import pandas as pd
+from project._collections import Collection
+from project.file_operations import Import
+from project.transformations import Transformation
+
+IMPORTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'project', 'imports')
+
+
+def memory_mb(dfs_dict: Dict[str, pd.DataFrame]) -> Dict[str, float]:
+    """
+    :param dfs_dict: dictionary with dataframes
+    :return: dictionary with the deep memory usage of every dataframe in MB
+    """
+    return {name: df.memory_usage(deep=True).sum() / 2 ** 20 for name, df in dfs_dict.items()}
+
+
+def report_paths(dfs_dict: Dict[str, pd.DataFrame]) -> Dict[str, Callable[[], object]]:
+    """
+    :param dfs_dict: dictionary with dataframes from Transformation.main()
+    :return: dictionary with the value_counts/pivot paths of Export.stats_* and Collection
+    """
+    monthly_df = dfs_dict['new_monthly_data_df']
+    full_df = dfs_dict['new_full_data_df']
+    # the pivot tables in Export.stats_mont_df_to_excel work on plain values
+    pivot_columns = ['company', 'nickname', 'concat_emp_company']
+    return {
+        'stats_mont by employee': lambda: monthly_df[['nickname', 'company']].value_counts(),
+        'stats_mont by company': lambda: pd.pivot_table(
+            monthly_df[pivot_columns].astype(object),
+            index=['company', 'nickname'], values=['concat_emp_company'], aggfunc='count',
+            margins=True, margins_name="Total", fill_value=0, sort=True),
+        'stats_full company_general': lambda: full_df[['company']].value_counts(normalize=True),
+        'stats_full by_year': lambda: full_df[['company', 'year']].value_counts(['company', 'year']).unstack(),
+        'stats_full by_trainer': lambda: full_df[['trainer', 'month']].value_counts(['trainer', 'month']),
+        'company_report_list': lambda: Collection.company_report_list(monthly_df),
+        'trainers_report_list': lambda: Collection.trainers_report_list(monthly_df),
+    }
+
+
+def best_time(function: Callable[[], object], runs: int) -> float:
+    """
+    :return: the best wall time in seconds out of the given number of runs
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(month: str, repeat: int, runs: int) -> None:
+    """
+    Transforms the sample imports (repeated the given number of times),
+    converts them with Transformation.compact_dtypes and prints the memory and the timings
+
+    :param month: the period in scope as 'YYYY-MM'
+    :param repeat: how many times the rows of the sample report are repeated
+    :param runs: number of runs per timing (the best one is printed)
+    :return: None
+    """
+    report_df = Import.import_report(os.path.join(IMPORTS_DIR, 'schedule2023-04-18.csv'))
+    limitations_df = Import.import_limitations(os.path.join(IMPORTS_DIR, 'limitations.csv'))
+    report_df = pd.concat([report_df] * repeat, ignore_index=True)
+    dfs_dict = Transformation.main(report_df, limitations_df, month)
+
+    start = time.perf_counter()
+    compact_dict = Transformation.compact_dtypes(dfs_dict)
+    print(f"rows: {len(report_df)}, compact_dtypes: {time.perf_counter() - start:.4f} s\n")
+
+    before, after = memory_mb(dfs_dict), memory_mb(compact_dict)
+    print(f"{'dataframe':<24} {'before, MB':>12} {'after, MB':>12} {'ratio':>8}")
+    for name in dfs_dict:
+        print(f"{name:<24} {before[name]:>12.2f} {after[name]:>12.2f} {before[name] / after[name]:>7.1f}x")
+    print(f"{'total':<24} {sum(before.values()):>12.2f} {sum(after.values()):>12.2f} "
+          f"{sum(before.values()) / sum(after.values()):>7.1f}x\n")
+
+    print(f"{'path':<28} {'before, s':>12} {'after, s':>12} {'speedup':>8}")
+    compact_paths = report_paths(compact_dict)
+    for name, function in report_paths(dfs_dict).items():
+        before_time, after_time = best_time(function, runs), best_time(compact_paths[name], runs)
+        print(f"{name:<28} {before_time:>12.4f} {after_time:>12.4f} {before_time / after_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Object vs. compact dtypes benchmark")
+    parser.add_argument('--month', default='2023-02', help="the period in scope as 'YYYY-MM'")
+    parser.add_argument('--repeat', type=int, default=20, help="repeat the rows of the sample report")
+    parser.add_argument('--runs', type=int, default=5, help="number of runs per timing")
+    arguments = parser.parse_args()
+    run(arguments.month, arguments.repeat, arguments.runs)
@@ -0,0 +1,96 @@
+# coding: utf8
+"""
+Benchmark of the for_reference .csv exports (Raw_Full, Raw_Mont, New_Full, New_Mont):
+DataFrame.to_csv() vs. CsvStream (plain, with a process pool and compressed).
+Every plain CsvStream file is compared byte by byte with the DataFrame.to_csv() one.
+pyarrow.csv.write_csv() is timed for reference only: it quotes all strings and
+formats the numbers in its own way, so its files are not the same
+(it gets the datetime/timedelta columns as text, as it can not write the durations).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_csv_export
+    python -m benchmarks.bench_csv_export --month 2023-02 --repeat 50 --workers 4
+"""
+import argparse
+import gzip
+import os
+import tempfile
+import time
+from typing import Callable, Dict
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from project.csv_stream import CsvStream
+from project.file_operations import Export, Import
+from project.transformations import Transformation
+
+IMPORTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'project', 'imports')
+REFERENCE_DFS = {'Raw_Full': 'full_raw_report_df', 'Raw_Mont': 'monthly_raw_report_df',
+                 'New_Full': 'new_full_data_df', 'New_Mont': 'new_monthly_data_df'}
+
+
+def measure(function: Callable[[], object]) -> float:
+    """
+    :return: the wall time of the function in seconds
+    """
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def read_bytes(file_path: str) -> bytes:
+    """
+    :return: the (decompressed) content of the file
+    """
+    opener = gzip.open if file_path.endswith('.gz') else open
+    with opener(file_path, 'rb') as file:
+        return file.read()
+
+
+def run(month: str, repeat: int, workers: int) -> None:
+    """
+    Transforms the sample imports (repeated the given number of times) and
+    writes the for_reference dataframes with every writer
+
+    :param month: the period in scope as 'YYYY-MM'
+    :param repeat: how many times the rows of the sample report are repeated
+    :param workers: number of the CsvStream processes
+    :return: None
+    """
+    report_df = Import.import_report(os.path.join(IMPORTS_DIR, 'schedule2023-04-18.csv'))
+    limitations_df = Import.import_limitations(os.path.join(IMPORTS_DIR, 'limitations.csv'))
+    report_df = pd.concat([report_df] * repeat, ignore_index=True)
+    dataframes_dict = Transformation.main(report_df, limitations_df, month)
+
+    print(f"{'report':<10} {'writer':<22} {'time, s':>8} {'size, MB':>9} {'identical':>10}")
+    with tempfile.TemporaryDirectory() as folder:
+        for name, df_name in REFERENCE_DFS.items():
+            df = Export.export_view(dataframes_dict[df_name])
+            writers: Dict[str, Callable[[str], object]] = {
+                'to_csv': lambda path: df.to_csv(path, encoding='utf-8', index=False),
+                'CsvStream': lambda path: CsvStream.df_to_csv(path, df),
+                f'CsvStream workers={workers}': lambda path: CsvStream.df_to_csv(path, df, workers=workers),
+                'CsvStream gzip': lambda path: CsvStream.df_to_csv(path, df, 'gzip'),
+                'pyarrow (reference)': lambda path: pa_csv.write_csv(
+                    pa.Table.from_pandas(CsvStream.format_columns(df), preserve_index=False), path),
+            }
+            reference = None
+            for writer, write in writers.items():
+                file_path = os.path.join(folder, f"{name}.csv.gz" if 'gzip' in writer else f"{name}.csv")
+                elapsed = measure(lambda: write(file_path))
+                content = read_bytes(file_path)
+                # the DataFrame.to_csv() file is the reference
+                reference = content if reference is None else reference
+                size = os.path.getsize(file_path) / 2 ** 20
+                print(f"{name:<10} {writer:<22} {elapsed:>8.2f} {size:>9.1f} {str(content == reference):>10}")
+                os.remove(file_path)
+            print(f"{name:<10} rows: {len(df)}, columns: {df.shape[1]}\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="DataFrame.to_csv vs. CsvStream benchmark")
+    parser.add_argument('--month', default='2023-02', help="the period in scope as 'YYYY-MM'")
+    parser.add_argument('--repeat', type=int, default=20, help="repeat the rows of the sample report")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="number of the CsvStream processes")
+    arguments = parser.parse_args()
+    run(arguments.month, arguments.repeat, arguments.workers)
@@ -0,0 +1,73 @@
+# coding: utf8
+"""
+Benchmark of the .xlsx export of the full history: DataFrame.to_excel() (every cell is kept
+in memory until the workbook is closed) vs. ExcelStream (the rows are streamed to the file).
+The peak memory is measured with tracemalloc.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_excel_stream
+    python -m benchmarks.bench_excel_stream --month 2023-02 --repeat 50
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Tuple
+import pandas as pd
+from project.excel import ExcelStream
+from project.file_operations import Export, Import
+from project.transformations import Transformation
+
+IMPORTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'project', 'imports')
+
+
+def measure(function: Callable[[], object]) -> Tuple[float, float]:
+    """
+    :return: the wall time in seconds and the peak traced memory in MB of the function
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run(month: str, repeat: int) -> None:
+    """
+    Transforms the sample imports (repeated the given number of times) and
+    writes the 'new_full_data_df' to .xlsx both ways
+
+    :param month: the period in scope as 'YYYY-MM'
+    :param repeat: how many times the rows of the sample report are repeated
+    :return: None
+    """
+    report_df = Import.import_report(os.path.join(IMPORTS_DIR, 'schedule2023-04-18.csv'))
+    limitations_df = Import.import_limitations(os.path.join(IMPORTS_DIR, 'limitations.csv'))
+    report_df = pd.concat([report_df] * repeat, ignore_index=True)
+    full_df = Export.export_view(Transformation.main(report_df, limitations_df, month)['new_full_data_df'])
+
+    with tempfile.TemporaryDirectory() as folder:
+        def to_excel():
+            with pd.ExcelWriter(os.path.join(folder, 'to_excel.xlsx'), engine='xlsxwriter') as ew:
+                full_df.to_excel(ew, sheet_name='new_full_data_df', index=False)
+
+        def excel_stream():
+            ExcelStream.dfs_to_excel(os.path.join(folder, 'stream.xlsx'), {'new_full_data_df': full_df})
+
+        results = {'to_excel': measure(to_excel), 'ExcelStream': measure(excel_stream)}
+
+    print(f"rows: {len(full_df)}, columns: {full_df.shape[1]}\n")
+    print(f"{'writer':<12} {'time, s':>10} {'peak, MB':>10}")
+    for writer, (elapsed, peak) in results.items():
+        print(f"{writer:<12} {elapsed:>10.2f} {peak:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="DataFrame.to_excel vs. ExcelStream benchmark")
+    parser.add_argument('--month', default='2023-02', help="the period in scope as 'YYYY-MM'")
+    parser.add_argument('--repeat', type=int, default=20, help="repeat the rows of the sample report")
+    arguments = parser.parse_args()
+    run(arguments.month, arguments.repeat)
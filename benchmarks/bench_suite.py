@@ -0,0 +1,254 @@
+# coding: utf8
+"""
+Scaling benchmark suite: generates synthetic Acuity exports (benchmarks.synthetic) of the given sizes and times
+the import, every BaseDataframe step of Transformation.full_history(), Transformation.monthly() and
+every Export function of the reports (the PDF conversion excluded), with the peak traced memory of every stage.
+The results are saved as JSON, a previous JSON file can be given to compare the versions.
+
+The exports run in a temporary copy of the 'imports' and 'images' folders,
+so the invoice sequence of the repository is not changed.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_suite --rows 10000 100000 --output results.json
+    python -m benchmarks.bench_suite --rows 1000000 --companies 500 --no-exports --output new.json --compare old.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import generate
+from project.batch import Batch
+from project.dataframes import BaseDataframe
+from project.file_operations import Import
+from project.reports import BaseReport, BulkReport
+from project.transformations import Transformation
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'project')
+
+
+class StageRecorder:
+    """Collects the wall time and the peak traced memory of the stages (the calls of a stage are summed up).
+    A container stage (e.g. Transformation.full_history) includes the stages measured inside it"""
+
+    def __init__(self):
+        self.stages: Dict[str, dict] = {}
+        self._depth = 0
+        self._containers: List[dict] = []
+
+    def _update_containers(self) -> None:
+        """
+        Keeps the peak of the open containers before the peak is reset for an inner stage
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        for container in self._containers:
+            container['peak'] = max(container['peak'], peak)
+
+    @contextmanager
+    def stage(self, name: str, container: bool = False) -> Iterator[None]:
+        """
+        Measures the block as the stage. The stages inside a stage are measured only as a part of it,
+        unless the outer stage is a container
+
+        :param name: the name of the stage
+        :param container: measure also the stages inside this one
+        """
+        if self._depth:
+            yield
+            return
+        self._update_containers()
+        tracemalloc.reset_peak()
+        entry = {'peak': tracemalloc.get_traced_memory()[0]}
+        baseline = entry['peak']
+        if container:
+            self._containers.append(entry)
+        else:
+            self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._update_containers()
+            if container:
+                self._containers.pop()
+            else:
+                self._depth -= 1
+            peak = (max(entry['peak'], tracemalloc.get_traced_memory()[1]) - baseline) / 2 ** 20
+            record = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_mb': 0.0})
+            record['calls'] += 1
+            record['seconds'] += elapsed
+            record['peak_mb'] = max(record['peak_mb'], peak)
+
+    def wrap(self, name: str, function: Callable) -> Callable:
+        """
+        :return: the function measured as the stage
+        """
+        def measured(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+        return measured
+
+    @contextmanager
+    def class_methods(self, cls: type) -> Iterator[None]:
+        """
+        Measures every call of the static methods of the class as a stage 'Class.method'
+        (only the outermost calls, e.g. add_flag() inside nickname() is a part of the nickname() stage)
+        """
+        originals = {name: value for name, value in vars(cls).items() if isinstance(value, staticmethod)}
+        try:
+            for name, value in originals.items():
+                setattr(cls, name, staticmethod(self.wrap(f"{cls.__name__}.{name}", value.__func__)))
+            yield
+        finally:
+            for name, value in originals.items():
+                setattr(cls, name, value)
+
+
+def environment() -> dict:
+    """
+    :return: the versions of Python, the packages and the code (git commit if available)
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'created': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def run_size(rows: int, companies: int, month: str, seed: int, exports: bool, folder: str) -> List[dict]:
+    """
+    Generates the data of one size and measures all stages
+
+    :param rows: number of the trainings
+    :param companies: number of the companies
+    :param month: the period of the monthly reports as 'YYYY-MM'
+    :param seed: the seed of the generator
+    :param exports: measure also the Export functions
+    :param folder: an empty working folder
+    :return: list with one result per stage
+    """
+    recorder = StageRecorder()
+    with recorder.stage('synthetic.generate'):
+        paths = generate(os.path.join(folder, 'data'), rows, companies, seed=seed)
+
+    with recorder.stage('Import.import_report'):
+        report_df = Import.import_report(paths['report'])
+    with recorder.stage('Import.import_limitations'):
+        limitations_df = Import.import_limitations(paths['limitations'])
+
+    with recorder.class_methods(BaseDataframe):
+        with recorder.stage('Transformation.full_history', container=True):
+            full_dfs_dict = Transformation.full_history(report_df, limitations_df)
+        with recorder.stage('Transformation.monthly', container=True):
+            dataframes_dict = Transformation.monthly(full_dfs_dict, month)
+
+    if exports:
+        # the templates, the logo and the invoice sequence are read relative to the working folder
+        for subfolder in ('imports', 'images'):
+            shutil.copytree(os.path.join(PROJECT_DIR, subfolder), os.path.join(folder, subfolder))
+        exports_path = os.path.join(folder, 'exports', '')
+        Batch.prepare_exports_folder(exports_path)
+        current_dir = os.getcwd()
+        os.chdir(folder)
+        try:
+            for report in BaseReport.create_report_instances(dataframes_dict, exports_path):
+                if not isinstance(report, BulkReport):
+                    with recorder.stage(f"Export.{report.export_function} ({report.name})"):
+                        report.export_report()
+        finally:
+            os.chdir(current_dir)
+
+    return [{'rows': rows, 'companies': companies, 'stage': stage, **record,
+             'seconds': round(record['seconds'], 4), 'peak_mb': round(record['peak_mb'], 2)}
+            for stage, record in recorder.stages.items()]
+
+
+def compare(results: List[dict], previous: List[dict], threshold: float) -> None:
+    """
+    Prints the time and memory ratios against the previous results of the same stages
+
+    :param results: the current results
+    :param previous: the results from a previous JSON file
+    :param threshold: the ratio above which a stage is marked as a regression
+    :return: None
+    """
+    previous_by_key = {(item['rows'], item['companies'], item['stage']): item for item in previous}
+    print(f"\n{'rows':>9} {'stage':<58} {'time x':>8} {'memory x':>9}")
+    for item in results:
+        old = previous_by_key.get((item['rows'], item['companies'], item['stage']))
+        if not old:
+            continue
+        time_ratio = item['seconds'] / old['seconds'] if old['seconds'] else float('nan')
+        memory_ratio = item['peak_mb'] / old['peak_mb'] if old['peak_mb'] else float('nan')
+        mark = '  <- regression' if time_ratio > threshold or memory_ratio > threshold else ''
+        print(f"{item['rows']:>9} {item['stage']:<58} {time_ratio:>8.2f} {memory_ratio:>9.2f}{mark}")
+
+
+def run(sizes: List[int], companies: int, month: str, seed: int, exports: bool, output: str,
+        previous: str = None, threshold: float = 1.2) -> None:
+    """
+    Runs the suite for every size, prints and saves the results
+
+    :param sizes: the numbers of the trainings
+    :param companies: number of the companies (default: one per thousand rows, between 10 and 5000)
+    :param month: the period of the monthly reports as 'YYYY-MM'
+    :param seed: the seed of the generator
+    :param exports: measure also the Export functions
+    :param output: path of the JSON file with the results
+    :param previous: path of a previous JSON file to compare with
+    :param threshold: the ratio above which a stage is marked as a regression
+    :return: None
+    """
+    results = []
+    tracemalloc.start()
+    try:
+        for rows in sizes:
+            size_companies = companies or min(5000, max(10, rows // 1000))
+            with tempfile.TemporaryDirectory() as folder:
+                size_results = run_size(rows, size_companies, month, seed, exports, folder)
+            results.extend(size_results)
+            print(f"\nrows: {rows}, companies: {size_companies}")
+            print(f"{'stage':<58} {'calls':>6} {'time, s':>9} {'peak, MB':>9}")
+            for item in size_results:
+                print(f"{item['stage']:<58} {item['calls']:>6} {item['seconds']:>9.3f} {item['peak_mb']:>9.1f}")
+    finally:
+        tracemalloc.stop()
+
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({'environment': environment(),
+                   'settings': {'sizes': sizes, 'companies': companies, 'month': month, 'seed': seed,
+                                'exports': exports},
+                   'results': results}, file, ensure_ascii=False, indent=2)
+    print(f"\nThe results are saved in '{output}'")
+
+    if previous:
+        with open(previous, encoding='utf-8') as file:
+            compare(results, json.load(file)['results'], threshold)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the transformations and the exports")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000], help="the sizes in trainings")
+    parser.add_argument('--companies', type=int, help="number of the companies (default: rows / 1000, 10 to 5000)")
+    parser.add_argument('--month', default='2023-02', help="the period of the monthly reports as 'YYYY-MM'")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument('--no-exports', action='store_true', help="measure only the import and the transformations")
+    parser.add_argument('--output', default='bench_suite.json', help="the JSON file with the results")
+    parser.add_argument('--compare', help="a previous JSON file to compare with")
+    parser.add_argument('--threshold', type=float, default=1.2, help="the ratio marked as a regression")
+    arguments = parser.parse_args()
+    run(arguments.rows, arguments.companies, arguments.month, arguments.seed, not arguments.no_exports,
+        arguments.output, arguments.compare, arguments.threshold)
@@ -0,0 +1,87 @@
+# coding: utf8
+"""
+Benchmark of the .docx reports (ReportFromTemplate): a template opened, cleaned and compiled
+for every report (the previous way) vs. the templates cached once per process.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_templates
+    python -m benchmarks.bench_templates --reports 200 --rows 40
+"""
+import argparse
+import os
+import tempfile
+import time
+import pandas as pd
+from docxtpl import DocxTemplate
+from project.dataframes import BaseDataframe
+from project.templates import ReportFromTemplate
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'project')
+
+
+def sample_df(rows: int) -> pd.DataFrame:
+    """
+    :param rows: number of the records
+    :return: dataframe with the columns of the by_calendar report records (the dates as datetime64)
+    """
+    return pd.DataFrame({
+        'company': ['SWIFT SYSTEMS'] * rows,
+        'training_datetime': [pd.Timestamp('2023-02-06 08:00')] * rows,
+        'employee_names': [f"Employee {i}" for i in range(rows)],
+        'short_type': ['Group'] * rows,
+        'bgn_per_hour': [25.0] * rows,
+    })
+
+
+def uncached_report(df: pd.DataFrame, exports_path: str) -> None:
+    """
+    The by_calendar report without the caches: the template is opened from the disk and
+    the records are collected cell by cell (the dates were formatted as text in the transformations)
+    """
+    doc = DocxTemplate("imports/Reports_by_calendar.docx")
+    row_list = [[df[col][i] for col in df.columns] for i in df.index]
+    doc.render({"calendar": "Trainer", "period": "Feb-2023", "invoice_list": row_list, "status": "Проведен",
+                "total_hours": len(df), "total_hours_sum": "0.00", "minus_description": "", "minus_value": 0,
+                "to_receive": "0.00"})
+    doc.save(f"{exports_path}from_templates/by_calendar/Reports_by_calendar_Trainer.docx")
+
+
+def run(reports: int, rows: int) -> None:
+    """
+    Renders the by_calendar report the given number of times both ways and prints the timings
+
+    :param reports: number of the rendered reports per way
+    :param rows: number of the records per report
+    :return: None
+    """
+    os.chdir(PROJECT_DIR)
+    df = sample_df(rows)
+    text_df = BaseDataframe.format_dates(df)
+    with tempfile.TemporaryDirectory() as exports_dir:
+        exports_path = os.path.join(exports_dir, '')
+        os.makedirs(f"{exports_path}from_templates/by_calendar")
+
+        start = time.perf_counter()
+        for _ in range(reports):
+            uncached_report(text_df, exports_path)
+        before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(reports):
+            ReportFromTemplate.create_by_calendar_report_from_docx_template("Trainer", df, len(df), 0,
+                                                                            exports_path)
+        after = time.perf_counter() - start
+
+    print(f"reports: {reports}, rows per report: {rows}\n")
+    print(f"{'way':<10} {'total, s':>10} {'per report, ms':>16}")
+    print(f"{'uncached':<10} {before:>10.3f} {before / reports * 1000:>16.1f}")
+    print(f"{'cached':<10} {after:>10.3f} {after / reports * 1000:>16.1f}")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Uncached vs. cached .docx templates benchmark")
+    parser.add_argument('--reports', type=int, default=100, help="number of the rendered reports per way")
+    parser.add_argument('--rows', type=int, default=20, help="number of the records per report")
+    arguments = parser.parse_args()
+    run(arguments.reports, arguments.rows)
@@ -0,0 +1,101 @@
+# coding: utf8
+"""
+Benchmark of the column-level transliteration engine
+(BaseDataframe.transliterate_bg_to_en) against the previous row-by-row loop.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_transliteration
+    python -m benchmarks.bench_transliteration --sizes 10000 1000000 10000000 --legacy-limit 1000000
+"""
+import argparse
+import time
+from typing import List
+import numpy as np
+import pandas as pd
+from project._collections import Collection
+from project.dataframes import BaseDataframe
+
+SAMPLE_NAMES = ['Иван', 'Мария', 'Георги', 'Щерю', 'Цветелина', 'Юлия', 'Яна', 'Жана', 'Ивайло', 'Петър',
+                'John', 'Anna', '', 'Дими-Тър', 'Ана Мария', 'Чавдар', 'Христина', 'Ъглен', 'Ясен', 'Теодора']
+
+
+def legacy_transliterate_bg_to_en(df: pd.DataFrame, column: str, new_column: str) -> pd.Series:
+    """
+    The previous implementation (row-by-row .loc access and str.replace per char)
+    kept only as a baseline for the benchmark
+
+    :param df: the dataframe with the column for transliteration
+    :param column: the name of the column with the original (cyrillic) values
+    :param new_column: the name of the column with the transliterated values
+    :return: pd.Series with the transliterated values in uppercase
+    """
+    bg_en_dict = Collection.transliterate_dict()
+    transliterated_string = ""
+    for i in range(len(df[column])):
+        string_value = df.loc[i, column].strip()
+        if string_value and not string_value.isascii():
+            for char in string_value:
+                if char in bg_en_dict.keys():
+                    string_value = string_value.replace(char, bg_en_dict[char])
+                    transliterated_string = string_value
+                else:
+                    transliterated_string = string_value
+            df.loc[i, new_column] = transliterated_string.upper()
+            transliterated_string = ""
+        else:
+            df.loc[i, new_column] = df.loc[i, column].upper()
+    return df[new_column]
+
+
+def make_names_df(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    :param rows: number of the rows in the generated dataframe
+    :param seed: seed for the random generator
+    :return: dataframe with one 'f_name' column built from SAMPLE_NAMES
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'f_name': np.array(SAMPLE_NAMES, dtype=object)[rng.integers(0, len(SAMPLE_NAMES), rows)]})
+
+
+def timed(function, *args) -> float:
+    """
+    :return: the wall time in seconds of a single function call
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run(sizes: List[int], legacy_limit: int) -> None:
+    """
+    Times both implementations for every size, checks that the results are equal
+    and prints one line per size
+
+    :param sizes: list with the number of rows
+    :param legacy_limit: the legacy loop is skipped for sizes above this number of rows
+    :return: None
+    """
+    print(f"{'rows':>10} {'engine, s':>12} {'legacy, s':>12} {'speedup':>10}")
+    for size in sizes:
+        df = make_names_df(size)
+        BaseDataframe.transliterate_value.cache_clear()
+        engine_time = timed(BaseDataframe.transliterate_bg_to_en, df, 'f_name', 'first_name')
+
+        if size <= legacy_limit:
+            legacy_df = df.copy()
+            legacy_time = timed(legacy_transliterate_bg_to_en, legacy_df, 'f_name', 'first_name')
+            expected = legacy_df['first_name']
+            actual = BaseDataframe.transliterate_bg_to_en(df, 'f_name', 'first_name')
+            pd.testing.assert_series_equal(actual, expected, check_names=False)
+            print(f"{size:>10} {engine_time:>12.4f} {legacy_time:>12.4f} {legacy_time / engine_time:>9.1f}x")
+        else:
+            print(f"{size:>10} {engine_time:>12.4f} {'skipped':>12} {'-':>10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Transliteration engine vs. legacy loop benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument('--legacy-limit', type=int, default=10_000,
+                        help="skip the (very slow) legacy loop above this number of rows")
+    arguments = parser.parse_args()
+    run(arguments.sizes, arguments.legacy_limit)
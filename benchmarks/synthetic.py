@@ -0,0 +1,287 @@
+# coding: utf8
+"""
+Deterministic generator of synthetic Acuity exports (the general/initial report) and matching limitations.csv
+files at any size, with the same columns, value formats and quirks as the real sample
+(Cyrillic and Latin names, company types in a few spellings, missing emails/phones/calendars, invalid phones,
+companies without a contract, out of scope types and companies with a history of contracts).
+The same arguments always give the same files.
+
+Usage (from the repository root):
+    python -m benchmarks.synthetic --rows 100000 --companies 50 --output-dir /tmp/acuity
+    python -m benchmarks.synthetic --rows 10000000 --companies 5000 --seed 7 --output-dir /tmp/acuity_10m
+"""
+import argparse
+import calendar
+import os
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from project._collections import Collection
+from project.dataframes import BaseDataframe
+
+FIRST_NAMES_MALE = ['Георги', 'Иван', 'Димитър', 'Николай', 'Петър', 'Христо', 'Тодор', 'Стефан', 'Васил',
+                    'Александър', 'Йордан', 'Емил', 'Красимир', 'Пламен', 'Мартин', 'Любомир', 'Цветан', 'Борислав',
+                    'Здравко', 'Щерьо', 'Жельо', 'Цочо', 'Панделис', 'Хитко', 'Ангел', 'Калоян']
+FIRST_NAMES_FEMALE = ['Мария', 'Иванка', 'Елена', 'Йорданка', 'Пенка', 'Даниела', 'Силвия', 'Теодора', 'Гергана',
+                      'Цветелина', 'Радостина', 'Женя', 'Юлия', 'Ясена', 'Щилияна', 'Зорница', 'Царевна', 'Мимоза',
+                      'Харития', 'Десислава', 'Весела', 'Боряна']
+LAST_NAMES = ['Иванов', 'Георгиев', 'Димитров', 'Петров', 'Николов', 'Христов', 'Стоянов', 'Тодоров', 'Илиев',
+              'Василев', 'Атанасов', 'Йорданов', 'Михайлов', 'Колчев', 'Четрафилски', 'Крушовски', 'Мангъфов',
+              'Каракашев', 'Коритаров', 'Щерев', 'Жеков', 'Цанков', 'Чупетловски', 'Дзезов', 'Юруков', 'Ясенов']
+LATIN_FIRST_NAMES = ['Charlie', 'Rex', 'Ethen', 'Garrett', 'Alonso', 'Jaydin', 'Sophie', 'Olivia', 'Liam', 'Emma']
+LATIN_LAST_NAMES = ["O'Santana", 'Ortega', 'Stewart', 'Fritz', 'Bass', 'Todd', 'Mc Donald', 'Keller', 'Nash']
+EMAIL_DOMAINS = ['abv.bg', 'gmail.com', 'yahoo.com', 'mail.bg', 'yahoo.co.uk', 'msn.com', 'yandex.ru']
+COMPANY_PREFIXES = ['Blue', 'Nova', 'Vortex', 'Quantum', 'Swift', 'Spark', 'Zet', 'Vital', 'Agile', 'Sunrise',
+                    'Dyna', 'Modern', 'Wise', 'Prodigy', 'Nexa', 'Vision', 'Indigo', 'Conzap', 'Nexern', 'Orbit']
+COMPANY_SUFFIXES = ['Nova', 'Tech', 'Systems', 'Corp', 'Mind', 'Peak', 'Way', 'Ideas', 'Labs', 'Works', 'tron',
+                    'Soft', 'Link', 'Point']
+TRAINER_NAMES = ['Димитър Петров | Dimitar Petrov', 'Александър Иванов | Aleksandar Ivanov',
+                 'Теодора Йорданова | Teodora Yordanova', 'Георги Стоянов | Georgi Stoyanov',
+                 'Георги Михайлов | Georgi Mihaylov', 'Мария Георгиева | Maria Georgieva',
+                 'Иван Тодоров | Ivan Todorov', 'Елена Николова | Elena Nikolova', 'Петя Колева | Petya Koleva',
+                 'Цветан Цветков | Tsvetan Tsvetkov', 'Щилияна Жекова | Shtiliyana Zhekova',
+                 'Юлиан Ясенов | Yulian Yasenov']
+# the types without a company and their out of scope rows in limitations.csv (is_valid = 0)
+GENERIC_TYPES = ['Онлайн коучинг', 'Тренинг за лидери на живо', 'Онлайн тренинг за лидери',
+                 'Leadership training in-person | Тренинг за лидери на живо',
+                 'Online leadership training | Онлайн тренинг за лидери']
+OUT_OF_SCOPE_COMPANIES = ['TEST', 'ТРЕНИНГ ЗА ЛИДЕРИ НА ЖИВО', 'LEADERSHIP TRAINING IN-PERSON',
+                          'ОНЛАЙН ТРЕНИНГ ЗА ЛИДЕРИ', 'ONLINE LEADERSHIP TRAINING', 'ОНЛАЙН КОУЧИНГ']
+TYPE_PATTERNS = {
+    'online': ['{} | Online leadership training | Онлайн тренинг за лидери',
+               '{}: Онлайн тренинг за лидери | Online leadership training',
+               '{} / Online leadership training | Онлайн тренинг за лидери'],
+    'in_person': ['{} | Leadership training in person | Тренинг за лидери на живо',
+                  '{}: Тренинг за лидери на живо | Leadership training in person',
+                  '{} / Leadership training in person / Тренинг за лидери на живо'],
+}
+NOTES = ['Извън платените 6 ', 'извън 6', 'Zoom meeting', 'От новите платени 6', '2/6',
+         'Changed more than 24 h before the meeting to Friday 18.00']
+PLATFORMS = ['Zoom', 'Viber', 'Skype', 'Zoom, Viber', 'Zoom, Skype, Viber', 'Skype, Viber']
+LABELS = ['Checked In', 'Confirmed', 'Completed']
+
+
+def pick(rng: np.random.Generator, values: List[str], count: int) -> np.ndarray:
+    """
+    :return: object array with count values chosen uniformly from the values
+    """
+    return np.array(values, dtype=object)[rng.integers(0, len(values), count)]
+
+
+def company_names(count: int) -> np.ndarray:
+    """
+    :param count: number of the companies
+    :return: unique company names like 'BlueNova' (with a number when the combinations are exhausted)
+    """
+    # 'Swift Systems' and 'Agile Ideas' are written with a space, 'BlueNova' and 'Zetron' without
+    combinations = [f"{prefix} {suffix}" if suffix in ('Systems', 'Ideas', 'Labs', 'Works') else f"{prefix}{suffix}"
+                    for suffix in COMPANY_SUFFIXES for prefix in COMPANY_PREFIXES if prefix != suffix]
+    names = [combinations[i % len(combinations)] + (f" {i // len(combinations) + 1}" if i >= len(combinations) else '')
+             for i in range(count)]
+    return np.array(names, dtype=object)
+
+
+def employees_table(rng: np.random.Generator, count: int, companies: np.ndarray) -> pd.DataFrame:
+    """
+    :param rng: the random generator
+    :param count: number of the employees
+    :param companies: the company names (the first companies are the largest ones)
+    :return: dataframe with one row per employee, the columns of the report which depend on the employee,
+            the 'company' number and the 'activity' weight (a few employees have many sessions)
+    """
+    # Zipf-like company sizes
+    weights = 1 / np.arange(1, len(companies) + 1) ** 0.9
+    company = rng.choice(len(companies), size=count, p=weights / weights.sum())
+    latin = rng.random(count) < 0.08
+    female = rng.random(count) < 0.5
+    first = np.where(female, pick(rng, FIRST_NAMES_FEMALE, count), pick(rng, FIRST_NAMES_MALE, count))
+    last = pick(rng, LAST_NAMES, count)
+    last = np.where(female, last + 'а', last)
+    first = np.where(latin, pick(rng, LATIN_FIRST_NAMES, count), first)
+    last = np.where(latin, pick(rng, LATIN_LAST_NAMES, count), last)
+
+    # the email parts are transliterated once per distinct name
+    latin_names = {name: BaseDataframe.transliterate_value(name).lower().replace("'", "").replace(' ', '')
+                   for name in set(first) | set(last)}
+    first_latin = pd.Series(first).map(latin_names)
+    last_latin = pd.Series(last).map(latin_names)
+    pvt_email = first_latin + '.' + last_latin + '@' + pick(rng, EMAIL_DOMAINS, count)
+    pvt_email = np.where(rng.random(count) < 0.97, pvt_email, None)
+    company_domains = pd.Series(companies).str.lower().str.replace(' ', '.', regex=False).to_numpy(dtype=object)
+    work_email = first_latin.str[:1] + '.' + last_latin + '@' + company_domains[company] + '.com'
+    work_email = np.where(rng.random(count) < 0.75, work_email, None)
+
+    phones = (880_000_000 + rng.integers(0, 20_000_000, count)).astype(str).astype(object)
+    phone_kind = rng.random(count)
+    # a few phones with a leading zero or a space and too short ones
+    phones = np.where(phone_kind < 0.02, '0' + phones, phones)
+    phones = np.where((phone_kind >= 0.02) & (phone_kind < 0.03), '088 123', phones)
+    phones = np.where(phone_kind >= 0.93, None, phones)
+
+    return pd.DataFrame({'First Name': first, 'Last Name': last, 'Phone': phones, 'Email': pvt_email,
+                         'Служебен имейл | Work email  ': work_email,
+                         'Предпочитани платформи | Preferred platforms  ':
+                             np.where(rng.random(count) < 0.45, pick(rng, PLATFORMS, count), None),
+                         'company': company,
+                         'activity': rng.pareto(1.5, count) + 1})
+
+
+def format_times(values: np.ndarray) -> np.ndarray:
+    """
+    :param values: datetime64 values
+    :return: the values formatted as the Acuity 'Start Time' ('December 23, 2020 16:00'), every distinct value once
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.DatetimeIndex(uniques)
+    texts = np.array([f"{calendar.month_name[value.month]} {value.day}, {value.year} {value:%H:%M}"
+                      for value in uniques], dtype=object)
+    return texts[codes]
+
+
+def report_chunk(rng: np.random.Generator, first_row: int, rows: int, employees: pd.DataFrame,
+                 companies: np.ndarray, period: Tuple[pd.Timestamp, pd.Timestamp]) -> pd.DataFrame:
+    """
+    :param rng: the random generator of the chunk
+    :param first_row: the number of the first row of the chunk (for the unique appointment ids)
+    :param rows: number of the rows in the chunk
+    :param employees: the employees_table()
+    :param companies: the company names
+    :param period: the first and the last day of the trainings of the chunk
+    :return: dataframe with the columns of the Acuity export, sorted by the start time
+    """
+    weights = employees['activity'].to_numpy()
+    employee = employees.iloc[rng.choice(len(employees), size=rows, p=weights / weights.sum())].reset_index(drop=True)
+
+    days = rng.integers(0, (period[1] - period[0]).days + 1, rows)
+    hours = rng.integers(9, 20, rows)
+    start = np.sort(np.datetime64(period[0], 'm') + days * 1440 + hours * 60)
+    end = start + 50
+    scheduled = (start.astype('datetime64[D]') - rng.integers(0, 30, rows)).astype(str).astype(object)
+
+    # the type spelling is chosen per company, the mode per training
+    online_types, in_person_types = (np.array([patterns[number % len(patterns)].format(name)
+                                               for number, name in enumerate(companies)], dtype=object)
+                                     for patterns in TYPE_PATTERNS.values())
+    company_number = employee['company'].to_numpy()
+    company = companies[company_number]
+    online = rng.random(rows) < 0.7
+    types = np.where(online, online_types[company_number], in_person_types[company_number])
+    kind = rng.random(rows)
+    types = np.where(kind < 0.03, pick(rng, GENERIC_TYPES, rows), types)
+    types = np.where((kind >= 0.03) & (kind < 0.04), np.where(online, 'Test: Онлайн тренинг за лидери',
+                                                                'Test: Тренинг за лидери на живо'), types)
+
+    trainers = pick(rng, TRAINER_NAMES, rows)
+    scheduled_by = np.where(rng.random(rows) < 0.25, 'a trainer', 'a client ').astype(object)
+    logged_in = rng.random(rows) < 0.12
+    scheduled_by = np.where(logged_in & employee['Email'].notna().to_numpy(),
+                            'client logged in as' + employee['Email'].fillna('').to_numpy(dtype=object), scheduled_by)
+
+    return pd.DataFrame({
+        'Start Time': format_times(start),
+        'End Time': format_times(end),
+        'First Name': employee['First Name'],
+        'Last Name': employee['Last Name'],
+        'Phone': employee['Phone'],
+        'Email': employee['Email'],
+        'Type': types,
+        'Calendar': np.where(rng.random(rows) < 0.04, None, trainers),
+        'Appointment Price': 0,
+        'Paid?': 'no',
+        'Amount Paid Online': 0,
+        'Certificate Code': None,
+        'Notes': np.where(rng.random(rows) < 0.006, pick(rng, NOTES, rows), None),
+        'Date Scheduled': scheduled,
+        'Label': np.where(rng.random(rows) < 0.004, pick(rng, LABELS, rows), None),
+        'Scheduled By': scheduled_by,
+        'Име на компанията, в която работите | Name of the company you work for  ':
+            np.where(rng.random(rows) < 0.75, company, None),
+        'Служебен имейл | Work email  ': employee['Служебен имейл | Work email  '],
+        'Предпочитани платформи | Preferred platforms  ': employee['Предпочитани платформи | Preferred platforms  '],
+        'Appointment ID': 480_000_000 + first_row + rng.permutation(rows),
+    }, columns=Collection.report_expected_columns())
+
+
+def limitations(rng: np.random.Generator, companies: np.ndarray, period: Tuple[pd.Timestamp, pd.Timestamp]) \
+        -> pd.DataFrame:
+    """
+    One or two consecutive contracts per company (about a tenth of the companies has no contract)
+    and the out of scope rows of the generic types
+
+    :param rng: the random generator
+    :param companies: the company names
+    :param period: the first and the last day of the trainings
+    :return: dataframe with the columns of limitations.csv
+    """
+    rows = []
+    for company in companies:
+        kind = rng.random()
+        rate = int(rng.choice([40, 50, 55]))
+        if kind < 0.1:
+            rows.append([company.upper(), 9999, 0, 0, '1.1.1920', '1.1.1920', 0, '', rate, 1])
+            continue
+        per_person = int(rng.choice([2, 3, 4, 5, 6, 12, 20, 9999]))
+        starts = period[0] + pd.Timedelta(days=int(rng.integers(0, 120)))
+        for _ in range(1 if kind < 0.7 else 2):
+            ends = starts + pd.Timedelta(days=364)
+            rows.append([company.upper(), per_person, int(rng.random() < 0.1), 0,
+                         f"{starts.day}.{starts.month}.{starts.year}", f"{ends.day}.{ends.month}.{ends.year}",
+                         364, '', rate, 1])
+            starts = ends + pd.Timedelta(days=1)
+    for company in OUT_OF_SCOPE_COMPANIES:
+        rows.append([company, 0, 0, 0, '1.1.1920', '1.1.1920', 0, '', 0, 0])
+    return pd.DataFrame(rows, columns=Collection.limitations_expected_columns())
+
+
+def generate(output_dir: str, rows: int, companies: int = 50, employees: int = None, seed: int = 0,
+             first_day: str = '2020-12-01', last_day: str = '2023-04-30', chunk_rows: int = 500_000) -> Dict[str, str]:
+    """
+    Writes a synthetic Acuity export ('schedule.csv') and the matching 'limitations.csv'.
+    The report is generated and written by chunks of consecutive periods, so the memory does not depend
+    on the number of rows and the rows are sorted by the start time as in the real export
+
+    :param output_dir: the folder of the files (created if missing)
+    :param rows: number of the trainings
+    :param companies: number of the companies
+    :param employees: number of the employees (default: a seventh of the rows, at least 10)
+    :param seed: the seed of the random generator, the same arguments give the same files
+    :param first_day: the first day of the trainings as 'YYYY-MM-DD'
+    :param last_day: the last day of the trainings as 'YYYY-MM-DD'
+    :param chunk_rows: number of the rows generated at once
+    :return: dictionary with the 'report' and the 'limitations' paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    names = company_names(companies)
+    employees_df = employees_table(rng, employees or max(10, rows // 7), names)
+    first, last = pd.Timestamp(first_day), pd.Timestamp(last_day)
+
+    paths = {'report': os.path.join(output_dir, 'schedule.csv'),
+             'limitations': os.path.join(output_dir, 'limitations.csv')}
+    limitations(rng, names, (first, last)).to_csv(paths['limitations'], index=False, encoding='utf-8')
+
+    chunks = max(1, -(-rows // chunk_rows))
+    total_days = (last - first).days + 1
+    with open(paths['report'], 'w', encoding='utf-8', newline='') as file:
+        for chunk in range(chunks):
+            first_row = chunk * rows // chunks
+            chunk_size = (chunk + 1) * rows // chunks - first_row
+            # every chunk covers the next part of the period with its own (seeded) generator
+            chunk_period = (first + pd.Timedelta(days=chunk * total_days // chunks),
+                            first + pd.Timedelta(days=max(chunk * total_days // chunks,
+                                                          (chunk + 1) * total_days // chunks - 1)))
+            chunk_rng = np.random.default_rng([seed, chunk])
+            report_chunk(chunk_rng, first_row, chunk_size, employees_df, names, chunk_period) \
+                .to_csv(file, index=False, header=chunk == 0)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic Acuity export and limitations.csv")
+    parser.add_argument('--rows', type=int, default=100_000, help="number of the trainings")
+    parser.add_argument('--companies', type=int, default=50, help="number of the companies")
+    parser.add_argument('--employees', type=int, help="number of the employees (default: rows / 7)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random generator")
+    parser.add_argument('--output-dir', required=True, help="the folder of the generated files")
+    arguments = parser.parse_args()
+    print(generate(arguments.output_dir, arguments.rows, arguments.companies, arguments.employees, arguments.seed))
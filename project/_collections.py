@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import List, Dict
 import pandas as pd
 
@@ -17,6 +18,12 @@ class Collection:
         limitations_expected_columns():
             :return: the expected names and order of the imported Limitations report
 
+        report_date_columns() -> Dict[str, str]:
+            :return: the date columns of the imported Initial/General report with their explicit formats
+
+        limitations_date_columns() -> Dict[str, str]:
+            :return: the date columns of the imported Limitations report with their explicit formats
+
         date_default_format():
             :return: a date format (09-Feb-2023)
 
@@ -26,18 +33,33 @@ class Collection:
         datetime_final_format():
             :return: a datetime format (2020-12-23 16:00:00)
 
+        period_format():
+            :return: a month period format (Feb-2023)
+
+        export_date_formats() -> Dict[str, str]:
+            :return: the datetime columns formatted as text at the export with their formats
+
+        unwanted_chars_pattern() -> str:
+            :return: regex with the chars removed from the string values (single quotes, double spaces, backticks)
+
         flags_dict() -> dict:
             :return: dictionary with flag numbers and flags meanings
 
         transliterate_dict() -> Dict[str, str]:
             :return: dictionary with every bg letter as key and the latin equivalent as value
 
+        transliterate_table() -> Dict[int, str]:
+            :return: translation table (for str.translate) compiled once from transliterate_dict()
+
         new_data_columns() -> List[str]:
             :return: series/columns for the new dataframes
 
         trainings_columns() -> List[List[str]]:
             :return: two lists with series/column names for the new dataframes
 
+        compact_columns() -> List[str]:
+            :return: low-cardinality string columns stored as categoricals in the compact dtype mode
+
         generic_report_list() -> List[str]:
             :return: list with dataframe names
 
@@ -84,6 +106,24 @@ class Collection:
         return ['COMPANY', 'C_PER_PERSON', 'C_PER_MONTH', 'PREPAID', 'START', 'END', 'DURATION DAYS',
                 'NOTE', 'BGN_PER_HOUR', 'IS_VALID']
 
+    @staticmethod
+    def report_date_columns() -> Dict[str, str]:
+        """
+        :return: the date columns of the imported Initial/General report with their explicit formats
+                (December 23, 2020 16:00 and 2020-12-21)
+        """
+        return {'Start Time': "%B %d, %Y %H:%M",
+                'End Time': "%B %d, %Y %H:%M",
+                'Date Scheduled': "%Y-%m-%d"}
+
+    @staticmethod
+    def limitations_date_columns() -> Dict[str, str]:
+        """
+        :return: the date columns of the imported Limitations report with their explicit formats (1.12.2022)
+        """
+        return {'starts': "%d.%m.%Y",
+                'ends': "%d.%m.%Y"}
+
     @staticmethod
     def date_default_format():
         """
@@ -105,13 +145,38 @@ class Collection:
         """
         return "%Y-%m-%d %H:%M:%S"
 
+    @staticmethod
+    def period_format():
+        """
+        :return: a month period format (Feb-2023)
+        """
+        return "%b-%Y"
+
+    @staticmethod
+    def export_date_formats() -> Dict[str, str]:
+        """
+        :return: dictionary with the format by column of the datetime columns
+                which are kept as datetime64 in the transformations and formatted as text only at the export
+        """
+        return {'training_datetime': Collection.datetime_default_format(),
+                'scheduled_date': Collection.date_default_format(),
+                'training_end': Collection.date_default_format(),
+                'ends': Collection.date_default_format()}
+
+    @staticmethod
+    def unwanted_chars_pattern() -> str:
+        """
+        :return: regex with the chars removed from the string values (single quotes, double spaces, backticks)
+        """
+        return "'|  |`"
+
     @staticmethod
     def flags_dict() -> dict:
         """
         :return: dictionary with flag numbers and flags meanings
         """
         return {
-            'flag_number': [1, 2, 3, 4, 5, 6, 7, 8, 9],
+            'flag_number': [1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
             'flag_note':
                 ['names issue',
                  'work_mail issue',
@@ -121,7 +186,8 @@ class Collection:
                  'phone number issue',
                  'missing short_type',
                  'pvt email equal to work email',
-                 'number of the trainings left less than 1'
+                 'number of the trainings left less than 1',
+                 'nickname shared by different employees of the company'
                  ]}
 
     @staticmethod
@@ -199,6 +265,14 @@ class Collection:
 
         return bg_en_dict
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def transliterate_table() -> Dict[int, str]:
+        """
+        :return: translation table (for str.translate) compiled once from transliterate_dict()
+        """
+        return str.maketrans(Collection.transliterate_dict())
+
     @staticmethod
     def new_data_columns() -> List[str]:
         """
@@ -226,7 +300,12 @@ class Collection:
             'scheduled_date',
             'type',
             'emp_names_input',
-            'is_valid'
+            'is_valid',
+            # the internal integer keys (see Dimensions), dropped at the export
+            'employee_id',
+            'company_id',
+            'trainer_id',
+            'emp_company_id'
         ]
 
     @staticmethod
@@ -255,6 +334,21 @@ class Collection:
             'status'
         ]]
 
+    @staticmethod
+    def compact_columns() -> List[str]:
+        """
+        :return: low-cardinality string columns stored as categoricals in the compact dtype mode
+        """
+        return [
+            'company',
+            'trainer',
+            'short_type',
+            'dayname',
+            'month',
+            'type',
+            'returns_or_not'
+        ]
+
     @staticmethod
     def generic_report_list() -> List[str]:
         """
@@ -289,6 +383,6 @@ class Collection:
     def trainers_report_list(monthly_data: pd.DataFrame) -> List[str]:
         """
         :param monthly_data:
-        :return: list with trainer names
+        :return: list with trainer names (the trainings without a calendar have no trainer and no report)
         """
-        return [trainer for trainer in monthly_data['trainer'].unique()]
+        return [trainer for trainer in monthly_data['trainer'].dropna().unique()]
@@ -0,0 +1,150 @@
+# coding: utf8
+import logging
+import os
+import queue
+import threading
+import zipfile
+from typing import List, Set
+
+
+class ArchiveBuilder:
+    """Class used to build the .zip archive of the 'exports' folder while the reports are still exported.
+        The files are added as soon as they are ready and written by a background thread
+        (zlib releases the GIL, so the compression runs next to the report generation).
+        The already compressed formats are stored, the rest is deflated
+
+        Attributes
+        ----------
+        save_as : str
+            path of the .zip file
+        folder : str
+            the folder which is archived (the names in the archive start with the folder name)
+        compresslevel : int
+            the zlib compression level of the deflated files
+
+        Methods
+        -------
+        stored_extensions() -> List[str]:
+            :return: the file extensions which are stored without compression
+
+        compression(file_path: str) -> int:
+            :return: the zipfile compression constant for the file
+
+        add(file_path: str) -> None:
+            Queues a ready file for the archive (every file is added once)
+
+        add_files(file_paths: List[str]) -> None:
+            Queues all ready files for the archive
+
+        close() -> None:
+            Queues the rest of the folder, waits for the writer and closes the archive
+
+        abort() -> None:
+            Stops the writer and removes the incomplete archive
+    """
+
+    def __init__(self, save_as: str, folder: str = "exports", compresslevel: int = 6):
+        self.save_as = save_as
+        self.folder = folder
+        self.compresslevel = compresslevel
+        self._archive_root = os.path.dirname(os.path.abspath(folder))
+        self._added: Set[str] = {os.path.abspath(save_as)}
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._errors: List[Exception] = []
+        self._zip_file = zipfile.ZipFile(save_as, 'w')
+        self._writer = threading.Thread(target=self._write_files, name="ArchiveBuilder", daemon=True)
+        self._writer.start()
+
+    def __enter__(self) -> "ArchiveBuilder":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @staticmethod
+    def stored_extensions() -> List[str]:
+        """
+        :return: the file extensions which are stored without compression
+                (the Office files are zip archives themselves, the rest is compressed by its format)
+        """
+        return ['.xlsx', '.docx', '.pdf', '.zip', '.png', '.jpg', '.jpeg', '.gif', '.gz', '.zst', '.feather']
+
+    @staticmethod
+    def compression(file_path: str) -> int:
+        """
+        :param file_path: path of the file
+        :return: zipfile.ZIP_STORED for the already compressed formats, zipfile.ZIP_DEFLATED otherwise
+        """
+        if os.path.splitext(file_path)[1].lower() in ArchiveBuilder.stored_extensions():
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+
+    def add(self, file_path: str) -> None:
+        """
+        Queues a ready file (or folder) for the archive, the paths which are already added are ignored
+
+        :param file_path: path of a file in the archived folder
+        :return: None
+        """
+        absolute_path = os.path.abspath(file_path)
+        if absolute_path not in self._added:
+            self._added.add(absolute_path)
+            self._queue.put(absolute_path)
+
+    def add_files(self, file_paths: List[str]) -> None:
+        """
+        :param file_paths: paths of ready files in the archived folder
+        :return: None
+        """
+        for file_path in file_paths:
+            self.add(file_path)
+
+    def _write_files(self) -> None:
+        """
+        The writer thread: writes the queued files until the None at the end of the queue
+        """
+        while True:
+            file_path = self._queue.get()
+            if file_path is None:
+                return
+            try:
+                arcname = os.path.relpath(file_path, self._archive_root)
+                if os.path.isdir(file_path):
+                    self._zip_file.write(file_path, arcname)
+                else:
+                    self._zip_file.write(file_path, arcname, self.compression(file_path), self.compresslevel)
+            except Exception as error:
+                logging.error(f"'{file_path}' could not be added to '{self.save_as}': {error!r}")
+                self._errors.append(error)
+
+    def close(self) -> None:
+        """
+        Queues the files and the folders which are not added yet, waits for the writer and closes the archive
+
+        :return: None
+        :raises: the first error of the writer
+        """
+        for root, dirs, files in os.walk(self.folder):
+            self.add_files([os.path.join(root, file) for file in files])
+            self.add_files([os.path.join(root, directory) for directory in dirs])
+        self._queue.put(None)
+        self._writer.join()
+        self._zip_file.close()
+        if self._errors:
+            raise self._errors[0]
+        logging.info(f"The .zip file '{self.save_as}' with {len(self._added) - 1} files and folders was created")
+
+    def abort(self) -> None:
+        """
+        Stops the writer after the queued files and removes the incomplete archive
+
+        :return: None
+        """
+        self._queue.put(None)
+        self._writer.join()
+        self._zip_file.close()
+        os.remove(self.save_as)
+        logging.info(f"The incomplete .zip file '{self.save_as}' was removed")
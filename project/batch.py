@@ -0,0 +1,288 @@
+# coding: utf8
+"""
+Headless (non-interactive) entry point for the reports pipeline.
+Replaces the file explorer dialogs and the input() prompts with arguments or a config file,
+so the pipeline can be scheduled on a machine without a display.
+
+Usage (from the repository root):
+    python -m project.batch --report schedule.csv --limitations limitations.csv \
+        --months 2023-02 2023-03 --output-dir out/ --archive out/reports_{month}.zip
+
+    python -m project.batch --config batch.ini
+
+Example config file (relative paths are resolved from the config file folder,
+the command line arguments override the config values):
+    [batch]
+    report = imports/schedule2023-04-18.csv
+    limitations = imports/limitations.csv
+    months = 2023-02 2023-03
+    output_dir = exports
+    archive = reports_and_invoices_{month}.zip
+    cache = use
+    compact = no
+    csv_compression = gzip
+    workers = 4
+    report_workers = 4
+    skip = Raw_Full New_Full
+    metrics = metrics.jsonl
+"""
+import argparse
+import configparser
+import logging
+import os
+from typing import Dict, List
+from project.file_operations import Import, Clearing
+from project.archive import ArchiveBuilder
+from project.transformations import Transformation
+from project.reports import BaseReport, ReportScheduler
+from project.cache import TransformationCache
+from project.csv_stream import CsvStream
+from project.instrumentation import Instrumentation
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Batch:
+    """Class used to run the whole pipeline without user interaction
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        export_subfolders() -> List[str]:
+            :return: the sub-folders of the 'exports' folder needed by the reports
+
+        parse_arguments(argv: List[str] = None) -> Dict[str, object]:
+            Reads the command line arguments and the optional config file
+
+        prepare_exports_folder(exports_path: str) -> None:
+            Creates the 'exports' folder structure and removes files from previous runs
+
+        archive_path(archive: str, month: str, months_count: int) -> str:
+            Makes the .zip path for a particular month
+
+        run(report: str, limitations: str, months: List[str], output_dir: str, archive: str = None,
+            cache: str = "use", compact: bool = False, workers: int = 0, report_workers: int = 0,
+            only: List[str] = None, skip: List[str] = None, csv_compression: str = None,
+            metrics: str = None) -> None:
+            Imports and transforms the reports once and exports all reports (and the archive) for every month,
+            optionally measuring the stages
+
+        export_months(report: str, limitations: str, months: List[str], output_dir: str, archive: str = None,
+                      cache: str = "use", compact: bool = False, workers: int = 0, report_workers: int = 0,
+                      only: List[str] = None, skip: List[str] = None, csv_compression: str = None) -> None:
+            The pipeline of run() without the measuring
+    """
+
+    @staticmethod
+    def export_subfolders() -> List[str]:
+        """
+        :return: the sub-folders of the 'exports' folder needed by the reports
+        """
+        return ['for_reference', 'invoices',
+                'from_templates/by_calendar/PDFs',
+                'from_templates/by_company/PDFs',
+                'from_templates/by_company_x/PDFs']
+
+    @staticmethod
+    def parse_arguments(argv: List[str] = None) -> Dict[str, object]:
+        """
+        Reads the command line arguments and the optional config file ([batch] section).
+        The command line arguments override the config values
+
+        :param argv: the command line arguments (sys.argv[1:] if missing)
+        :return: dictionary with absolute 'report', 'limitations', 'output_dir', 'archive' paths,
+                'months' list, 'cache' mode, 'compact' flag, number of 'workers' and 'report_workers'
+                the 'only'/'skip' report lists, the 'csv_compression' and the absolute 'metrics' path
+        """
+        parser = argparse.ArgumentParser(description="Run the reports pipeline without user interaction")
+        parser.add_argument('--config', help="INI file with a [batch] section")
+        parser.add_argument('--report', help="the general/initial .csv report")
+        parser.add_argument('--limitations', help="the limitations .csv file")
+        parser.add_argument('--months', nargs='+', help="one or more periods in scope as 'YYYY-MM'")
+        parser.add_argument('--output-dir', help="the folder where the reports are exported")
+        parser.add_argument('--archive', help="path of the .zip archive, may contain a '{month}' placeholder")
+        parser.add_argument('--cache', choices=TransformationCache.cache_modes(),
+                            help="'use' (default) the cache of the transformed data, 'rebuild' it, 'bypass' it "
+                                 "or transform only the new/changed appointments ('incremental')")
+        parser.add_argument('--compact', action='store_true', default=None,
+                            help="use categoricals and downcasted integers for the dataframes")
+        parser.add_argument('--csv-compression', choices=list(CsvStream.compressions()),
+                            help="compress the for_reference .csv files (zstd needs the 'zstandard' package)")
+        parser.add_argument('--workers', type=int,
+                            help="number of the processes for the invoices, the .docx reports and the .csv files "
+                                 "and of the LibreOffice instances for the PDFs (0 for no pool)")
+        parser.add_argument('--report-workers', type=int,
+                            help="number of the threads for the independent reports (0 to export them one by one)")
+        parser.add_argument('--only', nargs='+', help="export only these reports (and the reports they depend on)")
+        parser.add_argument('--skip', nargs='+', help="do not export these reports (and the reports depending on them)")
+        parser.add_argument('--metrics', help="measure the stages: append them to this JSON lines file "
+                                              "and print a summary table at the end")
+        arguments = parser.parse_args(argv)
+
+        settings = {}
+        if arguments.config:
+            config = configparser.ConfigParser()
+            if not config.read(arguments.config, encoding='utf-8'):
+                parser.error(f"The config file '{arguments.config}' can not be read")
+            config_dir = os.path.dirname(os.path.abspath(arguments.config))
+            section = config['batch'] if config.has_section('batch') else {}
+            for key in ('report', 'limitations', 'output_dir', 'archive', 'metrics'):
+                if section.get(key):
+                    settings[key] = os.path.join(config_dir, section[key])
+            if section.get('months'):
+                settings['months'] = section['months'].replace(',', ' ').split()
+            if section.get('cache'):
+                settings['cache'] = section['cache']
+            if section.get('compact'):
+                settings['compact'] = section.getboolean('compact')
+            if section.get('csv_compression'):
+                settings['csv_compression'] = section['csv_compression']
+            if section.get('workers'):
+                settings['workers'] = section.getint('workers')
+            if section.get('report_workers'):
+                settings['report_workers'] = section.getint('report_workers')
+            for key in ('only', 'skip'):
+                if section.get(key):
+                    settings[key] = section[key].replace(',', ' ').split()
+
+        for key in ('report', 'limitations', 'months', 'output_dir', 'archive', 'cache', 'compact', 'workers',
+                    'report_workers', 'only', 'skip', 'csv_compression', 'metrics'):
+            value = getattr(arguments, key)
+            if value:
+                settings[key] = value
+
+        missing = [key for key in ('report', 'limitations', 'months', 'output_dir') if not settings.get(key)]
+        if missing:
+            parser.error(f"Missing required settings: {', '.join(missing)}")
+
+        for key in ('report', 'limitations', 'output_dir', 'archive', 'metrics'):
+            if settings.get(key):
+                settings[key] = os.path.abspath(settings[key])
+        settings.setdefault('archive', None)
+        settings.setdefault('cache', 'use')
+        settings.setdefault('compact', False)
+        settings.setdefault('workers', 0)
+        settings.setdefault('report_workers', 0)
+        settings.setdefault('only', None)
+        settings.setdefault('skip', None)
+        settings.setdefault('csv_compression', None)
+        settings.setdefault('metrics', None)
+        if settings['cache'] not in TransformationCache.cache_modes():
+            parser.error(f"Unknown cache mode '{settings['cache']}'")
+        if settings['csv_compression'] and settings['csv_compression'] not in CsvStream.compressions():
+            parser.error(f"Unknown csv compression '{settings['csv_compression']}'")
+        return settings
+
+    @staticmethod
+    def prepare_exports_folder(exports_path: str) -> None:
+        """
+        Creates the 'exports' folder structure and removes files from previous runs
+
+        :param exports_path: path of the 'exports' folder
+        :return: None
+        """
+        for subfolder in Batch.export_subfolders():
+            os.makedirs(os.path.join(exports_path, subfolder), exist_ok=True)
+        Clearing.delete_files_from_export_subfolders(exports_path)
+
+    @staticmethod
+    def archive_path(archive: str, month: str, months_count: int) -> str:
+        """
+        Makes the .zip path for a particular month: fills the '{month}' placeholder or,
+        when more than one month is exported, adds the month to the file name
+
+        :param archive: path of the .zip archive
+        :param month: the period in scope as 'YYYY-MM'
+        :param months_count: the number of exported months
+        :return: the path of the .zip archive for the month
+        """
+        if '{month}' in archive:
+            return archive.replace('{month}', month)
+        if months_count > 1:
+            root, extension = os.path.splitext(archive)
+            return f"{root}_{month}{extension or '.zip'}"
+        return archive
+
+    @staticmethod
+    def run(report: str, limitations: str, months: List[str], output_dir: str, archive: str = None,
+            cache: str = "use", compact: bool = False, workers: int = 0, report_workers: int = 0,
+            only: List[str] = None, skip: List[str] = None, csv_compression: str = None,
+            metrics: str = None) -> None:
+        """
+        Imports and transforms the reports once and exports all reports (and the archive) for every month.
+        With more than one month the reports are exported in a sub-folder per month
+
+        :param report: absolute path of the general/initial .csv report
+        :param limitations: absolute path of the limitations .csv file
+        :param months: list with the periods in scope as 'YYYY-MM'
+        :param output_dir: absolute path of the folder where the reports are exported
+        :param archive: absolute path of the .zip archive (no archive if missing)
+        :param cache: the TransformationCache mode
+        :param compact: use the compact dtypes (Transformation.compact_dtypes())
+        :param workers: number of the processes for the invoices and the .docx reports
+                and of the LibreOffice instances for the PDF conversion (0 for no pool)
+        :param report_workers: number of the threads for the independent reports (0 to export them one by one)
+        :param only: names of the reports to export (and the reports they depend on), all reports if missing
+        :param skip: names of the reports not to export (and the reports depending on them)
+        :param csv_compression: None for plain .csv files, 'gzip' or 'zstd' (see CsvStream.compressions())
+        :param metrics: absolute path of the JSON lines file for the stage metrics (see Instrumentation),
+                no measuring if missing
+        :return: None
+        """
+        # the templates and the logo are read relative to the project folder
+        os.chdir(PROJECT_DIR)
+
+        if metrics:
+            Instrumentation.enable(metrics)
+        try:
+            Batch.export_months(report, limitations, months, output_dir, archive, cache, compact, workers,
+                                report_workers, only, skip, csv_compression)
+        finally:
+            if metrics:
+                Instrumentation.disable()
+                Instrumentation.log_summary()
+
+    @staticmethod
+    def export_months(report: str, limitations: str, months: List[str], output_dir: str, archive: str = None,
+                      cache: str = "use", compact: bool = False, workers: int = 0, report_workers: int = 0,
+                      only: List[str] = None, skip: List[str] = None, csv_compression: str = None) -> None:
+        """
+        The pipeline of run(): see its parameters
+
+        :return: None
+        """
+        original_report = Import.import_report(report)
+        limitations_file = Import.import_limitations(limitations)
+        full_dfs_dict = TransformationCache.full_history(original_report, limitations_file, cache)
+        # the rows of every month are found once for all months
+        month_index = Transformation.month_index(full_dfs_dict['full_raw_report_df'])
+
+        for month in months:
+            logging.info(f"Batch run for '{month}' was initiated")
+            exports_path = output_dir if len(months) == 1 else os.path.join(output_dir, month)
+            Batch.prepare_exports_folder(exports_path)
+
+            dataframes_dictionary = Transformation.monthly(full_dfs_dict, month, month_index)
+            if compact:
+                dataframes_dictionary = Transformation.compact_dtypes(dataframes_dictionary)
+            report_instances = BaseReport.create_report_instances(dataframes_dictionary,
+                                                                  os.path.join(exports_path, ''), workers,
+                                                                  csv_compression)
+            report_graph = BaseReport.report_dependencies()
+            report_instances = ReportScheduler.select(report_instances, report_graph, only, skip)
+            if not archive:
+                ReportScheduler.run(report_instances, report_graph, report_workers, desc=month)
+            else:
+                # the files of every exported report are archived while the next reports are exported
+                with ArchiveBuilder(Batch.archive_path(archive, month, len(months)), exports_path) as builder:
+                    ReportScheduler.run(report_instances, report_graph, report_workers, desc=month,
+                                        on_done=lambda report: builder.add_files(
+                                            BaseReport.report_files(report.name, exports_path)))
+            logging.info(f"Batch run for '{month}' was successfully done")
+
+
+if __name__ == '__main__':
+    Batch.run(**Batch.parse_arguments())
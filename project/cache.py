@@ -0,0 +1,430 @@
+# coding: utf8
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from project.dataframes import BaseDataframe
+from project.dimensions import Dimensions
+from project.transformations import Transformation
+
+
+class TransformationCache:
+    """Class used to keep the transformed (full history) dataframes on the disk
+        in Arrow IPC (.feather) format, so the runs with unchanged imports
+        don't repeat the whole Transformation chain
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        cache_folder() -> str:
+            :return: the relative path of the cache folder
+
+        cache_modes() -> List[str]:
+            :return: the supported cache modes ('incremental' uses the IncrementalStore)
+
+        max_entries() -> int:
+            :return: the number of the most recent cache entries which are kept on the disk
+
+        code_version() -> str:
+            Hash of the transformation source code and the pandas version
+
+        fingerprint(report_df: pd.DataFrame, limitations_df: pd.DataFrame) -> str:
+            Content hash of both imported dataframes plus the code version
+
+        load(key: str, folder: str) -> Dict[str, pd.DataFrame]:
+            Reads the cached dataframes for the given key (None if missing)
+
+        save(key: str, dfs_dict: Dict[str, pd.DataFrame], folder: str) -> None:
+            Writes the dataframes for the given key
+
+        full_history(report_df: pd.DataFrame, limitations_df: pd.DataFrame, mode: str = "use",
+                     folder: str = None) -> Dict[str, pd.DataFrame]:
+            Returns the Transformation.full_history() dataframes from the cache or builds them
+    """
+
+    @staticmethod
+    def cache_folder() -> str:
+        """
+        :return: the relative path of the cache folder
+        """
+        return "cache/"
+
+    @staticmethod
+    def cache_modes() -> List[str]:
+        """
+        :return: the supported cache modes:
+                'use' - load from the cache or build and save,
+                'rebuild' - build and overwrite the cache,
+                'bypass' - build without reading or writing the cache,
+                'incremental' - transform only the new or changed appointments (see IncrementalStore)
+        """
+        return ['use', 'rebuild', 'bypass', 'incremental']
+
+    @staticmethod
+    def max_entries() -> int:
+        """
+        :return: the number of the most recent cache entries which are kept on the disk
+        """
+        return 5
+
+    @staticmethod
+    def code_version() -> str:
+        """
+        Hash of the source code of the transformation modules and the pandas version,
+        so every change in the transformations invalidates the cache automatically
+        (stats.py too, as the full stats cube is a part of the cached dataframes)
+
+        :return: hex digest
+        """
+        project_dir = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256(pd.__version__.encode())
+        for module in ('_collections.py', 'dataframes.py', 'dimensions.py', 'stats.py', 'transformations.py',
+                       'cache.py'):
+            with open(os.path.join(project_dir, module), 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    @staticmethod
+    def fingerprint(report_df: pd.DataFrame, limitations_df: pd.DataFrame) -> str:
+        """
+        Content hash of both imported dataframes (values, column names and dtypes) plus the code version.
+        Must be called before the transformations, because they change the imported dataframes
+
+        :param report_df: the imported general/initial report
+        :param limitations_df: the imported limitations
+        :return: hex digest used as a cache key
+        """
+        digest = hashlib.sha256(TransformationCache.code_version().encode())
+        for df in (report_df, limitations_df):
+            digest.update(repr([(str(column), str(dtype)) for column, dtype in df.dtypes.items()]).encode())
+            digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def load(key: str, folder: str) -> Dict[str, pd.DataFrame]:
+        """
+        Reads the cached dataframes for the given key
+
+        :param key: the fingerprint of the imports
+        :param folder: the cache folder
+        :return: dictionary with the dataframes or None if there is no such cache entry
+        """
+        entry = os.path.join(folder, key)
+        manifest_path = os.path.join(entry, 'manifest.json')
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        dfs_dict = {}
+        for name, attrs in manifest.items():
+            df = pd.read_feather(os.path.join(entry, f"{name}.feather"))
+            df.attrs.update(attrs)
+            dfs_dict[name] = df
+        # mark the entry as recently used
+        os.utime(entry)
+        return dfs_dict
+
+    @staticmethod
+    def save(key: str, dfs_dict: Dict[str, pd.DataFrame], folder: str) -> None:
+        """
+        Writes the dataframes for the given key into a temporary folder and renames it,
+        so an interrupted run never leaves a broken cache entry.
+        Only the most recent entries are kept
+
+        :param key: the fingerprint of the imports
+        :param dfs_dict: dictionary with the dataframes
+        :param folder: the cache folder
+        :return: None
+        """
+        entry = os.path.join(folder, key)
+        temp_entry = f"{entry}.tmp-{os.getpid()}"
+        os.makedirs(temp_entry, exist_ok=True)
+
+        manifest = {}
+        for name, df in dfs_dict.items():
+            df.reset_index(drop=True).to_feather(os.path.join(temp_entry, f"{name}.feather"))
+            manifest[name] = df.attrs
+        with open(os.path.join(temp_entry, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(temp_entry, entry)
+
+        # remove the oldest entries
+        entries = sorted((os.path.join(folder, e) for e in os.listdir(folder)
+                          if re.fullmatch('[0-9a-f]{64}', e)),
+                         key=os.path.getmtime, reverse=True)
+        for old_entry in entries[TransformationCache.max_entries():]:
+            shutil.rmtree(old_entry, ignore_errors=True)
+
+    @staticmethod
+    def full_history(report_df: pd.DataFrame,
+                     limitations_df: pd.DataFrame,
+                     mode: str = "use",
+                     folder: str = None) -> Dict[str, pd.DataFrame]:
+        """
+        Returns the Transformation.full_history() dataframes from the cache
+        or builds them (and saves them) depending on the mode
+
+        :param report_df: the imported general/initial report
+        :param limitations_df: the imported limitations
+        :param mode: 'use', 'rebuild', 'bypass' or 'incremental' (see cache_modes())
+        :param folder: the cache folder (default: cache_folder())
+        :return: dictionary with the full history dataframes
+        """
+        if mode not in TransformationCache.cache_modes():
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {TransformationCache.cache_modes()}")
+        if mode != "bypass":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                logging.warning("pyarrow is not installed, the transformation cache is bypassed")
+                mode = "bypass"
+        if mode == "bypass":
+            return Transformation.full_history(report_df, limitations_df)
+
+        folder = folder or TransformationCache.cache_folder()
+        if mode == "incremental":
+            return IncrementalStore.full_history(report_df, limitations_df, os.path.join(folder, 'incremental'))
+
+        key = TransformationCache.fingerprint(report_df, limitations_df)
+
+        if mode == "use":
+            dfs_dict = TransformationCache.load(key, folder)
+            if dfs_dict is not None:
+                logging.info(f"The transformed dataframes were loaded from the cache '{key}'")
+                return dfs_dict
+
+        dfs_dict = Transformation.full_history(report_df, limitations_df)
+        os.makedirs(folder, exist_ok=True)
+        TransformationCache.save(key, dfs_dict, folder)
+        logging.info(f"The transformed dataframes were saved in the cache '{key}'")
+        return dfs_dict
+
+
+class IncrementalStore:
+    """Class used to keep the transformed full history on the disk keyed by 'appointment_id',
+        so a new (cumulative) export transforms only the new or changed appointments.
+        The history related columns ('total_per_emp', 'returns_or_not', 'active_trainings_per_client',
+        'trainings_left' and the flag 9) are updated from stored counts instead of groupby passes.
+        A change in the limitations or in the transformations code rebuilds the store
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        row_hashes(report_df: pd.DataFrame) -> pd.Series:
+            Content hash of every imported row indexed by the appointment id
+
+        load(folder: str) -> Dict[str, object]:
+            Reads the stored dataframes, counts and metadata (None if missing)
+
+        save(folder: str, key: str, full_raw_report_df: pd.DataFrame, hashes: pd.Series,
+             emp_counts: pd.Series, client_counts: pd.Series) -> None:
+            Writes the store
+
+        rebuild(report_df: pd.DataFrame, limitations_df: pd.DataFrame, folder: str, key: str,
+                hashes: pd.Series) -> Dict[str, pd.DataFrame]:
+            Transforms the whole history and writes a new store
+
+        nickname_conflict(unchanged_df: pd.DataFrame, new_df: pd.DataFrame, removed_df: pd.DataFrame) -> bool:
+            Checks if the changed rows touch a nickname shared by different employees of a company
+
+        full_history(report_df: pd.DataFrame, limitations_df: pd.DataFrame, folder: str
+                     ) -> Dict[str, pd.DataFrame]:
+            Returns the Transformation.full_history() dataframes transforming only the new or changed rows
+    """
+
+    @staticmethod
+    def row_hashes(report_df: pd.DataFrame) -> pd.Series:
+        """
+        :param report_df: the imported general/initial report
+        :return: content hash of every imported row indexed by the (trimmed) appointment id
+        """
+        return pd.Series(pd.util.hash_pandas_object(report_df, index=False).values,
+                         index=report_df['Appointment ID'].astype(str).str.strip().values)
+
+    @staticmethod
+    def load(folder: str) -> Dict[str, object]:
+        """
+        Reads the stored dataframes, counts and metadata
+
+        :param folder: the store folder
+        :return: dictionary with 'key', 'full_raw_report_df', 'hashes', 'emp_counts', 'client_counts'
+                or None if there is no store
+        """
+        meta_path = os.path.join(folder, 'meta.json')
+        if not os.path.isfile(meta_path):
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+
+        full_raw_report_df = pd.read_feather(os.path.join(folder, 'full_raw_report_df.feather'))
+        full_raw_report_df.attrs.update(meta['attrs'])
+        hashes = pd.read_feather(os.path.join(folder, 'hashes.feather')).set_index('appointment_id')['row_hash']
+        emp_counts = pd.read_feather(os.path.join(folder, 'emp_counts.feather')).set_index('key')['count']
+        client_counts = pd.read_feather(os.path.join(folder, 'client_counts.feather')).set_index('key')['count']
+        return {'key': meta['key'], 'full_raw_report_df': full_raw_report_df, 'hashes': hashes,
+                'emp_counts': emp_counts, 'client_counts': client_counts}
+
+    @staticmethod
+    def save(folder: str, key: str, full_raw_report_df: pd.DataFrame, hashes: pd.Series,
+             emp_counts: pd.Series, client_counts: pd.Series) -> None:
+        """
+        Writes the store into a temporary folder and renames it,
+        so an interrupted run never leaves a broken store
+
+        :param folder: the store folder
+        :param key: the fingerprint of the limitations and the code version
+        :param full_raw_report_df: the transformed general/initial report
+        :param hashes: the row hashes by appointment id
+        :param emp_counts: number of trainings by 'concat_emp_company' value
+        :param client_counts: number of trainings in the active contract period
+                by BaseDataframe.contract_client_key() value
+        :return: None
+        """
+        temp_folder = f"{folder.rstrip(os.sep)}.tmp-{os.getpid()}"
+        os.makedirs(temp_folder, exist_ok=True)
+
+        full_raw_report_df.reset_index(drop=True).to_feather(os.path.join(temp_folder, 'full_raw_report_df.feather'))
+        pd.DataFrame({'appointment_id': hashes.index, 'row_hash': hashes.values}) \
+            .to_feather(os.path.join(temp_folder, 'hashes.feather'))
+        for name, counts in (('emp_counts', emp_counts), ('client_counts', client_counts)):
+            pd.DataFrame({'key': counts.index, 'count': counts.values}) \
+                .to_feather(os.path.join(temp_folder, f"{name}.feather"))
+        with open(os.path.join(temp_folder, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'attrs': full_raw_report_df.attrs}, f)
+
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(temp_folder, folder)
+
+    @staticmethod
+    def rebuild(report_df: pd.DataFrame, limitations_df: pd.DataFrame, folder: str, key: str,
+                hashes: pd.Series) -> Dict[str, pd.DataFrame]:
+        """
+        Transforms the whole history and writes a new store
+
+        :param report_df: the imported general/initial report
+        :param limitations_df: the imported limitations
+        :param folder: the store folder
+        :param key: the fingerprint of the limitations and the code version
+        :param hashes: the row hashes by appointment id
+        :return: dictionary with the full history dataframes
+        """
+        full_dfs_dict = Transformation.full_history(report_df, limitations_df)
+        full_raw_report_df = full_dfs_dict['full_raw_report_df']
+        IncrementalStore.save(folder, key, full_raw_report_df, hashes,
+                              full_raw_report_df['concat_emp_company'].value_counts(),
+                              BaseDataframe.contract_client_key(full_raw_report_df).value_counts())
+        return full_dfs_dict
+
+    @staticmethod
+    def nickname_conflict(unchanged_df: pd.DataFrame, new_df: pd.DataFrame, removed_df: pd.DataFrame) -> bool:
+        """
+        The nicknames shared by different employees of a company are made unique by the order of the employees
+        in the whole history (BaseDataframe.unique_nicknames()), so they can not be built from the new rows alone.
+        The first employee keeps the nickname, so a new row which is another employee than the stored ones
+        with the same nickname and company means a (new or renumbered) shared nickname
+
+        :param unchanged_df: the stored transformed rows which are kept
+        :param new_df: the transformed new or changed rows
+        :param removed_df: the stored transformed rows which are removed or changed
+        :return: True if the changed rows have a shared nickname (flag 10) or are other employees
+                than the stored rows with the same nickname and company
+        """
+        if BaseDataframe.has_flag(new_df['flags'], 10).any() or BaseDataframe.has_flag(removed_df['flags'], 10).any():
+            return True
+        pairs = ['nickname', 'company']
+        stored_pairs = pd.MultiIndex.from_frame(unchanged_df[pairs]).isin(pd.MultiIndex.from_frame(new_df[pairs]))
+        persons = BaseDataframe.nickname_persons(pd.concat([new_df, unchanged_df.loc[stored_pairs]],
+                                                           ignore_index=True))
+        return bool((persons['persons'] > 1).any())
+
+    @staticmethod
+    def full_history(report_df: pd.DataFrame,
+                     limitations_df: pd.DataFrame,
+                     folder: str) -> Dict[str, pd.DataFrame]:
+        """
+        Returns the Transformation.full_history() dataframes transforming only the new or changed rows
+        (by appointment id and row content) and updates the store.
+        The whole history is transformed when there is no store, when the limitations or the code
+        were changed, when the appointment ids are not unique or when the changed rows touch
+        a nickname shared by different employees
+
+        :param report_df: the imported general/initial report
+        :param limitations_df: the imported limitations
+        :param folder: the store folder
+        :return: dictionary with the full history dataframes
+        """
+        hashes = IncrementalStore.row_hashes(report_df)
+        if not hashes.index.is_unique:
+            logging.warning("The appointment ids are not unique, the incremental store is bypassed")
+            return Transformation.full_history(report_df, limitations_df)
+
+        key = TransformationCache.fingerprint(report_df.iloc[0:0], limitations_df)
+        store = IncrementalStore.load(folder)
+
+        if store is None or store['key'] != key:
+            logging.info("The incremental store is missing or outdated, the whole history is transformed")
+            return IncrementalStore.rebuild(report_df, limitations_df, folder, key, hashes)
+
+        # split the export to unchanged and new or changed appointments
+        stored_df = store['full_raw_report_df']
+        stored_hashes = store['hashes']
+        common_ids = hashes.index.intersection(stored_hashes.index)
+        unchanged_ids = common_ids[hashes.loc[common_ids].values == stored_hashes.loc[common_ids].values]
+        unchanged_filter = stored_df['appointment_id'].isin(unchanged_ids)
+        new_rows_filter = ~hashes.index.isin(unchanged_ids)
+        logging.info(f"Incremental transformation of {new_rows_filter.sum()} new or changed "
+                     f"and {(~unchanged_filter).sum()} removed or changed appointments")
+
+        removed_df = stored_df.loc[~unchanged_filter]
+        parts = [stored_df.loc[unchanged_filter]]
+        if new_rows_filter.any():
+            new_report_df = report_df.loc[new_rows_filter].reset_index(drop=True)
+            new_df = Transformation.full_history(new_report_df, limitations_df.copy())['full_raw_report_df']
+            parts.append(new_df)
+        else:
+            new_df = stored_df.iloc[0:0]
+        if IncrementalStore.nickname_conflict(parts[0], new_df, removed_df):
+            logging.info("The changed appointments touch a nickname shared by different employees, "
+                         "the whole history is transformed")
+            return IncrementalStore.rebuild(report_df, limitations_df, folder, key, hashes)
+        full_raw_report_df = pd.concat(parts, ignore_index=True)
+
+        # keep the order of the export
+        export_position = pd.Series(np.arange(len(hashes)), index=hashes.index)
+        order = np.argsort(full_raw_report_df['appointment_id'].map(export_position).values, kind='stable')
+        full_raw_report_df = full_raw_report_df.iloc[order].reset_index(drop=True)
+        # the keys of the stored and of the new rows are not the same, they are given again to the whole history
+        full_raw_report_df = Dimensions.add_keys(full_raw_report_df)
+
+        # update the counts only with the added and the removed rows
+        counts = {}
+        affected_rows = full_raw_report_df['appointment_id'].isin(new_df['appointment_id'])
+        for name, count_key, stored_counts in (
+                ('emp_counts', lambda df: df['concat_emp_company'], store['emp_counts']),
+                ('client_counts', BaseDataframe.contract_client_key, store['client_counts'])):
+            delta = count_key(new_df).value_counts().sub(count_key(removed_df).value_counts(), fill_value=0)
+            updated_counts = stored_counts.add(delta, fill_value=0)
+            counts[name] = updated_counts[updated_counts > 0].astype(int)
+            affected_rows |= count_key(full_raw_report_df).isin(delta.index)
+
+        full_raw_report_df = BaseDataframe.update_history_columns(full_raw_report_df,
+                                                                  counts['emp_counts'],
+                                                                  counts['client_counts'],
+                                                                  affected_rows)
+        IncrementalStore.save(folder, key, full_raw_report_df, hashes,
+                              counts['emp_counts'], counts['client_counts'])
+        return Transformation.full_history_dfs(full_raw_report_df, BaseDataframe.limitations_func(limitations_df))
@@ -0,0 +1,139 @@
+# coding: utf8
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+
+class PdfConverter:
+    """Class used to convert the .docx reports to PDF with headless LibreOffice.
+        Every LibreOffice instance converts a whole batch of files in a single call
+        and uses its own user profile, so a few instances can run side by side
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        soffice_path() -> str:
+            Finds the LibreOffice executable ('SOFFICE_PATH' environment variable, PATH or the default locations)
+
+        batches(files: List[str], workers: int) -> List[List[str]]:
+            Splits the files into one batch per LibreOffice instance
+
+        convert_batch(files: List[str], output_folder: str, soffice: str, timeout: int = 60) -> Dict[str, str]:
+            Converts the files with one headless LibreOffice instance
+
+        convert_files(files: List[str], output_folder: str, workers: int = 0, timeout: int = 60) -> Dict[str, str]:
+            Converts the files in one or more batches (one LibreOffice instance per batch)
+
+        convert_folder(files_path: str, output_folder: str = None, workers: int = 0,
+                       timeout: int = 60) -> Dict[str, str]:
+            Converts all .docx files of the folder
+    """
+
+    @staticmethod
+    def soffice_path() -> str:
+        """
+        Finds the LibreOffice executable: the 'SOFFICE_PATH' environment variable,
+        'soffice'/'libreoffice' in PATH or the default Windows/macOS locations
+
+        :return: path of the LibreOffice executable
+        :raises FileNotFoundError: if LibreOffice is not found
+        """
+        candidates = [os.environ.get('SOFFICE_PATH'), shutil.which('soffice'), shutil.which('libreoffice'),
+                      r"C:\Program Files\LibreOffice\program\soffice.exe",
+                      "/Applications/LibreOffice.app/Contents/MacOS/soffice"]
+        for candidate in candidates:
+            if candidate and os.path.isfile(candidate):
+                return candidate
+        raise FileNotFoundError("LibreOffice was not found, install it or set the 'SOFFICE_PATH' environment variable")
+
+    @staticmethod
+    def batches(files: List[str], workers: int) -> List[List[str]]:
+        """
+        :param files: paths of the files to convert
+        :param workers: number of the LibreOffice instances (0 or 1 for a single instance)
+        :return: list with one batch of files per LibreOffice instance (round-robin split)
+        """
+        count = max(1, min(workers, len(files)))
+        return [files[i::count] for i in range(count) if files[i::count]]
+
+    @staticmethod
+    def convert_batch(files: List[str], output_folder: str, soffice: str, timeout: int = 60) -> Dict[str, str]:
+        """
+        Converts the files with one headless LibreOffice instance (a single call for the whole batch).
+        The instance runs with a temporary user profile, so it does not clash with other
+        running instances. A file is 'converted' only if its PDF is written by this call
+
+        :param files: paths of the files to convert
+        :param output_folder: folder of the PDF files
+        :param soffice: path of the LibreOffice executable
+        :param timeout: seconds per file before the instance is stopped
+        :return: dictionary with the status ('converted', 'failed' or 'timeout') by file path
+        """
+        started = time.time()
+        with tempfile.TemporaryDirectory(prefix="soffice_profile_") as profile:
+            command = [soffice, f"-env:UserInstallation={Path(profile).as_uri()}",
+                       "--headless", "--norestore", "--convert-to", "pdf", "--outdir", output_folder, *files]
+            try:
+                result = subprocess.run(command, capture_output=True, text=True, timeout=timeout * len(files))
+                failed_status = 'failed'
+                if result.returncode:
+                    logging.warning(f"LibreOffice exited with code {result.returncode}: {result.stderr.strip()}")
+            except subprocess.TimeoutExpired:
+                failed_status = 'timeout'
+                logging.warning(f"LibreOffice did not convert {len(files)} files in {timeout * len(files)} seconds")
+
+        statuses = {}
+        for file in files:
+            pdf = os.path.join(output_folder, f"{Path(file).stem}.pdf")
+            converted = os.path.isfile(pdf) and os.path.getmtime(pdf) >= started - 1
+            statuses[file] = 'converted' if converted else failed_status
+        return statuses
+
+    @staticmethod
+    def convert_files(files: List[str], output_folder: str, workers: int = 0, timeout: int = 60) -> Dict[str, str]:
+        """
+        Converts the files in one batch per LibreOffice instance,
+        the instances run in parallel when workers > 1
+
+        :param files: paths of the files to convert
+        :param output_folder: folder of the PDF files (created if missing)
+        :param workers: number of the LibreOffice instances (0 or 1 for a single instance)
+        :param timeout: seconds per file before an instance is stopped
+        :return: dictionary with the status ('converted', 'failed' or 'timeout') by file path
+        """
+        if not files:
+            return {}
+        soffice = PdfConverter.soffice_path()
+        os.makedirs(output_folder, exist_ok=True)
+        batches = PdfConverter.batches(files, workers)
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            results = executor.map(lambda batch: PdfConverter.convert_batch(batch, output_folder, soffice, timeout),
+                                   batches)
+            statuses = {file: status for result in results for file, status in result.items()}
+        # in the order of the given files
+        return {file: statuses[file] for file in files}
+
+    @staticmethod
+    def convert_folder(files_path: str, output_folder: str = None, workers: int = 0,
+                       timeout: int = 60) -> Dict[str, str]:
+        """
+        Converts all .docx files of the folder (the sub-folders are not included)
+
+        :param files_path: folder with the .docx files
+        :param output_folder: folder of the PDF files ('PDFs' sub-folder of files_path if missing)
+        :param workers: number of the LibreOffice instances (0 or 1 for a single instance)
+        :param timeout: seconds per file before an instance is stopped
+        :return: dictionary with the status ('converted', 'failed' or 'timeout') by file path
+        """
+        files = sorted(os.path.join(files_path, file) for file in os.listdir(files_path)
+                       if file.lower().endswith('.docx') and os.path.isfile(os.path.join(files_path, file)))
+        return PdfConverter.convert_files(files, output_folder or os.path.join(files_path, "PDFs"), workers, timeout)
@@ -0,0 +1,198 @@
+# coding: utf8
+import gzip
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List
+import pandas as pd
+from project.dimensions import Dimensions
+
+
+class CsvStream:
+    """Class used to write dataframes to .csv files by chunks of rows, optionally compressed with gzip or zstd.
+        The chunks are formatted by DataFrame.to_csv() itself (in a process pool when workers > 1) and
+        streamed to the file in their order, so the uncompressed file is byte-identical to the one of
+        DataFrame.to_csv(path, encoding='utf-8', index=False).
+        The datetime and timedelta columns are formatted once for the whole column before the split,
+        as their text format depends on all values of the column
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        compressions() -> Dict[str, str]:
+            :return: the supported compressions and their file extensions
+
+        chunk_size() -> int:
+            :return: the number of rows formatted at once
+
+        file_path(path: str, name: str, compression: str = None) -> str:
+            Makes the path of the .csv file (with the extension of the compression)
+
+        format_columns(df: pd.DataFrame) -> pd.DataFrame:
+            Formats the datetime and timedelta columns to text as DataFrame.to_csv() does
+
+        chunk_text(chunk: pd.DataFrame, header: bool) -> bytes:
+            Formats a chunk of rows as UTF-8 .csv text
+
+        chunk_texts(df: pd.DataFrame, workers: int = 0, chunk_size: int = None) -> Iterator[bytes]:
+            Formats the dataframe chunk by chunk (the header is in the first chunk)
+
+        open_stream(file_path: str, compression: str = None, level: int = None, workers: int = 0) -> BinaryIO:
+            Opens the (compressed) file for writing
+
+        df_to_csv(file_path: str, df: pd.DataFrame, compression: str = None, level: int = None, workers: int = 0,
+                  chunk_size: int = None) -> str:
+            Writes the dataframe to a .csv file chunk by chunk
+    """
+
+    @staticmethod
+    def compressions() -> Dict[str, str]:
+        """
+        :return: dictionary with the file extension by compression
+                (zstd needs the optional 'zstandard' package)
+        """
+        return {'gzip': '.gz', 'zstd': '.zst'}
+
+    @staticmethod
+    def chunk_size() -> int:
+        """
+        :return: the number of rows formatted at once
+        """
+        return 50_000
+
+    @staticmethod
+    def file_path(path: str, name: str, compression: str = None) -> str:
+        """
+        :param path: the folder with a trailing separator
+        :param name: the name of the file without extension
+        :param compression: None, 'gzip' or 'zstd'
+        :return: the path of the .csv, .csv.gz or .csv.zst file
+        :raises ValueError: if the compression is not supported
+        """
+        if compression and compression not in CsvStream.compressions():
+            raise ValueError(f"Unknown compression '{compression}', expected one of "
+                             f"{list(CsvStream.compressions())}")
+        return f"{path}{name}.csv{CsvStream.compressions()[compression] if compression else ''}"
+
+    @staticmethod
+    def format_columns(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        DataFrame.to_csv() chooses the text format of a datetime/timedelta column by all of its values
+        (e.g. the dates without time or the whole days), so a chunk alone may get another format.
+        The columns are formatted here once: only the unique values are formatted
+        (pandas formats the timedeltas one by one in Python) and the missing values become empty strings
+
+        :param df: the dataframe
+        :return: copy of the dataframe with text instead of datetime/timedelta columns
+                (the same dataframe if there are no such columns)
+        """
+        columns = {}
+        for position, dtype in enumerate(df.dtypes):
+            if pd.api.types.is_datetime64_any_dtype(dtype) or pd.api.types.is_timedelta64_dtype(dtype):
+                columns[position] = Dimensions.map_distinct(
+                    df.iloc[:, position], lambda uniques: pd.Series(uniques, dtype=dtype).astype(str), missing='')
+        if not columns:
+            return df
+        df = df.copy(deep=False)
+        for position, texts in columns.items():
+            df.isetitem(position, texts)
+        return df
+
+    @staticmethod
+    def chunk_text(chunk: pd.DataFrame, header: bool) -> bytes:
+        """
+        :param chunk: rows of the dataframe (after format_columns())
+        :param header: include the header row
+        :return: the UTF-8 .csv text of the rows
+        """
+        return chunk.to_csv(index=False, header=header).encode('utf-8')
+
+    @staticmethod
+    def chunk_texts(df: pd.DataFrame, workers: int = 0, chunk_size: int = None) -> Iterator[bytes]:
+        """
+        Formats the dataframe chunk by chunk, in a process pool when workers > 1.
+        Only a few chunks per process are queued at once, so the memory stays bounded
+
+        :param df: the dataframe (after format_columns())
+        :param workers: number of the processes (0 or 1 for no pool)
+        :param chunk_size: number of the rows per chunk (default: chunk_size())
+        :return: iterator of the .csv texts of the chunks in the order of the rows (the header is in the first one)
+        """
+        chunk_size = chunk_size or CsvStream.chunk_size()
+        starts = range(0, len(df), chunk_size) if len(df) else range(1)
+        if workers <= 1 or len(starts) == 1:
+            for start in starts:
+                yield CsvStream.chunk_text(df.iloc[start:start + chunk_size], start == 0)
+            return
+
+        # spawned workers, as the exports may run in the threads of ReportScheduler (see Export.run_work_items())
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            pending: List = []
+            for start in starts:
+                pending.append(executor.submit(CsvStream.chunk_text, df.iloc[start:start + chunk_size], start == 0))
+                if len(pending) >= 2 * workers:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+
+    @staticmethod
+    @contextmanager
+    def open_stream(file_path: str, compression: str = None, level: int = None, workers: int = 0) -> BinaryIO:
+        """
+        Opens the file for writing: plain, gzip (without timestamp, so the same data gives the same file)
+        or zstd (multithreaded when workers > 1)
+
+        :param file_path: path of the file
+        :param compression: None, 'gzip' or 'zstd'
+        :param level: the compression level (default: 6 for gzip, 3 for zstd)
+        :param workers: number of the zstd compression threads (0 or 1 for the calling thread)
+        :return: context manager with the binary stream
+        :raises ValueError: if the compression is not supported
+        :raises ImportError: if zstd is chosen and the 'zstandard' package is not installed
+        """
+        if compression and compression not in CsvStream.compressions():
+            raise ValueError(f"Unknown compression '{compression}', expected one of "
+                             f"{list(CsvStream.compressions())}")
+        compressor = None
+        if compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("The zstd compression needs the 'zstandard' package (pip install zstandard)")
+            compressor = zstandard.ZstdCompressor(level=3 if level is None else level,
+                                                  threads=workers if workers > 1 else 0)
+        with open(file_path, 'wb') as file:
+            if not compression:
+                yield file
+            elif compression == 'gzip':
+                csv_name = os.path.splitext(os.path.basename(file_path))[0]
+                with gzip.GzipFile(csv_name, 'wb', 6 if level is None else level, file, mtime=0) as stream:
+                    yield stream
+            else:
+                with compressor.stream_writer(file, closefd=False) as stream:
+                    yield stream
+
+    @staticmethod
+    def df_to_csv(file_path: str, df: pd.DataFrame, compression: str = None, level: int = None, workers: int = 0,
+                  chunk_size: int = None) -> str:
+        """
+        Writes the dataframe to a .csv file chunk by chunk, only a few formatted chunks are kept in memory.
+        Without compression the file is byte-identical to DataFrame.to_csv(file_path, encoding='utf-8', index=False)
+
+        :param file_path: path of the file (see file_path())
+        :param df: the dataframe
+        :param compression: None, 'gzip' or 'zstd'
+        :param level: the compression level (default: 6 for gzip, 3 for zstd)
+        :param workers: number of the processes formatting the chunks and of the zstd threads (0 or 1 for none)
+        :param chunk_size: number of the rows per chunk (default: chunk_size())
+        :return: the path of the file
+        """
+        df = CsvStream.format_columns(df)
+        with CsvStream.open_stream(file_path, compression, level, workers) as stream:
+            for text in CsvStream.chunk_texts(df, workers, chunk_size):
+                stream.write(text)
+        return file_path
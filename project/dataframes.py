@@ -1,8 +1,14 @@
 # coding: utf8
-from typing import List
+import re
+import time
+from functools import lru_cache
+from typing import List, Tuple
+import numpy as np
 import pandas as pd
 import logging
 from project._collections import Collection
+from project.dimensions import Dimensions
+from project.instrumentation import Instrumentation
 
 
 class BaseDataframe:
@@ -17,16 +23,45 @@ class BaseDataframe:
         rename_original_report_columns(df: pd.DataFrame) -> pd.DataFrame:
             Renames the columns from the imported general report
 
-        trim_all_columns(df: pd.DataFrame) -> pd.DataFrame:
-            Trim leading and lagging white spaces(if any)
+        clean_string_columns(df: pd.DataFrame) -> pd.DataFrame:
+            Get rid of single quotes, apostrophes and double spaces
+            and trim leading and lagging white spaces(if any) only in the string columns
 
-        unwanted_chars(df: pd.DataFrame) -> pd.DataFrame:
-            Get rid of single quotes and apostrophes
+        transliterate_value(value: str) -> str:
+            Transliterate a single (distinct) name value using the compiled
+            translation table from the _collections
 
-        def transliterate_bg_to_en(df: pd.DataFrame, column: str, new_column: str) -> pd.Series:
+        transliterate_bg_to_en(df: pd.DataFrame, column: str, new_column: str) -> pd.Series:
             Uses a dictionary with the transliteration pairs {BG:EN} to
             transliterate pd.Series / columns
 
+        flag_bit(flag_number: int) -> int:
+            :return: the bit of the flag (Collection.flags_dict()) in the integer 'flags' bitmask
+
+        add_flag(df: pd.DataFrame, rows: pd.Series, flag_number: int) -> pd.DataFrame:
+            Sets the flag bit in the 'flags' bitmask for the given rows
+
+        has_flag(flags: pd.Series, flag_number: int) -> pd.Series:
+            Bitwise test of the 'flags' bitmask for one flag
+
+        flag_counts(flags: pd.Series) -> pd.Series:
+            Number of rows with every flag from Collection.flags_dict()
+
+        flags_to_string(flags: pd.Series) -> pd.Series:
+            Renders the 'flags' bitmask as the readable comma-joined flag numbers (e.g. '2,5,9,')
+
+        email_letters(emails: pd.Series) -> pd.Series:
+            The 3 nickname letters of every email (computed once per distinct email)
+
+        email_sources(df: pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
+            The rows whose nickname letters come from the work email and from the pvt email
+
+        employee_identities(df: pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
+            The lowercase names and source email which identify the employee behind a nickname
+
+        nickname_persons(df: pd.DataFrame) -> pd.DataFrame:
+            Numbers the different employees sharing a nickname in the same company
+
         nickname(df: pd.DataFrame) -> pd.DataFrame:
             Validating and transforming the 'name' and 'email' related columns
             and creating an additional one for the purpose of
@@ -37,6 +72,9 @@ class BaseDataframe:
             Checks if the meeting was held online or in-person and mark in a separate column
             Iterate through the 'type' column and extracts only the company name
 
+        unique_nicknames(df: pd.DataFrame) -> pd.DataFrame:
+            Flags, logs and makes unique the nicknames shared by different employees of the same company
+
         training_per_emp(df: pd.DataFrame) -> pd.DataFrame:
             Add three additional columns for:
             1.concatenation of employee|company,
@@ -49,18 +87,37 @@ class BaseDataframe:
         trainer(df: pd.DataFrame) -> pd.DataFrame:
             Subtract only the non cyrillic names and put them in a separate column
 
+        assign_contracts(df: pd.DataFrame, limitations_df: pd.DataFrame) -> pd.DataFrame:
+            Adds the columns of the company contract in force at the training start
+            (sorted as-of join, a company can have more than one contract)
+
+        contract_client_key(df: pd.DataFrame) -> pd.Series:
+            The 'concat_count' value combined with the contract start,
+            used to count the trainings per employee and contract
+
         active_contracts(df: pd.DataFrame) -> pd.DataFrame:
             Count the trainings of the company employees based on the training
             date if there's an active contract (record is present in the limitations.csv)
 
-        datetime_normalize(df: pd.DataFrame) -> pd.DataFrame:
-            Handle the datetime formatting using the format from the _collections
+        update_history_columns(df: pd.DataFrame, emp_counts: pd.Series, client_counts: pd.Series,
+                               rows: pd.Series) -> pd.DataFrame:
+            Incremental version of the counting in training_per_emp() and active_contracts()
+            which refreshes only the given rows using precomputed counts
+
+        datetime_normalize(df: pd.Series) -> pd.Series:
+            Truncates the datetime column to whole seconds (kept as datetime64)
             for the 'training_datetime' and 'starts' columns
 
-        date_normalize(df: pd.DataFrame) -> pd.DataFrame:
-            Handle the date formatting using the format from the _collections
+        date_normalize(df: pd.Series) -> pd.Series:
+            Truncates the datetime column to the date, i.e. midnight (kept as datetime64)
             for the 'scheduled_date', 'training_end'  and 'ends' columns
 
+        format_datetimes(values: pd.Series, date_format: str) -> pd.Series:
+            The datetime column as text, formatted once per distinct value
+
+        format_dates(df: pd.DataFrame) -> pd.DataFrame:
+            Formats the datetime columns from the _collections as text for the export
+
         dates_diff(ser1: pd.Series, ser2: pd.Series) -> pd.Series:
             Adds column 'contract_duration' which is the days difference between
             the start and the end of the contract for a particular company (limitation.csv)
@@ -74,6 +131,7 @@ class BaseDataframe:
     """
 
     @staticmethod
+    @Instrumentation.measured
     def rename_original_report_columns(df: pd.DataFrame) -> pd.DataFrame:
         """
         Renames the columns from the imported general report
@@ -105,68 +163,216 @@ class BaseDataframe:
         return df_new_column_names
 
     @staticmethod
-    def trim_all_columns(df: pd.DataFrame) -> pd.DataFrame:
+    @Instrumentation.measured
+    def clean_string_columns(df: pd.DataFrame) -> pd.DataFrame:
         """
-        Trim leading and lagging white spaces(if any)
-        for all values in the given dataframe
+        Get rid of single quotes, apostrophes and double spaces
+        (which can mess the values from 'nickname' series/columns)
+        and trim leading and lagging white spaces(if any) in a single pass.
+        Only the string columns are touched and every distinct value is cleaned once,
+        the other values (None, NaN etc.) are kept as they are.
+        The time spent for every column is logged
 
         :param df: the dataframe from the imported .csv general report in a current stage
                 (after some additional transformations)
-        :return: same dataframe with no blanks in the beginning of the value or at the end
+        :return: same dataframe with cleaned (object) string columns
         """
+        unwanted_chars = re.compile(Collection.unwanted_chars_pattern())
+        columns_timing = {}
+        for column in df.select_dtypes(include=['object', 'string']).columns:
+            start = time.perf_counter()
+            values = df[column].to_numpy(dtype=object)
+            codes, uniques = pd.factorize(values)
+            cleaned_uniques = np.array([unwanted_chars.sub("", value).strip() if isinstance(value, str) else value
+                                        for value in uniques], dtype=object)
+            cleaned_values = values.copy()
+            present = codes != -1
+            cleaned_values[present] = cleaned_uniques[codes[present]]
+            df[column] = cleaned_values
+            columns_timing[column] = time.perf_counter() - start
+
+        logging.info("Cleaning of the string columns (seconds): " +
+                     ", ".join(f"{column}: {seconds:.4f}" for column, seconds in
+                               sorted(columns_timing.items(), key=lambda x: x[1], reverse=True)))
+        return df
 
-        def trim_strings(x): return x.strip() if isinstance(x, str) else x
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def transliterate_value(value: str) -> str:
+        """
+        Transliterate a single (distinct) name value using the compiled
+        translation table from the _collections.
+        Multi-character outputs ('Щ' -> 'Sht') are handled by str.translate
 
-        return df.applymap(trim_strings)
+        :param value: a name value (already trimmed)
+        :return: the transliterated value in uppercase
+        """
+        value = value.strip()
+        if value and not value.isascii():
+            value = value.translate(Collection.transliterate_table())
+        return value.upper()
 
     @staticmethod
-    def unwanted_chars(df: pd.DataFrame) -> pd.DataFrame:
+    @Instrumentation.measured
+    def transliterate_bg_to_en(df: pd.DataFrame, column: str, new_column: str) -> pd.Series:
         """
-        Get rid of single quotes and apostrophes
-        which can mess the values from 'nickname' series/columns
+        Uses a dictionary with the transliteration pairs {BG:EN} to
+        transliterate pd.Series / columns.
+        Only the distinct values of the column are transliterated
+        and the result is mapped back onto the whole column
+
+        :param df: the dataframe with the column for transliteration
+        :param column: the name of the column with the original (cyrillic) values
+        :param new_column: the name of the column with the transliterated values
+        :return: pd.Series with the transliterated values in uppercase
+        """
+        values = df[column]
+        transliterated_dict = {value: BaseDataframe.transliterate_value(value)
+                               for value in values.dropna().unique()}
+        return values.map(transliterated_dict).rename(new_column)
 
-        :param df: the dataframe from the imported .csv general report in a current stage
-                (after some additional transformations)
-        :return: same dataframe with no apostrophes or single quotes in values
+    @staticmethod
+    def flag_bit(flag_number: int) -> int:
+        """
+        :param flag_number: the flag number from Collection.flags_dict()
+        :return: the bit of the flag in the integer 'flags' bitmask
         """
+        return 1 << (flag_number - 1)
 
-        df = df.replace("'|  |`", "", regex=True)
+    @staticmethod
+    def add_flag(df: pd.DataFrame, rows: pd.Series, flag_number: int) -> pd.DataFrame:
+        """
+        Sets the flag bit in the 'flags' bitmask for the given rows (vectorized bitwise OR)
+
+        :param df: the dataframe with the integer 'flags' column
+        :param rows: boolean mask with the flagged rows
+        :param flag_number: the flag number from Collection.flags_dict()
+        :return: same dataframe with updated 'flags' column
+        """
+        df['flags'] = df['flags'].values | np.where(rows, BaseDataframe.flag_bit(flag_number), 0)
         return df
 
     @staticmethod
-    def transliterate_bg_to_en(df: pd.DataFrame, column: str, new_column: str) -> pd.Series:
+    def has_flag(flags: pd.Series, flag_number: int) -> pd.Series:
         """
-        Uses a dictionary with the transliteration pairs {BG:EN} to
-        transliterate pd.Series / columns
-
-        :param df:
-        :param column:
-        :param new_column:
-        :return:
-        """
-
-        bg_en_dict = Collection.transliterate_dict()
-
-        # transliteration char by char
-        transliterated_string = ""
-        for i in range(len(df[column])):
-            string_value = df.loc[i, column].strip()
-            if string_value and not string_value.isascii():
-                for char in string_value:
-                    if char in bg_en_dict.keys():
-                        string_value = string_value.replace(
-                            char, bg_en_dict[char])
-                        transliterated_string = string_value
-                    else:
-                        transliterated_string = string_value
-
-                df.loc[i, new_column] = transliterated_string.upper()
-                transliterated_string = ""
-            else:
-                df.loc[i, new_column] = df.loc[i, column].upper()
-        return df[new_column]
+        :param flags: the integer 'flags' bitmask column
+        :param flag_number: the flag number from Collection.flags_dict()
+        :return: boolean mask with the rows which have the flag
+        """
+        return (flags & BaseDataframe.flag_bit(flag_number)) != 0
+
+    @staticmethod
+    @Instrumentation.measured
+    def flag_counts(flags: pd.Series) -> pd.Series:
+        """
+        :param flags: the integer 'flags' bitmask column
+        :return: number of rows with every flag indexed by the flag numbers from Collection.flags_dict()
+        """
+        flag_numbers = Collection.flags_dict()['flag_number']
+        return pd.Series([int(BaseDataframe.has_flag(flags, number).sum()) for number in flag_numbers],
+                         index=flag_numbers)
+
+    @staticmethod
+    def flags_to_string(flags: pd.Series) -> pd.Series:
+        """
+        Renders the 'flags' bitmask as the readable comma-joined flag numbers (e.g. '2,5,9,').
+        Every distinct bitmask is rendered only once
+
+        :param flags: the integer 'flags' bitmask column
+        :return: series with the readable flags
+        """
+        flag_numbers = Collection.flags_dict()['flag_number']
+        readable_flags = {mask: ''.join(f"{number}," for number in flag_numbers
+                                        if mask & BaseDataframe.flag_bit(number))
+                          for mask in flags.unique()}
+        return flags.map(readable_flags)
+
+    @staticmethod
+    def email_letters(emails: pd.Series) -> pd.Series:
+        """
+        Only the latin letters of the email are kept and the 2nd to the 4th of them are taken (uppercase).
+        The regex runs once per distinct email
+
+        :param emails: the email column
+        :return: series with the 3 (or less) nickname letters of every email, empty string for the missing emails
+        """
+        letters = Dimensions.map_distinct(
+            emails, lambda uniques: pd.Series(uniques, dtype=object).str.replace("[^A-Za-z]+", "", regex=True)
+            .str[1:4].str.upper(), missing='')
+        return pd.Series(letters, index=emails.index)
+
+    @staticmethod
+    def email_sources(df: pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
+        """
+        The nickname letters come from the work email if it is valid (contains '@')
+        or from the pvt email if it is valid and the work email is empty
+
+        :param df: the dataframe with the 'work_email' and 'pvt_email' columns
+        :return: boolean masks with the rows using the work email and the rows using the pvt email
+        """
+        work_source = df['work_email'].str.contains('@', na=False)
+        pvt_source = df['pvt_email'].str.contains('@', na=False) & (df['work_email'].str.len() < 1)
+        return work_source, pvt_source
 
     @staticmethod
+    def employee_identities(df: pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
+        """
+        The employee behind a nickname is identified by the names and by the email the nickname letters
+        come from (case insensitive)
+
+        :param df: the dataframe with the 'employee_names', 'work_email' and 'pvt_email' columns
+        :return: series with the lowercase names and series with the lowercase source email (NaN if none)
+        """
+        work_source, pvt_source = BaseDataframe.email_sources(df)
+        emails = df['work_email'].str.lower().where(work_source, df['pvt_email'].str.lower().where(pvt_source))
+        return df['employee_names'].str.lower(), emails
+
+    @staticmethod
+    def nickname_persons(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Numbers the employees behind every nickname|company pair, i.e. behind the employee|company key
+        of the counts. The rows of a pair are the same employee when they share the names or the email
+        (also through other rows), so a changed work email or differently written names do not split
+        an employee. The employees are numbered by their first appearance.
+        The distinct nickname|company|names|email rows are found in one O(n) pass and only the pairs
+        with more than one distinct row are linked, with a union-find (Dimensions.components())
+
+        :param df: the dataframe with the 'nickname', 'company', 'employee_names', 'work_email' and 'pvt_email'
+                columns
+        :return: dataframe with the same index and the integer columns 'person' (the number of the employee
+                in the pair) and 'persons' (the number of the employees of the pair),
+                both 0 for the rows without a nickname or a company
+        """
+        names, emails = BaseDataframe.employee_identities(df)
+        candidates = (df['nickname'].notna() & df['company'].notna()).to_numpy()
+        keys = pd.DataFrame({'nickname': df['nickname'].to_numpy()[candidates],
+                             'company': df['company'].to_numpy()[candidates],
+                             'names': names.to_numpy()[candidates], 'email': emails.to_numpy()[candidates]})
+
+        # one row per distinct employee data of every pair, in the order of the first appearance
+        row_codes = keys.groupby(list(keys.columns), sort=False, dropna=False).ngroup().to_numpy()
+        index = keys.iloc[pd.Series(row_codes).drop_duplicates().index].reset_index(drop=True)
+        pair = index.groupby(['nickname', 'company'], sort=False).ngroup().to_numpy()
+
+        # the rows of a pair with the same names or email are linked, the missing names or emails link nothing;
+        # every row is labeled by the first row of its employee (a pair with one distinct row is one employee)
+        label = np.arange(len(index))
+        ambiguous = np.flatnonzero(np.bincount(pair)[pair] > 1)
+        if len(ambiguous):
+            links = [Dimensions.combine(pair[ambiguous], Dimensions.codes(index[column].iloc[ambiguous]))
+                     for column in ('names', 'email')]
+            label[ambiguous] = ambiguous[Dimensions.components(*links)]
+
+        labels = pd.Series(label).groupby(pair)
+        person = labels.rank(method='dense').to_numpy(dtype='int64')
+        persons = labels.transform('nunique').to_numpy(dtype='int64')
+        result = pd.DataFrame({'person': 0, 'persons': 0}, index=df.index)
+        result.loc[candidates, 'person'] = person[row_codes]
+        result.loc[candidates, 'persons'] = persons[row_codes]
+        return result
+
+    @staticmethod
+    @Instrumentation.measured
     def nickname(df: pd.DataFrame) -> pd.DataFrame:
         """
         Validating and transforming the 'name' and 'email' related columns
@@ -189,43 +395,30 @@ class BaseDataframe:
         # adding column with both Fname and Lname
         df['employee_names'] = df['first_name'] + " " + df['last_name']
 
-        # adding nickname column
-        df['nickname'] = df['first_name'].str[0:2].str.upper() + df['last_name'].str[1:4].str.upper()
-
-        # adding flag and 'X's at the end if the len < 5
-        df.loc[df.nickname.str.len() < 5, 'flags'] += '1,'
-        df.loc[df.nickname.str.len() < 5, 'nickname'] = df['nickname'].apply(lambda x: x + 'X' * (5 - len(x)))
-
-        # check for email columns and take last part of the nickname
-        # add flags for the cases
-        work_email_validation_filter = (df['work_email'].str.contains('@', na=False))
-        pvt_email_validation_filter = (df['pvt_email'].str.contains('@', na=False))
-
-        df.loc[~work_email_validation_filter, 'flags'] += "2,"
-        df.loc[~pvt_email_validation_filter, 'flags'] += "3,"
-
-        df.loc[~pvt_email_validation_filter & ~work_email_validation_filter, 'flags'] += "4,"
+        # 5 letters from the names, flag and lagging 'X's if less
+        names_part = df['first_name'].str[0:2].str.upper() + df['last_name'].str[1:4].str.upper()
+        df = BaseDataframe.add_flag(df, names_part.str.len() < 5, 1)
 
-        # takes value subtraction from the work or pvt email:
-        email_validation_filter = (df['work_email'].str.contains('@', na=False))
-        df.loc[email_validation_filter, 'nickname'] += \
-            df['work_email'].str.replace("[^A-Za-z]+", "", regex=True).str[1:4].str.upper()
+        # check for email columns and add flags for the cases
+        work_email_validation_filter = df['work_email'].str.contains('@', na=False)
+        pvt_email_validation_filter = df['pvt_email'].str.contains('@', na=False)
+        df = BaseDataframe.add_flag(df, ~work_email_validation_filter, 2)
+        df = BaseDataframe.add_flag(df, ~pvt_email_validation_filter, 3)
+        df = BaseDataframe.add_flag(df, ~pvt_email_validation_filter & ~work_email_validation_filter, 4)
 
-        df.loc[(df['work_email'].str.len() < 1) &
-               (~df['pvt_email'].str.len() < 1) &
-               (df['pvt_email'].str.contains('@')), 'nickname'] += \
-            df['pvt_email'].str.replace("[^A-Za-z]+", "", regex=True).str[1:4].str.upper()
-
-        df.loc[(df['work_email'].str.len() < 1) & (df['pvt_email'].str.len() < 1), 'nickname'] = \
-            df['nickname'].apply(lambda x: x + 'X' * (8 - len(x)))
-
-        df.loc[df['nickname'].str.len() < 8, 'nickname'] = df['nickname'].apply(lambda x: x + 'X' * (8 - len(x)))
+        # takes the last part from the work email or (if the work email is empty) from the pvt email
+        work_source = work_email_validation_filter
+        pvt_source = pvt_email_validation_filter & (df['work_email'].str.len() < 1)
+        email_part = np.where(work_source, BaseDataframe.email_letters(df['work_email']),
+                              np.where(pvt_source, BaseDataframe.email_letters(df['pvt_email']), ''))
+        df['nickname'] = (names_part.str.ljust(5, 'X') + email_part).str.ljust(8, 'X')
 
         # adding column with both first and last names
         df['employee_names'] = df['employee_names'].str.title()
         return df
 
     @staticmethod
+    @Instrumentation.measured
     def company_subtraction(df: pd.DataFrame) -> pd.DataFrame:
         """
         Checks if the meeting was held online or in-person and mark in a separate column
@@ -237,11 +430,41 @@ class BaseDataframe:
         """
         df.loc[df['type'].str.contains('person|живо', regex=True), 'short_type'] = "На живо"
         df.loc[df['type'].str.contains('nline|нлайн', regex=True), 'short_type'] = "Онлайн"
-        df.loc[~df['type'].str.contains('nline|нлайн|person|живо', regex=True), 'flags'] += "7,"
+        df = BaseDataframe.add_flag(df, ~df['type'].str.contains('nline|нлайн|person|живо', regex=True), 7)
         df.loc[~df['type'].str.len() < 1, 'company'] = df['type'].str.split("[:|/]").str[0].str.upper().str.strip()
         return df
 
     @staticmethod
+    @Instrumentation.measured
+    def unique_nicknames(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Different employees of the same company with the same nickname would be counted together
+        (the same employee|company key). Their rows are flagged and logged, the first employee keeps
+        the nickname and the next ones get its first characters and their number instead
+        ('EDURUKUR', 'EDURUKU2', 'EDURUKU3'...). The same nickname in different companies is not changed
+
+        :param df: the dataframe with the 'nickname' and 'company' columns (see nickname_persons())
+        :return: same dataframe with unique nicknames in every company (+ flag 10 if any)
+        """
+        persons = BaseDataframe.nickname_persons(df)
+        shared = persons['persons'] > 1
+        if not shared.any():
+            return df
+        renamed = persons['person'] > 1
+        numbers = persons.loc[renamed, 'person'].astype(str)
+        nicknames = df.loc[renamed, 'nickname']
+        unique_nicknames = [nickname[:8 - len(number)] + number for nickname, number in zip(nicknames, numbers)]
+        companies = df.loc[renamed, 'company']
+        changes = pd.unique(pd.Series([f"{company}: {nickname} -> {unique_nickname}" for company, nickname,
+                                       unique_nickname in zip(companies, nicknames, unique_nicknames)]))
+        logging.warning(f"{df.loc[shared, ['nickname', 'company']].drop_duplicates().shape[0]} nicknames are shared "
+                        f"by different employees of the same company, renamed: " + ", ".join(changes))
+        df = BaseDataframe.add_flag(df, shared, 10)
+        df.loc[renamed, 'nickname'] = unique_nicknames
+        return df
+
+    @staticmethod
+    @Instrumentation.measured
     def training_per_emp(df: pd.DataFrame) -> pd.DataFrame:
         """
         Add three additional columns for:
@@ -253,11 +476,14 @@ class BaseDataframe:
                 (after some additional transformations)
         :return: the dataframe with two additional columns: 'concat_emp_company', 'count' and 'returns_or_not'
         """
-        # concatenate nickname+company for later count and check if they are equal nicknames from different companies
-        df.loc[~df['nickname'].str.len() < 1, 'concat_emp_company'] = df['nickname'].str[:] + "|" + df['company'].str[:]
+        # concatenate nickname+company (once per employee|company key) for the reports
+        emp_company_id = df[Dimensions.pair_key()].to_numpy()
+        df['concat_emp_company'] = Dimensions.pair_labels(df, Dimensions.pair_key(), 'nickname', 'company')
 
-        # count the frequency of occurrence for every  value (employee)
-        df['total_per_emp'] = df.groupby('concat_emp_company')['concat_emp_company'].transform('count')
+        # count the frequency of occurrence for every employee|company key (NaN if the key is missing)
+        counts = np.bincount(emp_company_id[emp_company_id >= 0], minlength=emp_company_id.max(initial=-1) + 1)
+        df['total_per_emp'] = pd.Series(Dimensions.take(counts, emp_company_id, 0), index=df.index) \
+            .where(emp_company_id >= 0)
 
         # comment if the employee have one or more than one trainings
         df.loc[df['total_per_emp'].astype(int) == 1, 'returns_or_not'] = 'only one session'
@@ -265,6 +491,7 @@ class BaseDataframe:
         return df
 
     @staticmethod
+    @Instrumentation.measured
     def phone_validation(df: pd.DataFrame) -> pd.DataFrame:
         """
         Add different flags if non standard phone values are present in the series
@@ -273,12 +500,13 @@ class BaseDataframe:
                 (after some additional transformations)
         :return: the dataframe with added values in the flag column
         """
-        df.loc[df['phone'].str.len() < 1, 'flags'] += "5,"
-        df.loc[df['phone'].str.contains(r'[^\d\+]', regex=True, na=False), 'flags'] += "6,"
-        df.loc[df['phone'].str.len().between(1, 8), 'flags'] += "6,"
+        df = BaseDataframe.add_flag(df, df['phone'].str.len() < 1, 5)
+        df = BaseDataframe.add_flag(df, df['phone'].str.contains(r'[^\d\+]', regex=True, na=False) |
+                                    df['phone'].str.len().between(1, 8), 6)
         return df
 
     @staticmethod
+    @Instrumentation.measured
     def trainer(df: pd.DataFrame) -> pd.DataFrame:
         """
         Subtract only the non cyrillic names and put them in a separate column
@@ -291,6 +519,61 @@ class BaseDataframe:
         return df
 
     @staticmethod
+    @Instrumentation.measured
+    def assign_contracts(df: pd.DataFrame, limitations_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Adds the columns of the company contract in force at the training start.
+        The contracts are matched with a sorted as-of join by company (the last contract
+        which starts before the training), so a company can have a history of contracts.
+        The trainings before the first contract of a company get the first contract
+        and the companies without contracts get empty values (as a left merge on 'company')
+
+        :param df: the dataframe from the imported .csv general report in a current stage
+                (after some additional transformations)
+        :param limitations_df: the limitations dataframe (without overlapping contracts)
+        :return: new dataframe with the columns of the limitations dataframe added
+        """
+        contracts = limitations_df.reset_index(drop=True)
+
+        # integer company codes (-1 for the companies without contracts) make the join faster,
+        # the companies of the trainings are looked up once per company key
+        companies = pd.Index(contracts['company'].unique())
+        contract_starts = pd.DataFrame({'company': companies.get_indexer(contracts['company']),
+                                        'starts': contracts['starts'],
+                                        'contract': np.arange(len(contracts))}) \
+            .sort_values('starts', kind='stable')
+        company_codes = np.append(companies.get_indexer(Dimensions.labels(df, 'company_id', 'company')), -1)
+        sessions = pd.DataFrame({'company': company_codes[df['company_id'].to_numpy()],
+                                 'start_time': df['start_time'].values,
+                                 'row': np.arange(len(df))}) \
+            .sort_values('start_time', kind='stable')
+        sessions = sessions.loc[(sessions['company'] != -1) & sessions['start_time'].notna()]
+
+        # the last contract of the company which starts before the training
+        matched = pd.merge_asof(sessions, contract_starts,
+                                left_on='start_time', right_on='starts', by='company', direction='backward')
+        contract = np.full(len(df), -1)
+        contract[matched['row'].values] = matched['contract'].fillna(-1).astype(int).values
+
+        # the trainings before the first contract get the first contract of the company
+        first_contract = contract_starts.drop_duplicates('company').set_index('company')['contract']
+        before_first = matched.loc[matched['contract'].isna()]
+        contract[before_first['row'].values] = first_contract.loc[before_first['company']].values
+
+        contract_columns = contracts.drop(columns='company').reindex(contract).reset_index(drop=True)
+        return pd.concat([df.reset_index(drop=True), contract_columns], axis=1)
+
+    @staticmethod
+    def contract_client_key(df: pd.DataFrame) -> pd.Series:
+        """
+        :param df: the dataframe with 'concat_count' and 'starts' columns
+        :return: the 'concat_count' value combined with the contract start (NaN if there is no active contract),
+                used to count the trainings per employee and contract
+        """
+        return df['concat_count'] + "|" + df['starts'].astype(str)
+
+    @staticmethod
+    @Instrumentation.measured
     def active_contracts(df: pd.DataFrame) -> pd.DataFrame:
         """
         Count the trainings of the company employees based on the training
@@ -301,48 +584,115 @@ class BaseDataframe:
         :return: the dataframe with three additional columns:
                 'trainings_left', 'active_trainings_per_client', 'concat_count'
         """
+        active = (df['start_time'] >= df['starts']) & (df['start_time'] <= df['ends'])
+
         # CONCAT the lines for which the training date is between the contract's start and end date
-        df.loc[(df['start_time'] >= df['starts']) & (df['start_time'] <= df['ends']), 'concat_count'] = \
-            df['company'] + "|" + df['nickname']
+        df.loc[active, 'concat_count'] = \
+            Dimensions.pair_labels(df, Dimensions.pair_key(), 'company', 'nickname')[active.to_numpy()]
 
-        # count the company/employees total trainings for the company active period
-        df.loc[(df['start_time'] >= df['starts']) & (df['start_time'] <= df['ends']), 'active_trainings_per_client'] = \
-            df.groupby('concat_count')['concat_count'].transform('count')
+        # count the company/employees total trainings for the company active period (per contract)
+        client = Dimensions.combine(np.where(active, df[Dimensions.pair_key()].to_numpy(), -1),
+                                    Dimensions.codes(df['starts']))
+        counts = np.bincount(client[client >= 0], minlength=client.max(initial=-1) + 1)
+        df.loc[active, 'active_trainings_per_client'] = \
+            pd.Series(Dimensions.take(counts, client, 0), index=df.index).where(client >= 0)
 
         # calculate the number of trainings that can be used
-        df.loc[(df['start_time'] >= df['starts']) &
-               (df['start_time'] <= df['ends']) &
-               (df['c_per_emp'].between(1, 9998)), 'trainings_left'] = \
+        df.loc[active & (df['c_per_emp'].between(1, 9998)), 'trainings_left'] = \
             df['c_per_emp'] - df['active_trainings_per_client']
 
         # add flag for employees which have less than 1 training left
-        df.loc[(~df['trainings_left'].isna()) & (df['trainings_left'] < 2), 'flags'] += '9,'
+        df = BaseDataframe.add_flag(df, (~df['trainings_left'].isna()) & (df['trainings_left'] < 2), 9)
         return df
 
     @staticmethod
-    def datetime_normalize(df: pd.DataFrame) -> pd.DataFrame:
+    def update_history_columns(df: pd.DataFrame,
+                               emp_counts: pd.Series,
+                               client_counts: pd.Series,
+                               rows: pd.Series) -> pd.DataFrame:
         """
-        Handle the datetime formatting using the format from the _collections
-        for the 'training_datetime' and 'starts' columns
-
-        :param df: a dataframe
-        :return: same dataframe with normalized datetime column
+        Incremental version of the counting in training_per_emp() and active_contracts().
+        Instead of groupby passes over the whole history it refreshes
+        'total_per_emp', 'returns_or_not', 'active_trainings_per_client', 'trainings_left'
+        and the flag 9 only for the given rows using precomputed counts
+
+        :param df: the transformed dataframe (full history)
+        :param emp_counts: number of trainings by 'concat_emp_company' value
+        :param client_counts: number of trainings in the active contract period by contract_client_key() value
+        :param rows: boolean mask with the rows which must be refreshed
+        :return: same dataframe with updated columns for the given rows
         """
-        df = df.apply(lambda x: x.strftime(Collection.datetime_default_format()))
+        part = df.loc[rows]
+        total_per_emp = part['concat_emp_company'].map(emp_counts)
+        df.loc[rows, 'total_per_emp'] = total_per_emp
+        df.loc[rows, 'returns_or_not'] = np.where(total_per_emp == 1, 'only one session', 'more then one session')
+
+        active_trainings_per_client = BaseDataframe.contract_client_key(part).map(client_counts)
+        df.loc[rows, 'active_trainings_per_client'] = active_trainings_per_client
+        df.loc[rows, 'trainings_left'] = (part['c_per_emp'] - active_trainings_per_client) \
+            .where(part['concat_count'].notna() & part['c_per_emp'].between(1, 9998))
+
+        # the flag 9 is cleared and set again if needed
+        trainings_left = df.loc[rows, 'trainings_left']
+        df.loc[rows, 'flags'] = (part['flags'] & ~BaseDataframe.flag_bit(9)) | \
+            np.where((~trainings_left.isna()) & (trainings_left < 2), BaseDataframe.flag_bit(9), 0)
+        df['total_per_emp'] = df['total_per_emp'].astype(int)
         return df
 
     @staticmethod
-    def date_normalize(df: pd.DataFrame) -> pd.DataFrame:
+    @Instrumentation.measured
+    def datetime_normalize(df: pd.Series) -> pd.Series:
+        """
+        Truncates the datetime column to whole seconds, i.e. the precision of the datetime format
+        from the _collections, for the 'training_datetime' and 'starts' columns.
+        The column stays datetime64 and is formatted only at the export (see format_dates())
+
+        :param df: a datetime column
+        :return: same column truncated to seconds
         """
-        Handle the date formatting using the format from the _collections
-        for the 'scheduled_date', 'training_end'  and 'ends' columns
+        return pd.to_datetime(df).dt.floor('S')
+
+    @staticmethod
+    @Instrumentation.measured
+    def date_normalize(df: pd.Series) -> pd.Series:
+        """
+        Truncates the datetime column to the date (midnight), i.e. the precision of the date format
+        from the _collections, for the 'scheduled_date', 'training_end'  and 'ends' columns.
+        The column stays datetime64 and is formatted only at the export (see format_dates())
+
+        :param df: a datetime column
+        :return: same column truncated to the date
+        """
+        return pd.to_datetime(df).dt.normalize()
+
+    @staticmethod
+    def format_datetimes(values: pd.Series, date_format: str) -> pd.Series:
+        """
+        Formats the datetime column as text. The rows repeat the same trainings dates,
+        so every distinct value is formatted once and the texts are taken back by the codes
+
+        :param values: a datetime64 column
+        :param date_format: the strftime format
+        :return: object column with the texts (NaN for the missing values)
+        """
+        texts = Dimensions.map_distinct(values, lambda uniques: pd.DatetimeIndex(uniques).strftime(date_format))
+        return pd.Series(texts, index=values.index, name=values.name)
+
+    @staticmethod
+    def format_dates(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Formats the datetime64 columns from Collection.export_date_formats() as text,
+        only where the output needs it (the exported files and the .docx rows)
 
         :param df: a dataframe
-        :return: same dataframe with normalized date column
+        :return: copy of the dataframe with the formatted columns (same dataframe if there are none)
         """
-        df = pd.to_datetime(df).dt.date
-        df = df.apply(lambda x: x.strftime(Collection.date_default_format()))
-        return df
+        formats = {column: date_format for column, date_format in Collection.export_date_formats().items()
+                   if column in df.columns and pd.api.types.is_datetime64_any_dtype(df[column])}
+        if not formats:
+            return df
+        return df.assign(**{column: BaseDataframe.format_datetimes(df[column], date_format)
+                            for column, date_format in formats.items()})
 
     @staticmethod
     def dates_diff(ser1: pd.Series, ser2: pd.Series) -> pd.Series:
@@ -358,6 +708,7 @@ class BaseDataframe:
         return diff
 
     @staticmethod
+    @Instrumentation.measured
     def total_trainings_func(df_mont: pd.DataFrame, df_full: pd.DataFrame) -> List[pd.DataFrame]:
         """
         Transform the training sessions on a total level by company and by trainer
@@ -371,11 +722,13 @@ class BaseDataframe:
         # get and transform the trainings data on a total level
         # using only the columns from the Collection class
         trainings_column_list_init = Collection.trainings_columns()[0]
-        df = df_mont[trainings_column_list_init]
+        df = df_mont[trainings_column_list_init + [Dimensions.pair_key()]]
 
         # add column for the number of trainings left based on the company contract and used trainings by the employee
-        df = pd.merge(df, df_full[['concat_emp_company', 'training_datetime', 'trainings_left']],
-                      on=['concat_emp_company', 'training_datetime'], how='inner')
+        # (matched by the integer employee|company key instead of the 'concat_emp_company' text)
+        df = pd.merge(df, df_full[[Dimensions.pair_key(), 'training_datetime', 'trainings_left']],
+                      on=[Dimensions.pair_key(), 'training_datetime'], how='inner') \
+            .drop(columns=Dimensions.pair_key())
         # insert two additional columns with default values
         df.insert(10, "language", 'Български', allow_duplicates=False)
         df.insert(10, "status", 'Проведен', allow_duplicates=False)
@@ -390,6 +743,7 @@ class BaseDataframe:
         return [total_trainings_df, report_trainers_df]
 
     @staticmethod
+    @Instrumentation.measured
     def limitations_func(limitations_df: pd.DataFrame) -> pd.DataFrame:
         """
         Adds three additional columns in the limitations dataframe
@@ -402,8 +756,7 @@ class BaseDataframe:
         # calculate contract days
         limitations_df['contract_duration'] = BaseDataframe.dates_diff(limitations_df['starts'],
                                                                        limitations_df['ends'])
-        # normalize date and datetime
+        # normalize date and datetime (both stay datetime64, 'ends' is formatted at the export)
         limitations_df['ends'] = BaseDataframe.date_normalize(limitations_df['ends'])
         limitations_df['starts'] = BaseDataframe.datetime_normalize(limitations_df['starts'])
-        limitations_df['starts'] = pd.to_datetime(limitations_df['starts'], format=Collection.datetime_default_format())
         return limitations_df
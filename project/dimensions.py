@@ -0,0 +1,192 @@
+# coding: utf8
+from typing import Callable, Dict, List
+import numpy as np
+import pandas as pd
+
+
+class Dimensions:
+    """Class used to give integer surrogate keys to the employees, the companies and the trainers.
+        The transformed rows are the facts with the integer keys and the distinct labels are the dimensions
+        (a small star schema), so the counts, the groupbys and the merges of the pipeline use compact integers
+        instead of the concatenated strings, which are built once per distinct key.
+        The keys follow the order of the first appearance in the rows, so they are internal:
+        they are not stable between runs and are dropped from the exported dataframes
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        key_columns() -> Dict[str, str]:
+            :return: the label columns and the names of their key columns
+
+        pair_key() -> str:
+            :return: the name of the key column of the employee|company pairs
+
+        internal_columns() -> List[str]:
+            :return: all key columns (dropped at the export)
+
+        codes(values: pd.Series) -> np.ndarray:
+            Integer code of every value (-1 for the missing values)
+
+        combine(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+            Integer code of every pair of codes (-1 if a code is missing)
+
+        add_keys(df: pd.DataFrame, labels: List[str] = None) -> pd.DataFrame:
+            Adds the key columns of the label columns (and the employee|company pair key)
+
+        labels(df: pd.DataFrame, key: str, column: str) -> np.ndarray:
+            The label of every key value (the dimension table of the key)
+
+        take(labels: np.ndarray, keys: np.ndarray, missing=np.nan) -> np.ndarray:
+            Joins the labels back to the keys
+
+        map_distinct(values: pd.Series, function: Callable, missing=np.nan) -> np.ndarray:
+            Applies the function once per distinct value and joins the results back to the rows
+
+        components(*codes: np.ndarray) -> np.ndarray:
+            Groups the rows linked by a shared code (union-find)
+
+        pair_labels(df: pd.DataFrame, key: str, left: str, right: str) -> np.ndarray:
+            The 'left|right' text of every row, built once per distinct key
+    """
+
+    @staticmethod
+    def key_columns() -> Dict[str, str]:
+        """
+        :return: dictionary with the key column name by label column
+        """
+        return {'nickname': 'employee_id', 'company': 'company_id', 'trainer': 'trainer_id'}
+
+    @staticmethod
+    def pair_key() -> str:
+        """
+        :return: the name of the key column of the employee|company pairs
+        """
+        return 'emp_company_id'
+
+    @staticmethod
+    def internal_columns() -> List[str]:
+        """
+        :return: the names of all key columns
+        """
+        return list(Dimensions.key_columns().values()) + [Dimensions.pair_key()]
+
+    @staticmethod
+    def codes(values: pd.Series) -> np.ndarray:
+        """
+        :param values: a column
+        :return: integer code of every value in the order of the first appearance (-1 for the missing values)
+        """
+        return pd.factorize(values)[0].astype('int64')
+
+    @staticmethod
+    def combine(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        """
+        :param left: integer codes (-1 for missing)
+        :param right: integer codes of the same rows (-1 for missing)
+        :return: dense integer code of every pair in the order of the first appearance
+                (-1 if one of the codes is missing)
+        """
+        present = (left >= 0) & (right >= 0)
+        pairs = left[present] * (int(right.max(initial=0)) + 1) + right[present]
+        combined = np.full(len(left), -1, dtype='int64')
+        combined[present] = pd.factorize(pairs)[0]
+        return combined
+
+    @staticmethod
+    def add_keys(df: pd.DataFrame, labels: List[str] = None) -> pd.DataFrame:
+        """
+        Adds the integer key column of every label column and, when both the employee and the company keys
+        are present, the key of the employee|company pairs
+
+        :param df: the transformed dataframe
+        :param labels: the label columns from key_columns() (all if missing)
+        :return: same dataframe with the key columns
+        """
+        for column in labels or Dimensions.key_columns():
+            df[Dimensions.key_columns()[column]] = Dimensions.codes(df[column])
+        if {'employee_id', 'company_id'}.issubset(df.columns):
+            df[Dimensions.pair_key()] = Dimensions.combine(df['employee_id'].to_numpy(), df['company_id'].to_numpy())
+        return df
+
+    @staticmethod
+    def labels(df: pd.DataFrame, key: str, column: str) -> np.ndarray:
+        """
+        :param df: the dataframe with the key column
+        :param key: the key column (dense codes from 0, -1 for missing)
+        :param column: the label column
+        :return: object array with the label of every key value, from the first row of the key
+        """
+        keys = df[key].to_numpy()
+        first_rows = pd.Series(keys).loc[keys >= 0].drop_duplicates()
+        labels = np.empty(int(keys.max(initial=-1)) + 1, dtype=object)
+        labels[first_rows.to_numpy()] = df[column].to_numpy(dtype=object)[first_rows.index]
+        return labels
+
+    @staticmethod
+    def take(labels: np.ndarray, keys: np.ndarray, missing=np.nan) -> np.ndarray:
+        """
+        :param labels: the label of every key value (see labels()) or any value per code
+        :param keys: integer keys (-1 for missing)
+        :param missing: the value of the missing keys
+        :return: array with the label of every key
+        """
+        # the missing keys are -1, i.e. the appended missing value
+        return np.append(labels, missing)[keys]
+
+    @staticmethod
+    def map_distinct(values: pd.Series, function: Callable, missing=np.nan) -> np.ndarray:
+        """
+        The columns repeat few distinct values (emails, dates), so the function runs once per distinct value
+        and the results are taken back by the codes of the rows
+
+        :param values: a column
+        :param function: takes the distinct values (as returned by pd.factorize()) and returns one result per value
+        :param missing: the result of the missing values
+        :return: object array with the result of every row
+        """
+        codes, uniques = pd.factorize(values)
+        return Dimensions.take(np.asarray(function(uniques), dtype=object), codes, missing)
+
+    @staticmethod
+    def components(*codes: np.ndarray) -> np.ndarray:
+        """
+        The rows with the same code (>= 0) in any of the code arrays are linked, also through other rows.
+        Union-find: every code links its rows to its first row, so there are less than
+        rows * len(codes) unions, each one nearly O(1) (path halving, the root is always the smallest row)
+
+        :param codes: integer code arrays of the same rows (-1 links nothing)
+        :return: the first row of the linked group of every row
+        """
+        parent = list(range(len(codes[0])))
+
+        def find(row: int) -> int:
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        for code in codes:
+            rows = np.flatnonzero(code >= 0)
+            first = pd.Series(rows).groupby(code[rows], sort=False).transform('first').to_numpy()
+            linked = first != rows
+            for left, right in zip(first[linked].tolist(), rows[linked].tolist()):
+                left, right = find(left), find(right)
+                if left != right:
+                    parent[max(left, right)] = min(left, right)
+        return np.array([find(row) for row in range(len(parent))], dtype='int64')
+
+    @staticmethod
+    def pair_labels(df: pd.DataFrame, key: str, left: str, right: str) -> np.ndarray:
+        """
+        :param df: the dataframe with the key column
+        :param key: the key column of the pairs (e.g. the employee|company key)
+        :param left: the first label column
+        :param right: the second label column
+        :return: object array with the 'left|right' text of every row (NaN for the missing keys),
+                concatenated once per distinct key
+        """
+        texts = Dimensions.labels(df, key, left) + "|" + Dimensions.labels(df, key, right)
+        return Dimensions.take(texts, df[key].to_numpy())
@@ -0,0 +1,213 @@
+# coding: utf8
+import datetime
+from itertools import repeat
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from xlsxwriter.worksheet import Worksheet
+
+
+class ExcelStream:
+    """Class used to write dataframes to .xlsx files row by row with the xlsxwriter constant_memory mode.
+        Every row is flushed to the disk when the next one is started, so the memory stays flat
+        no matter how large the dataframes are. The cells are the same as the ones of DataFrame.to_excel()
+        (values, date/time formats and header style)
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        max_rows() -> int:
+            :return: the number of rows of an Excel sheet
+
+        chunk_size() -> int:
+            :return: the number of rows converted to Python values at once
+
+        sheet_names(sheet_name: str, row_count: int) -> List[str]:
+            Makes one sheet name per shard of a dataframe which is over the row limit
+
+        cell_value(value) -> Tuple[object, str]:
+            Converts a single value as DataFrame.to_excel() does
+
+        column_cells(series: pd.Series) -> Tuple[list, object]:
+            Converts a column (or a chunk of it) to the values and the number formats of the cells
+
+        write_dataframe(workbook: xlsxwriter.Workbook, sheet_name: str, df: pd.DataFrame,
+                        index: bool = False) -> List[str]:
+            Writes the dataframe as one or more sheets (split by the row limit)
+
+        dfs_to_excel(file_path: str, sheets: Dict[str, pd.DataFrame], index_sheets: List[str] = None) -> None:
+            Writes all dataframes in one .xlsx file with the constant_memory mode
+    """
+
+    DATETIME_FORMAT = "YYYY-MM-DD HH:MM:SS"
+    DATE_FORMAT = "YYYY-MM-DD"
+    TIMEDELTA_FORMAT = "0"
+
+    @staticmethod
+    def max_rows() -> int:
+        """
+        :return: the number of rows of an Excel sheet (the header row included)
+        """
+        return 1_048_576
+
+    @staticmethod
+    def chunk_size() -> int:
+        """
+        :return: the number of rows converted to Python values at once
+        """
+        return 50_000
+
+    @staticmethod
+    def sheet_names(sheet_name: str, row_count: int) -> List[str]:
+        """
+        The first shard keeps the sheet name, the next ones get a '_2', '_3' ... suffix
+        (the names are cut to the 31 characters allowed by Excel)
+
+        :param sheet_name: the name of the sheet
+        :param row_count: number of the rows of the dataframe (without the header)
+        :return: list with one sheet name per shard of max_rows() - 1 data rows
+        """
+        shards = max(1, -(-row_count // (ExcelStream.max_rows() - 1)))
+        names = [sheet_name[:31]]
+        for shard in range(2, shards + 1):
+            suffix = f"_{shard}"
+            names.append(f"{sheet_name[:31 - len(suffix)]}{suffix}")
+        return names
+
+    @staticmethod
+    def cell_value(value) -> Tuple[object, str]:
+        """
+        Converts a single value as DataFrame.to_excel() does
+        (the object columns may have mixed types)
+
+        :param value: any scalar
+        :return: the value of the cell (None for an empty cell) and its number format (None for the default)
+        """
+        if pd.api.types.is_scalar(value) and pd.isna(value):
+            return None, None
+        if pd.api.types.is_integer(value):
+            return int(value), None
+        if pd.api.types.is_float(value):
+            return (float(value), None) if np.isfinite(value) else (f"{'-' if value < 0 else ''}inf", None)
+        if pd.api.types.is_bool(value):
+            return bool(value), None
+        if isinstance(value, datetime.datetime):
+            return value, ExcelStream.DATETIME_FORMAT
+        if isinstance(value, datetime.date):
+            return value, ExcelStream.DATE_FORMAT
+        if isinstance(value, datetime.timedelta):
+            return value.total_seconds() / 86400, ExcelStream.TIMEDELTA_FORMAT
+        return str(value), None
+
+    @staticmethod
+    def column_cells(series: pd.Series) -> Tuple[list, object]:
+        """
+        Converts a column (or a chunk of it) to the values of the cells.
+        The numeric, datetime and timedelta columns are converted at once,
+        only the object (and categorical) columns go value by value
+
+        :param series: the column
+        :return: list with the values (None for an empty cell) and the number format of the column
+                (None for the default one or a list with a number format per value)
+        """
+        dtype = series.dtype
+        missing = series.isna().to_numpy()
+        number_format = None
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+            values = series.tolist()
+        elif pd.api.types.is_float_dtype(dtype):
+            values = series.tolist()
+            infinite = np.isinf(series.to_numpy(dtype=float, na_value=np.nan))
+            for position in np.flatnonzero(infinite):
+                values[position] = ExcelStream.cell_value(values[position])[0]
+        elif pd.api.types.is_datetime64_dtype(dtype):
+            values = list(series.dt.to_pydatetime())
+            number_format = ExcelStream.DATETIME_FORMAT
+        elif pd.api.types.is_timedelta64_dtype(dtype):
+            values = (series.dt.total_seconds() / 86400).tolist()
+            number_format = ExcelStream.TIMEDELTA_FORMAT
+        else:
+            cells = [ExcelStream.cell_value(value) for value in series.astype(object)]
+            values = [value for value, _ in cells]
+            number_format = [cell_format for _, cell_format in cells]
+            if not any(number_format):
+                number_format = None
+        if missing.any():
+            for position in np.flatnonzero(missing):
+                values[position] = None
+        return values, number_format
+
+    @staticmethod
+    def write_dataframe(workbook: xlsxwriter.Workbook, sheet_name: str, df: pd.DataFrame,
+                        index: bool = False) -> List[str]:
+        """
+        Writes the dataframe as one or more sheets, every sheet has the header
+        and up to max_rows() - 1 rows of the dataframe.
+        The rows are converted by chunks, so only one chunk is kept as Python values
+
+        :param workbook: a workbook with the constant_memory option
+        :param sheet_name: the name of the (first) sheet
+        :param df: the dataframe
+        :param index: write the index as the first column (as DataFrame.to_excel(index=True))
+        :return: list with the names of the written sheets
+        """
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        number_formats: Dict[str, object] = {None: None}
+
+        def cell_format(number_format):
+            if number_format not in number_formats:
+                number_formats[number_format] = workbook.add_format({'num_format': number_format})
+            return number_formats[number_format]
+
+        def write_header(worksheet: Worksheet) -> None:
+            headers = ([df.index.name] if index else []) + [str(column) for column in df.columns]
+            for column, header in enumerate(headers):
+                if header is not None:
+                    worksheet.write(0, column, header, header_format)
+
+        sheet_names = ExcelStream.sheet_names(sheet_name, len(df))
+        rows_per_sheet = ExcelStream.max_rows() - 1
+        for shard, name in enumerate(sheet_names):
+            worksheet = workbook.add_worksheet(name)
+            write_header(worksheet)
+            shard_df = df.iloc[shard * rows_per_sheet:(shard + 1) * rows_per_sheet]
+            for start in range(0, len(shard_df), ExcelStream.chunk_size()):
+                chunk = shard_df.iloc[start:start + ExcelStream.chunk_size()]
+                columns = [ExcelStream.column_cells(chunk.iloc[:, position]) for position in range(chunk.shape[1])]
+                values = [column_values for column_values, _ in columns]
+                formats = [[cell_format(number_format) for number_format in column_format]
+                           if isinstance(column_format, list) else repeat(cell_format(column_format))
+                           for _, column_format in columns]
+                if index:
+                    # the index labels are styled as the header (as DataFrame.to_excel() does)
+                    values.insert(0, [ExcelStream.cell_value(label)[0] for label in chunk.index])
+                    formats.insert(0, repeat(header_format))
+                for row, (row_values, row_formats) in enumerate(zip(zip(*values), zip(*formats)),
+                                                                start=start + 1):
+                    for column, (value, value_format) in enumerate(zip(row_values, row_formats)):
+                        if value is not None:
+                            worksheet.write(row, column, value, value_format)
+        return sheet_names
+
+    @staticmethod
+    def dfs_to_excel(file_path: str, sheets: Dict[str, pd.DataFrame], index_sheets: List[str] = None) -> None:
+        """
+        Writes all dataframes in one .xlsx file with the xlsxwriter constant_memory mode
+        (the dataframes over the row limit are split in more sheets)
+
+        :param file_path: path of the .xlsx file
+        :param sheets: dictionary with the dataframes by sheet name
+        :param index_sheets: the sheet names which are written with the index
+        :return: None
+        """
+        index_sheets = index_sheets or []
+        workbook = xlsxwriter.Workbook(file_path, {'constant_memory': True})
+        try:
+            for sheet_name, df in sheets.items():
+                ExcelStream.write_dataframe(workbook, sheet_name, df, sheet_name in index_sheets)
+        finally:
+            workbook.close()
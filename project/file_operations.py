@@ -1,18 +1,23 @@
 # coding: utf8
 import logging
 from datetime import datetime
-import zipfile
 import os
-from typing import List, Dict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Dict, Tuple
 import numpy as np
 import pandas as pd
 from project.invoices import BaseInvoice
-import tkinter
-from tkinter import filedialog
-from tkinter.filedialog import asksaveasfile
 from project._collections import Collection
+from project.dataframes import BaseDataframe
 from project.templates import ReportFromTemplate
-import subprocess
+from project.conversion import PdfConverter
+from project.excel import ExcelStream
+from project.archive import ArchiveBuilder
+from project.stats import StatsCube
+from project.dimensions import Dimensions
+from project.csv_stream import CsvStream
+from project.instrumentation import Instrumentation
 
 
 class Import:
@@ -28,11 +33,20 @@ class Import:
             Used as a function for the email series/column to lowercase tha values during the import.
             * 'Email' and 'Служебен имейл | Work email  '
 
-        import_report() -> pd.DataFrame:
+        ask_for_csv_path(title: str) -> str:
+            Uses the file explorer browser to select a .csv file
+
+        column_inconsistencies(file_path: str, expected_columns: List[str]) -> List[Tuple[str, str]]:
+            Reads only the header row of the .csv file and compares its columns with the expected ones
+
+        overlapping_contracts(limitations_df: pd.DataFrame) -> List[Tuple[str, str, str]]:
+            Finds the contracts which start before the end of the previous contract of the same company
+
+        import_report(file_path: str = None) -> pd.DataFrame:
             Import the general/initial report from the platform for reservations/booking
             and create a dataframe with the full data for further transformations and validation
 
-        import_limitations() -> pd.DataFrame:
+        import_limitations(file_path: str = None) -> pd.DataFrame:
             Import the limitation report that contains company contracts data, payment rate per hour etc.
             and create a dataframe
 
@@ -50,31 +64,76 @@ class Import:
         return x.lower() if isinstance(x, str) else x
 
     @staticmethod
-    def import_report() -> pd.DataFrame:
+    def ask_for_csv_path(title: str) -> str:
+        """
+        Uses the file explorer browser to select a .csv file.
+        tkinter is imported only here, so the headless runs don't need a display
+
+        :param title: the title of the file explorer window
+        :return: the selected path or an empty string
+        """
+        import tkinter
+        from tkinter import filedialog
+
+        tkinter.Tk().withdraw()  # prevents an empty tkinter window from appearing
+        return filedialog.askopenfilename(title=title,
+                                          filetypes=[("CSV (comma-separated values) file", ".csv")],
+                                          defaultextension=".csv",
+                                          )
+
+    @staticmethod
+    def column_inconsistencies(file_path: str, expected_columns: List[str]) -> List[Tuple[str, str]]:
+        """
+        Reads only the header row of the .csv file (no data rows are parsed)
+        and compares its columns with the expected ones
+
+        :param file_path: path to the .csv file
+        :param expected_columns: the expected names and order of the columns from _collections
+        :return: list with the (expected, found) pairs which are not matching
+        """
+        columns_in_selected_file = pd.read_csv(file_path, nrows=0).columns
+        return [x for x in zip(expected_columns, columns_in_selected_file) if x[0] != x[1]]
+
+    @staticmethod
+    def overlapping_contracts(limitations_df: pd.DataFrame) -> List[Tuple[str, str, str]]:
+        """
+        Finds the contracts which start before the end of the previous contract of the same company
+        (every training must be matched to only one contract in force)
+
+        :param limitations_df: the imported limitations with parsed 'starts' and 'ends' dates
+        :return: list with the (company, starts, ends) of the overlapping contracts
+        """
+        contracts = limitations_df.sort_values(['company', 'starts'], kind='stable')
+        previous_ends = contracts.groupby('company')['ends'].shift()
+        overlapping = contracts.loc[contracts['starts'] <= previous_ends]
+        return [(company, f"{starts:%d.%m.%Y}", f"{ends:%d.%m.%Y}")
+                for company, starts, ends in zip(overlapping['company'], overlapping['starts'], overlapping['ends'])]
+
+    @staticmethod
+    def import_report(file_path: str = None) -> pd.DataFrame:
         """
         Import the general/initial report from the platform for reservations/booking
         and create a dataframe with the full data for further transformations and validation
 
+        :param file_path: path to the .csv report, if missing the user selects it via the file explorer browser
         :return: dataframe 'report_df'
+        :raises ValueError: if the file_path is given and the columns are not matching the expected ones
         """
 
         # uses file explorer browser to find and select the
         # general/initial report and validate the chose
         report_df = None
+        interactive = not file_path
         while True:
-            tkinter.Tk().withdraw()  # prevents an empty tkinter window from appearing
-            file_path = filedialog.askopenfilename(title='Select your report to import the data',
-                                                   filetypes=[("CSV (comma-separated values) file", ".csv")],
-                                                   defaultextension=".csv",
-                                                   )
+            if interactive:
+                file_path = Import.ask_for_csv_path('Select your report to import the data')
             if not file_path:
                 print(f"Please choose the .csv file with the General report!")
                 continue
             logging.info(f"The user select the following path: '{file_path}' for initial report importing")
             # check for the consistency of the columns comparing them with a list from _collections
-            columns_in_selected_file = pd.read_csv(file_path).columns
-            column_inconsistency_check = [x for x in zip(Collection.report_expected_columns(), columns_in_selected_file)
-                                          if x[0] != x[1]]
+            column_inconsistency_check = Import.column_inconsistencies(file_path,
+                                                                       Collection.report_expected_columns())
 
             # print and log the inconsistencies
             if column_inconsistency_check:
@@ -89,17 +148,15 @@ class Import:
 
                 print(f"Please check the column's consistency in the chosen file!\n",
                       '\n'.join(message))
-                logging.info(f"***Column inconsistencies for the reservations report:\n", '\n'.join(message))
+                logging.info(f"***Column inconsistencies for the reservations report:\n" + '\n'.join(message))
+                if not interactive:
+                    raise ValueError('\n'.join(message))
                 continue
 
             # if choice is valid and there are no inconsistencies
             # import and transform the report data to a dataframe
             else:
                 report_df = pd.read_csv(file_path,
-                                        parse_dates=['Start Time',
-                                                     'End Time', 'Date Scheduled'],
-                                        dayfirst=False,
-                                        cache_dates=True,
                                         dtype={
                                             'First Name': 'string',
                                             'Last Name': 'string',
@@ -119,29 +176,34 @@ class Import:
                                             'Appointment ID': 'string'},
                                         converters={
                                             'Email': Import.to_lower,
-                                            'Служебен имейл | Work email  ': Import.to_lower}, ) \
-                    .fillna(np.nan).replace([np.nan], [None])
+                                            'Служебен имейл | Work email  ': Import.to_lower}, )
+                # parse the dates with explicit formats (no format inference)
+                for column, date_format in Collection.report_date_columns().items():
+                    report_df[column] = pd.to_datetime(report_df[column], format=date_format)
+                report_df = report_df.fillna(np.nan).replace([np.nan], [None])
                 logging.info(f"General/initial report file imported successfully and "
                              f"limitations_df dataframe was created")
                 break
         return report_df
 
     @staticmethod
-    def import_limitations() -> pd.DataFrame:
+    def import_limitations(file_path: str = None) -> pd.DataFrame:
         """
         Import the limitation report that contains company contracts data, payment rate per hour etc.
         and create a dataframe
+
+        :param file_path: path to the limitations.csv, if missing the user selects it via the file explorer browser
         :return: dataframe 'limitations_df'
+        :raises ValueError: if the file_path is given and the columns are not matching the expected ones
+                or there are overlapping contracts
         """
         # uses file explorer browser to find and select the
         # limitations.csv and validate the chose
         limitations_df = None
+        interactive = not file_path
         while True:
-            tkinter.Tk().withdraw()  # prevents an empty tkinter window from appearing
-            file_path = filedialog.askopenfilename(title='Select the file with the Limitations',
-                                                   filetypes=[("CSV (comma-separated values) file", ".csv")],
-                                                   defaultextension=".csv",
-                                                   )
+            if interactive:
+                file_path = Import.ask_for_csv_path('Select the file with the Limitations')
             if not file_path:
                 print(f"Please choose the .csv file with the predefined Limitations!")
                 continue
@@ -149,9 +211,8 @@ class Import:
             logging.info(f"The user select the following path: '{file_path}' for limitations importing")
 
             # check for the consistency of the columns comparing them with a list from _collections
-            columns_in_selected_file = pd.read_csv(file_path).columns
-            column_inconsistency_check = [x for x in zip(Collection.limitations_expected_columns(),
-                                                         columns_in_selected_file) if x[0] != x[1]]
+            column_inconsistency_check = Import.column_inconsistencies(file_path,
+                                                                       Collection.limitations_expected_columns())
 
             # print and log the inconsistencies
             if column_inconsistency_check:
@@ -167,7 +228,9 @@ class Import:
 
                 print(f"Please check the column's consistency in the chosen file!\n",
                       '\n'.join(message))
-                logging.info(f"***Column inconsistencies for the limitations report:\n", '\n'.join(message))
+                logging.info(f"***Column inconsistencies for the limitations report:\n" + '\n'.join(message))
+                if not interactive:
+                    raise ValueError('\n'.join(message))
                 continue
 
             # if choice is valid and there are no inconsistencies
@@ -177,13 +240,28 @@ class Import:
                                              names=['company', 'c_per_emp', 'c_per_month', 'prepaid',
                                                     'starts', 'ends', 'note', 'bgn_per_hour', 'is_valid'],
                                              usecols=[0, 1, 2, 3, 4, 5, 7, 8, 9],
-                                             parse_dates=['starts', 'ends'],
-                                             dayfirst=True,
-                                             cache_dates=True,
                                              skiprows=[0],
                                              index_col=False,
                                              keep_default_na=False,
                                              )
+                # parse the dates with explicit formats (no format inference)
+                for column, date_format in Collection.limitations_date_columns().items():
+                    limitations_df[column] = pd.to_datetime(limitations_df[column], format=date_format)
+
+                # every training must be matched to only one contract in force
+                overlapping_contracts = Import.overlapping_contracts(limitations_df)
+                if overlapping_contracts:
+                    message = [">>> The following contracts are overlapping with a previous contract "
+                               "of the same company: "]
+                    for company, starts, ends in overlapping_contracts:
+                        message.append(f"The contract of '{company}' from {starts} to {ends}!")
+
+                    print(f"Please check the contract dates in the chosen file!\n", '\n'.join(message))
+                    logging.info(f"***Overlapping contracts in the limitations report:\n" + '\n'.join(message))
+                    if not interactive:
+                        raise ValueError('\n'.join(message))
+                    continue
+
                 logging.info(f"Limitations file imported successfully and limitations_df dataframe was created")
                 break
         return limitations_df
@@ -198,15 +276,30 @@ class Export:
 
         Methods
         -------
-        df_to_csv(name: str, dataframe: pd.DataFrame, path: str) -> None:
-            Converts the DateFrame with the data to .csv
+        readable_flags(dataframe: pd.DataFrame) -> pd.DataFrame:
+            Replaces the integer 'flags' bitmask with the readable comma-joined flag numbers
+
+        export_view(dataframe: pd.DataFrame) -> pd.DataFrame:
+            The dataframe as exported: without the internal key columns, with readable flags and text dates
+
+        df_to_csv(name: str, dataframe: pd.DataFrame, path: str, compression: str = None, workers: int = 0) -> None:
+            Converts the DateFrame with the data to .csv (optionally compressed)
+
+        run_work_items(function: Callable[[dict], str], work_items: List[dict], workers: int = 0) -> List[str]:
+            Runs the per-company/per-trainer work items one by one or in a process pool
 
-        companies_df_to_excel(name: str, dataframe: pd.DataFrame, path: str) -> None:
+        company_artifacts(work_item: dict) -> str:
+            Creates the invoice and the two .docx reports of one company
+
+        trainer_artifacts(work_item: dict) -> str:
+            Creates the .docx report of one trainer
+
+        companies_df_to_excel(name: str, dataframe: pd.DataFrame, path: str, workers: int = 0) -> None:
             Takes data from the new monthly dataframe, filters by each company
             and export them in separate sheets, also creates an invoice and an additional reports
             based on a pre-formatted .docx file
 
-        trainers_df_to_excel(name: str, dataframe: pd.DataFrame, path: str) -> None:
+        trainers_df_to_excel(name: str, dataframe: pd.DataFrame, path: str, workers: int = 0) -> None:
             Takes data from the new monthly dataframe, filters by each trainer
             and export them in separate sheets, also creates additional reports
             based on a pre-formatted .docx file
@@ -215,8 +308,8 @@ class Export:
             Creates one file with multiple dataframes in separate sheets in case of data review
             Serves class MultiReport
 
-        stats_mont_df_to_excel(name: str, dataframe: pd.DataFrame, path: str) -> None:
-            Uses the monthly dataframe to aggregate/pivot the data by:
+        stats_mont_df_to_excel(name: str, cube: pd.DataFrame, path: str) -> None:
+            Uses the monthly stats cube to aggregate/pivot the data by:
              - employee
              - company
              - trainer
@@ -224,8 +317,8 @@ class Export:
              - trainer total
              and save every dataframe as a separate sheet
 
-        stats_full_df_to_excel(name: str, dataframe: pd.DataFrame, path: str) -> None:
-            Uses the full/annual dataframe to aggregate/pivot the data by:
+        stats_full_df_to_excel(name: str, cube: pd.DataFrame, path: str) -> None:
+            Uses the full/annual stats cube to aggregate/pivot the data by:
              - employee
              - company
              - trainer
@@ -233,25 +326,112 @@ class Export:
              - trainer total
              and save every dataframe as a separate sheet
 
-        convert_docx_to_pdf(files_path) -> None:
+        convert_docx_to_pdf(files_path: str, workers: int = 0) -> Dict[str, str]:
             Uses LibreOffice to convert the generated .docx reports to PDF
             Serves to class BulkReport
 
     """
 
     @staticmethod
-    def df_to_csv(name: str, dataframe: pd.DataFrame, path: str) -> None:
+    def readable_flags(dataframe: pd.DataFrame) -> pd.DataFrame:
+        """
+        Replaces the integer 'flags' bitmask with the readable comma-joined flag numbers
+        (the flags are kept as a bitmask until the export)
+
+        :param dataframe: any dataframe
+        :return: copy of the dataframe with readable 'flags' or the same dataframe if there is no bitmask
+        """
+        if 'flags' not in dataframe.columns or not pd.api.types.is_integer_dtype(dataframe['flags']):
+            return dataframe
+        return dataframe.assign(flags=BaseDataframe.flags_to_string(dataframe['flags']))
+
+    @staticmethod
+    def export_view(dataframe: pd.DataFrame) -> pd.DataFrame:
+        """
+        The integer keys of the employees, the companies and the trainers (Dimensions) are internal,
+        the exported dataframes have only their labels
+
+        :param dataframe: any dataframe
+        :return: the dataframe without the key columns, with readable 'flags' (see readable_flags())
+                and with the dates as text (see BaseDataframe.format_dates())
+        """
+        keys = [column for column in Dimensions.internal_columns() if column in dataframe.columns]
+        if keys:
+            dataframe = dataframe.drop(columns=keys)
+        return BaseDataframe.format_dates(Export.readable_flags(dataframe))
+
+    @staticmethod
+    @Instrumentation.measured
+    def df_to_csv(name: str, dataframe: pd.DataFrame, path: str, compression: str = None, workers: int = 0) -> None:
         """
-        Converts the DateFrame with the data to .csv
+        Converts the DateFrame with the data to .csv, chunk by chunk with CsvStream
+        (the uncompressed file is the same as the one of DataFrame.to_csv())
         :param path:
         :param dataframe: transformed from BaseWebsite._data_dict
         :param name: depends on instance name
+        :param compression: None for a plain .csv, 'gzip' (.csv.gz) or 'zstd' (.csv.zst)
+        :param workers: number of the processes formatting the chunks (0 or 1 for no pool)
         :return: nothing
         """
-        dataframe.to_csv(f"{path}{name}.csv", encoding='utf-8', index=False)
+        dataframe = Export.export_view(dataframe)
+        CsvStream.df_to_csv(CsvStream.file_path(path, name, compression), dataframe, compression, workers=workers)
+
+    @staticmethod
+    def run_work_items(function: Callable[[dict], str], work_items: List[dict], workers: int = 0) -> List[str]:
+        """
+        Runs the per-company/per-trainer work items (invoices and .docx reports)
+        one by one or, with more than one worker, in a process pool.
+        The workers are spawned, not forked: the reports may run in the threads of ReportScheduler and
+        a fork of a multi-threaded process copies the locks held by the other threads (e.g. the invoice lock)
+
+        :param function: company_artifacts() or trainer_artifacts()
+        :param work_items: list with the work items
+        :param workers: number of the worker processes (0 or 1 runs the items in the current process)
+        :return: list with the names of the done items in the order of the work items
+        """
+        if workers > 1 and len(work_items) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(work_items)),
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                return list(executor.map(function, work_items))
+        return [function(work_item) for work_item in work_items]
+
+    @staticmethod
+    def company_artifacts(work_item: dict) -> str:
+        """
+        Creates the invoice and the two .docx reports of one company
+        (runs in a worker process in the parallel mode)
+
+        :param work_item: dictionary made by companies_df_to_excel()
+        :return: the company name
+        """
+        company = work_item['company']
+        BaseInvoice.create_invoice(company, work_item['rate_per_hour'], work_item['invoice_data_dict'],
+                                   f"{work_item['path']}invoices/", work_item['invoice_number'])
+        ReportFromTemplate.create_by_company_report_from_docx_template(
+            company, work_item['df'], work_item['total_hours'], work_item['start_date'], work_item['end_date'],
+            work_item['path'])
+        ReportFromTemplate.create_by_company_x_report_from_docx_template(
+            company, work_item['df'], work_item['total_hours'], work_item['start_date'], work_item['end_date'],
+            work_item['path'])
+        return company
+
+    @staticmethod
+    def trainer_artifacts(work_item: dict) -> str:
+        """
+        Creates the .docx report of one trainer
+        (runs in a worker process in the parallel mode)
+
+        :param work_item: dictionary made by trainers_df_to_excel()
+        :return: the trainer name
+        """
+        ReportFromTemplate.create_by_calendar_report_from_docx_template(
+            work_item['trainer'], work_item['df'], work_item['total_hours'], work_item['total_pay'],
+            work_item['path'])
+        return work_item['trainer']
 
     @staticmethod
-    def companies_df_to_excel(name: str, dataframe: pd.DataFrame, path: str) -> None:
+    @Instrumentation.measured
+    def companies_df_to_excel(name: str, dataframe: pd.DataFrame, path: str, workers: int = 0) -> None:
         """
         Takes data from the new monthly dataframe, filters by each company
         and export them in separate sheets, also creates an invoice and an additional reports
@@ -261,6 +441,9 @@ class Export:
         :param name: 'Companies' or 'Companies_out_of_scope'
         :param dataframe: new_monthly_data_df
         :param path: relative path where the file must be saved
+                (the invoices and the .docx reports are saved in its 'invoices' and 'from_templates' sub-folders)
+        :param workers: number of the processes for the invoices and the .docx reports (0 or 1 for no pool),
+                the workbook is always written by the current process
         :return: None
         """
         # preparing the new df by company (is_valid == 1) in scope + (is_valid == 0) out of the project scope
@@ -268,50 +451,64 @@ class Export:
             column_list = Collection.company_report_list(dataframe)
         else:
             column_list = Collection.company_report_list_other(dataframe)
-        with pd.ExcelWriter(f'{path}{name}.xlsx', engine='xlsxwriter') as ew:
-            # add worksheets for the trainings in scope
-            for value in column_list:
-                company_filter = (dataframe['company'] == value)
-
-                # use the dataframe filtering for getting data and pass it to the invoice creator
-                invoice_data_df_init = dataframe.loc[company_filter &
-                                                     (dataframe['is_valid'] == 1)][['nickname', 'type']]
-
-                invoice_data_df = invoice_data_df_init.value_counts()
-                rate_per_hour = float(dataframe.loc[company_filter, 'bgn_per_hour'].unique())
-
-                invoice_data_dict = invoice_data_df.to_dict()
-
-                if invoice_data_dict:
-                    # make an invoice for the company
-                    BaseInvoice.create_invoice(value, rate_per_hour, invoice_data_dict)
-
-                    # add variables to give the needed inf for creation of the .docx templates
-                    new_df = dataframe.loc[company_filter, 'nickname'].value_counts().reset_index(name='count')
-                    start_date = dataframe.loc[company_filter &
-                                               (dataframe['is_valid'] == 1)][['training_datetime']].iloc[0].astype(str)
-                    start_date = str(start_date[0][0:11])
-                    end_date = dataframe.loc[company_filter &
-                                             (dataframe['is_valid'] == 1)][['training_datetime']].iloc[-1].astype(str)
-                    end_date = str(end_date[0][0:11])
-                    total_hours = new_df[['count']].sum().iloc[-1]
-
-                    # create the .docx templates with the company data
-                    ReportFromTemplate.create_by_company_report_from_docx_template(
-                        value, new_df, total_hours, start_date, end_date)
-                    ReportFromTemplate.create_by_company_x_report_from_docx_template(
-                        value, new_df, total_hours, start_date, end_date)
-
-                # aggregate the company data, add 'count' and 'total' columns
-                new_df = dataframe.loc[company_filter, 'nickname'].value_counts().reset_index(name='count')
-                new_df.loc[-1, 'total'] = new_df['count'].sum()
 
+        # aggregate the data of all companies in one pass (grouped once instead of filtered by every company)
+        valid_df = dataframe.loc[dataframe['is_valid'] == 1]
+        nickname_counts = dataframe.groupby(['company', 'nickname'], sort=False, observed=True).size()
+        invoice_counts = valid_df.groupby(['company', 'nickname', 'type'], observed=True).size()
+        rates_per_hour = dataframe.groupby('company', sort=False, observed=True)['bgn_per_hour'].unique()
+        first_dates = valid_df.drop_duplicates('company', keep='first').set_index('company')['training_datetime']
+        last_dates = valid_df.drop_duplicates('company', keep='last').set_index('company')['training_datetime']
+        companies_with_nicknames = set(nickname_counts.index.get_level_values('company'))
+        companies_with_invoices = set(invoice_counts.index.get_level_values('company'))
+
+        work_items = []
+        sheets = []
+        for value in column_list:
+            # the employee counts of the company (as value_counts() on the company rows)
+            if value in companies_with_nicknames:
+                company_counts = nickname_counts.loc[value].sort_values(ascending=False)
+            else:
+                company_counts = pd.Series([], dtype='int64')
+            new_df = company_counts.rename_axis(None).reset_index(name='count')
+
+            # use the aggregated data for getting the invoice data and pass it to the invoice creator
+            invoice_data_dict = invoice_counts.loc[value].sort_values(ascending=False).to_dict() \
+                if value in companies_with_invoices else {}
+
+            if invoice_data_dict:
+                # add variables to give the needed inf for creation of the .docx templates
+                start_date = first_dates[value].strftime(Collection.date_default_format())
+                end_date = last_dates[value].strftime(Collection.date_default_format())
+                total_hours = new_df['count'].sum()
+
+                work_items.append({'company': value, 'rate_per_hour': float(rates_per_hour[value]),
+                                   'invoice_data_dict': invoice_data_dict,
+                                   'df': new_df.copy(), 'total_hours': total_hours,
+                                   'start_date': start_date, 'end_date': end_date, 'path': path})
+
+            # add 'total' column to the company data
+            new_df.loc[-1, 'total'] = new_df['count'].sum()
+            sheets.append((value, new_df))
+
+        # one block of invoice numbers for all companies (in the order of the companies),
+        # committed to the sequence only when all invoices are made
+        with BaseInvoice.invoice_numbers(len(work_items)) as invoice_numbers:
+            for work_item, invoice_number in zip(work_items, invoice_numbers):
+                work_item['invoice_number'] = invoice_number
+
+            # make the invoices and the .docx templates with the company data
+            Export.run_work_items(Export.company_artifacts, work_items, workers)
+
+        with pd.ExcelWriter(f'{path}{name}.xlsx', engine='xlsxwriter') as ew:
+            for value, new_df in sheets:
                 # export/ save the dataframe to excel as sheet with company name as a sheet name
                 new_df.to_excel(ew, sheet_name=value, header=['Employee ID', 'Bookings', 'Total'],
                                 index=False)
 
     @staticmethod
-    def trainers_df_to_excel(name: str, dataframe: pd.DataFrame, path: str) -> None:
+    @Instrumentation.measured
+    def trainers_df_to_excel(name: str, dataframe: pd.DataFrame, path: str, workers: int = 0) -> None:
         """
         Takes data from the new monthly dataframe, filters by each trainer
         and export them in separate sheets, also creates additional reports
@@ -321,34 +518,53 @@ class Export:
         :param name: the name for the .excel file
         :param dataframe: new_monthly_data_df
         :param path: relative path where the file must be saved
+                (the .docx reports are saved in its 'from_templates' sub-folder)
+        :param workers: number of the processes for the .docx reports (0 or 1 for no pool),
+                the workbook is always written by the current process
         :return: None
         """
 
         # take the unique values in the 'trainer' pd.Series (trainers names*)
         column_list = Collection.trainers_report_list(dataframe)
 
-        # use the manager for the .xlsx file building and saving
-        with pd.ExcelWriter(f'{path}{name}.xlsx', engine='xlsxwriter') as ew:
-            for value in column_list:
-                new_df = dataframe[(dataframe['trainer'] == value)][
-                    ['company', 'training_datetime', 'employee_names', 'short_type', 'bgn_per_hour']]
+        # group the data of all trainers in one pass (instead of filtering by every trainer)
+        trainers_rows = dataframe.groupby('trainer', sort=False, observed=True).indices
+        trainers_totals = dataframe.groupby('trainer', sort=False, observed=True) \
+            .agg(total_hours=('training_datetime', 'count'), total_pay=('bgn_per_hour', 'sum'))
+        trainer_columns = ['company', 'training_datetime', 'employee_names', 'short_type', 'bgn_per_hour']
+
+        work_items = []
+        sheets = []
+        for value in column_list:
+            new_df = dataframe.iloc[trainers_rows[value]][trainer_columns]
 
-                # add two columns for totals
-                total_hours = new_df['training_datetime'].count()
-                total_pay = new_df['bgn_per_hour'].sum()
+            # add two columns for totals
+            total_hours = trainers_totals.loc[value, 'total_hours']
+            total_pay = trainers_totals.loc[value, 'total_pay']
 
-                # make additional report via .docx template
-                ReportFromTemplate.create_by_calendar_report_from_docx_template(value, new_df, total_hours, total_pay)
+            # additional report via .docx template
+            work_items.append({'trainer': value, 'df': new_df, 'total_hours': total_hours,
+                               'total_pay': total_pay, 'path': path})
 
-                new_df.loc[-1, 'total_trainings'] = total_hours
-                new_df.loc[-1, 'total_pay'] = f"{total_pay:.2f}" + ".лв"
+            # the sheet gets the training dates as text (the .docx rows are formatted by the templates)
+            new_df = BaseDataframe.format_dates(new_df).copy()
+            new_df.loc[-1, 'total_trainings'] = total_hours
+            new_df.loc[-1, 'total_pay'] = f"{total_pay:.2f}" + ".лв"
+            sheets.append((value, new_df))
 
+        # make the .docx templates with the trainer data
+        Export.run_work_items(Export.trainer_artifacts, work_items, workers)
+
+        # use the manager for the .xlsx file building and saving
+        with pd.ExcelWriter(f'{path}{name}.xlsx', engine='xlsxwriter') as ew:
+            for value, new_df in sheets:
                 # export/ save the dataframe to excel as sheet with trainer name as a sheet name
                 new_df.to_excel(ew, sheet_name=value,
                                 header=['Компания', 'Време на тренинга', 'Имена на служител', 'Вид', 'Лв на час',
                                         'Общо тренинги', 'Общо възнаграждение'], index=False)
 
     @staticmethod
+    @Instrumentation.measured
     def generic_df_to_excel(name: str, dictionary: Dict[str, pd.DataFrame], path: str) -> None:
         """
         Creates one file with multiple dataframes in separate sheets in case of data review
@@ -360,22 +576,18 @@ class Export:
         :return: None
         """
 
-        # use the manager for the .xlsx file building and saving
-        with pd.ExcelWriter(f'{path}{name}.xlsx', engine='xlsxwriter') as ew:
-            for item in dictionary.items():
-                df = item[1]
-                df_name = item[0]
-                if df_name in Collection.generic_report_list():
-                    df.to_excel(ew, sheet_name=str(df_name), index=False)
-            month_describe = pd.DataFrame(dictionary["new_monthly_data_df"].describe())
-            annual_describe = pd.DataFrame(dictionary["new_full_data_df"].describe())
-            month_describe.to_excel(ew, sheet_name='month_describe')
-            annual_describe.to_excel(ew, sheet_name='annual_describe')
+        sheets = {str(df_name): Export.export_view(df) for df_name, df in dictionary.items()
+                  if df_name in Collection.generic_report_list()}
+        sheets['month_describe'] = pd.DataFrame(Export.export_view(dictionary["new_monthly_data_df"]).describe())
+        sheets['annual_describe'] = pd.DataFrame(Export.export_view(dictionary["new_full_data_df"]).describe())
+        # the rows are streamed to the file (constant memory), the sheets over the Excel row limit are split
+        ExcelStream.dfs_to_excel(f'{path}{name}.xlsx', sheets, index_sheets=['month_describe', 'annual_describe'])
 
     @staticmethod
-    def stats_mont_df_to_excel(name: str, dataframe: pd.DataFrame, path: str) -> None:
+    @Instrumentation.measured
+    def stats_mont_df_to_excel(name: str, cube: pd.DataFrame, path: str) -> None:
         """
-        Uses the monthly dataframe to aggregate/pivot the data by:
+        Uses the monthly stats cube (StatsCube) to aggregate/pivot the data by:
          - employee
          - company
          - trainer
@@ -384,16 +596,19 @@ class Export:
          and save every dataframe as a separate sheet
 
         :param name: the name for the .excel file
-        :param dataframe: new_monthly_data_df
+        :param cube: monthly_stats_cube (the StatsCube of new_monthly_data_df)
         :param path: relative path where the file must be saved
         :return: None
         """
 
+        # the categoricals (Transformation.compact_dtypes()) are pivoted as plain values,
+        # otherwise the pivot tables are not sorted and include the unobserved categories
+        cube = StatsCube.plain(cube)
+
         # use the manager for the .xlsx file building and saving
         with pd.ExcelWriter(f'{path}{name}.xlsx', engine='xlsxwriter') as ew:
             # add sheet for statistical monthly data by Employee
-            month_stats_emp = dataframe[['nickname', 'company']] \
-                .value_counts() \
+            month_stats_emp = StatsCube.value_counts(cube, ['nickname', 'company']) \
                 .reset_index(name='Trainings per Employee') \
                 .sort_values(by='nickname')
             month_stats_emp.loc[-1, 'total'] = month_stats_emp['Trainings per Employee'].sum()
@@ -403,11 +618,10 @@ class Export:
                                      freeze_panes=(1, 4))
 
             # add sheet for statistical monthly data by Company
-            month_stats_comp = dataframe[['company', 'nickname', 'concat_emp_company']]
-            month_stats_comp_pivot = pd.pivot_table(month_stats_comp,
+            month_stats_comp_pivot = pd.pivot_table(cube,
                                                     index=['company', 'nickname'],
                                                     values=['concat_emp_company'],
-                                                    aggfunc='count',
+                                                    aggfunc='sum',
                                                     margins=True,
                                                     margins_name="Total",
                                                     fill_value=0,
@@ -419,11 +633,10 @@ class Export:
                                             freeze_panes=(1, 3))
 
             # add sheet for statistical monthly data by Trainer
-            month_stats_trainer = dataframe[['trainer', 'nickname', 'concat_emp_company']]
-            month_stats_trainer = pd.pivot_table(month_stats_trainer,
+            month_stats_trainer = pd.pivot_table(cube,
                                                  index=['trainer', 'nickname'],
                                                  values=['concat_emp_company'],
-                                                 aggfunc='count',
+                                                 aggfunc='sum',
                                                  margins=True,
                                                  margins_name="Total",
                                                  fill_value=0,
@@ -435,11 +648,10 @@ class Export:
                                          freeze_panes=(1, 3))
 
             # add sheet for statistical monthly data for Company's total
-            month_stats_comp_total = dataframe[['company', 'concat_emp_company', 'bgn_per_hour']]
-            month_stats_comp_total = pd.pivot_table(month_stats_comp_total,
+            month_stats_comp_total = pd.pivot_table(cube,
                                                     index=['company'],
-                                                    values=['concat_emp_company', 'bgn_per_hour'],
-                                                    aggfunc={'concat_emp_company': 'count', 'bgn_per_hour': sum},
+                                                    values=['concat_emp_company', 'bgn_sum'],
+                                                    aggfunc={'concat_emp_company': 'sum', 'bgn_sum': sum},
                                                     margins=True,
                                                     margins_name="Total",
                                                     fill_value=0,
@@ -451,11 +663,10 @@ class Export:
                                             freeze_panes=(1, 3))
 
             # add sheet for statistical monthly data for Trainer's total
-            month_stats_trainer__total = dataframe[['trainer', 'bgn_per_hour', 'is_valid']]
-            month_stats_trainer__total = pd.pivot_table(month_stats_trainer__total,
+            month_stats_trainer__total = pd.pivot_table(cube,
                                                         index=['trainer'],
-                                                        values=['trainer', 'bgn_per_hour'],
-                                                        aggfunc={'trainer': 'count', 'bgn_per_hour': sum},
+                                                        values=['count', 'bgn_sum'],
+                                                        aggfunc={'count': 'sum', 'bgn_sum': sum},
                                                         margins=True,
                                                         margins_name="Total",
                                                         fill_value=0,
@@ -467,9 +678,10 @@ class Export:
                                                 freeze_panes=(1, 3))
 
     @staticmethod
-    def stats_full_df_to_excel(name: str, dataframe: pd.DataFrame, path: str) -> None:
+    @Instrumentation.measured
+    def stats_full_df_to_excel(name: str, cube: pd.DataFrame, path: str) -> None:
         """
-        Uses the full/annual dataframe to aggregate/pivot the data by:
+        Uses the full/annual stats cube (StatsCube) to aggregate/pivot the data by:
          - employee
          - company
          - trainer
@@ -478,16 +690,17 @@ class Export:
          and save every dataframe as a separate sheet
 
         :param name: the name for the .excel file
-        :param dataframe: new_monthly_data_df
+        :param cube: full_stats_cube (the StatsCube of new_full_data_df)
         :param path: relative path where the file must be saved
         :return:
         """
+        cube = StatsCube.plain(cube)
         with pd.ExcelWriter(f'{path}{name}.xlsx', engine='xlsxwriter') as ew:
             # add sheet for statistical annual data by Company with percentage
             # filter_for_actual_contracts_y = (full_df['is_valid'] == 1)
-            annual_stats_general1 = dataframe[['company']].value_counts().reset_index()
-            annual_stats_general2 = (dataframe[['company']].
-                                     value_counts(normalize=True).mul(100).round(2).astype(str) + '%').reset_index()
+            annual_stats_general1 = StatsCube.value_counts(cube, ['company']).reset_index()
+            annual_stats_general2 = (StatsCube.value_counts(cube, ['company'], normalize=True)
+                                     .mul(100).round(2).astype(str) + '%').reset_index()
             annual_stats_general = pd.merge(
                 left=annual_stats_general1,
                 right=annual_stats_general2,
@@ -500,8 +713,7 @@ class Export:
                                           freeze_panes=(1, 3))
 
             # add sheet for statistical annual data by Company and Year
-            annual_stats_by_year = dataframe[['company', 'year']]
-            annual_stats_by_year = annual_stats_by_year.value_counts(['company', 'year']).unstack()
+            annual_stats_by_year = StatsCube.value_counts(cube, ['company', 'year']).unstack()
             annual_stats_by_year['Total'] = annual_stats_by_year.agg("sum", axis='columns')
             annual_stats_by_year.loc[-1, 'Grand Total'] = annual_stats_by_year['Total'].sum()
             annual_stats_by_year.to_excel(ew, sheet_name='by_year',
@@ -510,7 +722,7 @@ class Export:
                                           freeze_panes=(1, 6))
 
             # add sheet for statistical annual data by Unique EmployeeIDs with percentage
-            annual_stats_unique_emp0 = dataframe[['company', 'nickname']].value_counts().to_frame().reset_index()
+            annual_stats_unique_emp0 = StatsCube.value_counts(cube, ['company', 'nickname']).to_frame().reset_index()
             annual_stats_unique_emp1 = annual_stats_unique_emp0[['company']].value_counts().to_frame().reset_index()
             annual_stats_unique_emp2 = (annual_stats_unique_emp0[['company']].
                                         value_counts(normalize=True).mul(100).round(2).astype(str) + '%').reset_index()
@@ -526,10 +738,7 @@ class Export:
                                              freeze_panes=(1, 3))
 
             # add sheet for statistical annual data by Employee, by Year
-            annual_stats_by_emp_by_year = dataframe[['company', 'nickname', 'year']]
-
-            annual_stats_by_emp_by_year = annual_stats_by_emp_by_year.value_counts(['company', 'nickname', 'year']) \
-                .unstack()
+            annual_stats_by_emp_by_year = StatsCube.value_counts(cube, ['company', 'nickname', 'year']).unstack()
 
             annual_stats_by_emp_by_year['Total'] = annual_stats_by_emp_by_year.agg("sum", axis='columns')
 
@@ -541,11 +750,8 @@ class Export:
                                                  freeze_panes=(1, 7))
 
             # add sheet for statistical annual data by Company and Employees with only 1 training
-            annual_stats_by_emp_with_one_training = \
-                dataframe[(dataframe['returns_or_not'] == 'only one session')].reset_index()
-
             annual_stats_by_emp_with_one_training = pd.DataFrame(
-                annual_stats_by_emp_with_one_training[['company', 'nickname']].value_counts().to_frame())
+                StatsCube.value_counts(cube, ['company', 'nickname'], measure='one_session').to_frame())
 
             annual_stats_by_emp_with_one_training.columns = ['count']
 
@@ -559,35 +765,24 @@ class Export:
                                                            freeze_panes=(1, 4))
 
     @staticmethod
-    def convert_docx_to_pdf(files_path) -> None:
+    @Instrumentation.measured
+    def convert_docx_to_pdf(files_path: str, workers: int = 0) -> Dict[str, str]:
         """
         Uses LibreOffice to convert the generated .docx reports to PDF
+        (saved in the 'PDFs' sub-folder) in one batch per LibreOffice instance
         Serves to class BulkReport
 
-        :param files_path: relative path where the file must be saved
-        :return: None
+        :param files_path: relative path of the folder with the .docx reports
+        :param workers: number of the LibreOffice instances (0 or 1 for a single instance)
+        :return: dictionary with the conversion status ('converted', 'failed' or 'timeout') by file path
         """
-
-        # path to the engine
-        path_to_office = r"C:\Program Files\LibreOffice\program\soffice.exe"
-        # verify the path using getcwd()
-        cwd = os.getcwd()
-        files = os.listdir(files_path)
-        for file in files:
-            if os.path.isfile(files_path + "/" + file):
-                # path with files to convert
-                source_folder = fr"{files_path}"
-
-                # path with pdf files
-                output_folder = fr"PDFs"
-
-                # changing directory to source
-                os.chdir(source_folder)
-
-                # assign and running the command of converting files through LibreOffice
-                command = f"\"{path_to_office}\" --convert-to pdf  --outdir \"{output_folder}\" *.*"
-                subprocess.run(command)
-        os.chdir(cwd)
+        statuses = PdfConverter.convert_folder(files_path, os.path.join(files_path, "PDFs"), workers)
+        for file, status in statuses.items():
+            if status != 'converted':
+                logging.warning(f"The PDF conversion of '{file}' {'timed out' if status == 'timeout' else 'failed'}")
+        logging.info(f"{list(statuses.values()).count('converted')} of {len(statuses)} reports "
+                     f"in '{files_path}' were converted to PDF")
+        return statuses
 
 
 class ZipFiles:
@@ -600,16 +795,18 @@ class ZipFiles:
 
         Methods
         -------
-        zip_export_folder() -> str:
+        zip_export_folder(save_as: str = None, folder: str = "exports") -> None:
             Collects filenames/file paths and add the files into a .zip archive file.
 
     """
 
     @staticmethod
-    def zip_export_folder() -> None:
+    def zip_export_folder(save_as: str = None, folder: str = "exports") -> None:
         """
         Collects filenames/file paths and add the files into a .zip archive file.
 
+        :param save_as: path of the .zip file, if missing the user selects it via the file explorer browser
+        :param folder: the folder which will be archived
         :return: None
         """
 
@@ -618,7 +815,10 @@ class ZipFiles:
         new_file = f"reports_and_invoices_{dt_string}.zip"
 
         # use file browser for the path selection and validate choice/actions
-        while True:
+        while not save_as:
+            import tkinter
+            from tkinter.filedialog import asksaveasfile
+
             tkinter.Tk().withdraw()  # prevents an empty tkinter window from appearing
             target_dir_path = asksaveasfile(filetypes=[("Zip archive file", ".zip")],
                                             defaultextension=".zip",
@@ -632,15 +832,10 @@ class ZipFiles:
             logging.info(f"The user select the following path for saving the .zip: '{target_dir_path}'")
             save_as = target_dir_path.name
 
-            # get list of all files in 'exports' folder
-            with zipfile.ZipFile(f'{save_as}', 'w') as f:
-                for root, dirs, files in os.walk("exports"):
-                    for file in files:
-                        f.write(os.path.join(root, file))
-                    for directory in dirs:
-                        f.write(os.path.join(root, directory))
-            logging.info(f"The .zip files with all of the reports was created and saved")
-            break
+        # add all files in the 'exports' folder
+        # (names in the archive start with the folder name, e.g. 'exports/...')
+        ArchiveBuilder(save_as, folder).close()
+        logging.info(f"The .zip files with all of the reports was created and saved")
 
 
 class Clearing:
@@ -656,7 +851,7 @@ class Clearing:
         list_files(folder_relative_path) -> List[str]:
             List files and folders/sub folders in given relative path
 
-        delete_files_from_export_subfolders():
+        delete_files_from_export_subfolders(folder: str = "exports"):
             Receives list with file paths and names and removes all non-directories
     """
 
@@ -679,12 +874,13 @@ class Clearing:
         return items_list
 
     @staticmethod
-    def delete_files_from_export_subfolders():
+    def delete_files_from_export_subfolders(folder: str = "exports"):
         """
         Receives list with file paths and names and removes all non-directories
+        :param folder: relative path of the 'exports' folder
         :return:
         """
-        clearing_list = Clearing.list_files("exports")
+        clearing_list = Clearing.list_files(folder)
 
         for item in clearing_list:
             if os.path.isfile(item):
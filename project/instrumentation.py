@@ -0,0 +1,260 @@
+# coding: utf8
+import datetime
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+
+class Instrumentation:
+    """Class used to measure the pipeline stages (the BaseDataframe steps, the Export functions and
+        the export of every report): wall time, CPU time, rows in/out and the growth of the peak RSS.
+        Every measured call is written as one JSON line and an end-of-run summary table can be printed.
+        It is turned off by default and a measured function then costs one flag check per call,
+        so the decorators stay in the production code
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        enable(metrics_path: str = None) -> None:
+            Turns the measuring on (the records are appended to the JSON lines file if given)
+
+        disable() -> None:
+            Turns the measuring off and closes the JSON lines file
+
+        enabled() -> bool:
+            :return: True if the measuring is on
+
+        records() -> List[dict]:
+            :return: the records since the last enable()
+
+        peak_rss_mb() -> Optional[float]:
+            :return: the peak resident memory of the process in MB (None if not available)
+
+        rows(value) -> Optional[int]:
+            :return: the number of rows of a dataframe/series (None for other values)
+
+        label(value) -> Optional[str]:
+            :return: the label of a stage from its first argument (a string or a report)
+
+        stage(name: str, label: str = None, rows_in: int = None) -> Iterator[dict]:
+            Measures the block as a stage
+
+        measured(function: Callable) -> Callable:
+            Decorator which measures every call of the function as a stage
+
+        summary() -> str:
+            The records aggregated by stage as a text table
+
+        log_summary() -> None:
+            Prints and logs the summary table
+    """
+
+    _enabled = False
+    _records: List[dict] = []
+    _metrics_file = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enable(metrics_path: str = None) -> None:
+        """
+        Turns the measuring on and clears the previous records
+
+        :param metrics_path: path of the JSON lines file (the records are appended), no file if missing
+        :return: None
+        """
+        Instrumentation.disable()
+        with Instrumentation._lock:
+            Instrumentation._records = []
+            if metrics_path:
+                Instrumentation._metrics_file = open(metrics_path, 'a', encoding='utf-8')
+            Instrumentation._enabled = True
+
+    @staticmethod
+    def disable() -> None:
+        """
+        Turns the measuring off and closes the JSON lines file (the records are kept for summary())
+
+        :return: None
+        """
+        with Instrumentation._lock:
+            Instrumentation._enabled = False
+            if Instrumentation._metrics_file:
+                Instrumentation._metrics_file.close()
+                Instrumentation._metrics_file = None
+
+    @staticmethod
+    def enabled() -> bool:
+        """
+        :return: True if the measuring is on
+        """
+        return Instrumentation._enabled
+
+    @staticmethod
+    def records() -> List[dict]:
+        """
+        :return: copy of the records since the last enable()
+        """
+        with Instrumentation._lock:
+            return list(Instrumentation._records)
+
+    @staticmethod
+    def peak_rss_mb() -> Optional[float]:
+        """
+        :return: the peak resident memory of the process in MB (None where the 'resource' module is missing)
+        """
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+    @staticmethod
+    def rows(value) -> Optional[int]:
+        """
+        :param value: any value
+        :return: the number of rows of a dataframe or a series, None for other values
+        """
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return len(value)
+        return None
+
+    @staticmethod
+    def label(value) -> Optional[str]:
+        """
+        :param value: the first argument of a measured function
+        :return: the value if it is a string (the report name of the Export functions), the name of a report
+                (export_report() of BaseReport) and None for other values (e.g. the name of a series)
+        """
+        if isinstance(value, str):
+            return value
+        # imported here, as the reports module imports the measured modules
+        from project.reports import BaseReport
+        return value.name if isinstance(value, BaseReport) else None
+
+    @staticmethod
+    @contextmanager
+    def stage(name: str, label: str = None, rows_in: int = None) -> Iterator[dict]:
+        """
+        Measures the block as a stage. The record may be completed in the block (e.g. record['rows_out']).
+        The CPU time is the one of the whole process and the memory is the growth of the process peak RSS
+        (0 if the stage does not go over the previous peak), so the stages running at the same time
+        (the report threads) are measured together
+
+        :param name: the name of the stage (e.g. 'BaseDataframe.nickname')
+        :param label: what is processed (e.g. the report name)
+        :param rows_in: number of the input rows
+        :return: context manager with the record of the stage
+        """
+        record = {'stage': name, 'label': label, 'rows_in': rows_in, 'rows_out': None}
+        if not Instrumentation._enabled:
+            yield record
+            return
+        started = datetime.datetime.now()
+        peak_before = Instrumentation.peak_rss_mb()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+            record['status'] = 'done'
+        except BaseException:
+            record['status'] = 'failed'
+            raise
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall_start, 6)
+            record['cpu_s'] = round(time.process_time() - cpu_start, 6)
+            peak_after = Instrumentation.peak_rss_mb()
+            record['peak_rss_delta_mb'] = None if peak_after is None else round(peak_after - peak_before, 3)
+            record['started'] = started.isoformat(timespec='milliseconds')
+            record['thread'] = threading.current_thread().name
+            with Instrumentation._lock:
+                Instrumentation._records.append(record)
+                if Instrumentation._metrics_file:
+                    Instrumentation._metrics_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    Instrumentation._metrics_file.flush()
+
+    @staticmethod
+    def measured(function: Callable) -> Callable:
+        """
+        Decorator which measures every call of the function as a stage named by its qualified name.
+        The input rows are the rows of the first dataframe argument, the output rows the ones of
+        the returned dataframe. The label is taken from the first argument (see label())
+
+        :param function: the function (under the @staticmethod decorator)
+        :return: the measured function
+        """
+        name = function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not Instrumentation._enabled:
+                return function(*args, **kwargs)
+            label = Instrumentation.label(args[0]) if args else None
+            rows_in = None
+            for value in (*args, *kwargs.values()):
+                rows_in = Instrumentation.rows(value)
+                if rows_in is not None:
+                    break
+            with Instrumentation.stage(name, label, rows_in) as record:
+                result = function(*args, **kwargs)
+                record['rows_out'] = Instrumentation.rows(result)
+            return result
+
+        return wrapper
+
+    @staticmethod
+    def summary() -> str:
+        """
+        :return: the records aggregated by stage (and label) as a text table, in the order of their first call
+        """
+        totals: Dict[tuple, dict] = {}
+        for record in Instrumentation.records():
+            total = totals.setdefault((record['stage'], record['label']),
+                                      {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows_in': None, 'rows_out': None,
+                                       'peak_rss_delta_mb': None, 'failed': 0})
+            total['calls'] += 1
+            total['wall_s'] += record['wall_s']
+            total['cpu_s'] += record['cpu_s']
+            total['failed'] += record['status'] == 'failed'
+            for key in ('rows_in', 'rows_out'):
+                if record[key] is not None:
+                    total[key] = (total[key] or 0) + record[key]
+            if record['peak_rss_delta_mb'] is not None:
+                total['peak_rss_delta_mb'] = max(total['peak_rss_delta_mb'] or 0.0, record['peak_rss_delta_mb'])
+
+        def number(value, digits: int = 0) -> str:
+            return '' if value is None else f"{value:.{digits}f}"
+
+        lines = [f"{'stage':<45} {'label':<24} {'calls':>5} {'wall, s':>9} {'cpu, s':>9} "
+                 f"{'rows in':>10} {'rows out':>10} {'+rss, MB':>9}"]
+        for (stage, label), total in totals.items():
+            failed = f" ({total['failed']} failed)" if total['failed'] else ''
+            lines.append(f"{stage:<45} {label or '':<24} {total['calls']:>5} {total['wall_s']:>9.3f} "
+                         f"{total['cpu_s']:>9.3f} {number(total['rows_in']):>10} {number(total['rows_out']):>10} "
+                         f"{number(total['peak_rss_delta_mb'], 1):>9}{failed}")
+        return '\n'.join(lines)
+
+    @staticmethod
+    def log_summary() -> None:
+        """
+        Prints and logs the summary table (nothing if there are no records)
+
+        :return: None
+        """
+        if Instrumentation.records():
+            table = Instrumentation.summary()
+            print(table)
+            logging.info(f"Stage metrics:\n{table}")
@@ -1,8 +1,17 @@
+import errno
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List
 from InvoiceGenerator.api import Invoice, Item, Client, Provider, Creator
 from InvoiceGenerator.pdf import SimpleInvoice
 from datetime import date
 
+# InvoiceGenerator reads the language from the environment for every translated string,
+# so it is set once per process (the worker processes import this module too) instead of in every call
+os.environ["INVOICE_LANG"] = "en"
+
 
 class BaseInvoice:
     """Class used to provide functions for the invoice generation
@@ -19,19 +28,35 @@ class BaseInvoice:
             invoice_filepath():
                 Returns the relative path for the invoice export folder
 
+            invoice_seq_lock_timeout():
+                Returns the seconds to wait for the lock of the invoice sequence file (on Windows)
+
+            invoice_seq_lock() -> Iterator[None]:
+                Context manager with an exclusive lock of the invoice sequence file (between processes and runs)
+
+            invoice_numbers(count: int) -> Iterator[List[str]]:
+                Context manager with a contiguous block of invoice numbers,
+                committed to the sequence file only if the block succeeds
+
+            reserve_invoice_numbers(count: int) -> List[str]:
+                Reserves and commits a contiguous block of invoice numbers in one locked operation
+
             get_invoice_number():
                 It gets a number from a .txt file,
                 adds 1 to be ready for the next invoice seq number
 
             update_invoice_number(path, new_number) -> None:
-                Clear the file with the previous invoice number
-                and replaced it with a new number (old number + 1)
+                Atomically replaces the file with the previous invoice number
+                with a new number (old number + the reserved count)
 
-            create_invoice(recipient: str, price: float, data_dict: dict) -> None:
+            create_invoice(recipient: str, price: float, data_dict: dict, invoice_path: str = None,
+                           invoice_number: str = None) -> None:
                 During the data aggregation for the .xlsx reports for each company, this function generates an invoice on a
                 employee/service level
     """
 
+    _thread_lock = threading.Lock()
+
     @staticmethod
     def invoice_seq_file():
         """
@@ -46,36 +71,119 @@ class BaseInvoice:
         """
         return "exports/invoices/"
 
+    @staticmethod
+    def invoice_seq_lock_timeout():
+        """
+        :return: the seconds to wait for the lock of the invoice sequence file on Windows
+                (a batch of invoices holds the lock for its whole export)
+        """
+        return 600
+
+    @staticmethod
+    @contextmanager
+    def invoice_seq_lock() -> Iterator[None]:
+        """
+        Exclusive lock of the invoice sequence file between threads, processes and overlapping runs.
+        A separate '.lock' file is locked because the sequence file itself is replaced on every update
+
+        :return: context manager which holds the lock
+        """
+        # the threads of the process wait for each other here, so the file lock is only taken between processes
+        with BaseInvoice._thread_lock, open(f"{BaseInvoice.invoice_seq_file()}.lock", "a+") as lock_file:
+            if os.name == 'nt':
+                import msvcrt
+                lock_file.seek(0)
+                # LK_LOCK retries for about 10 seconds before it raises an OSError (EDEADLOCK),
+                # a batch of invoices may hold the lock longer, so it is retried up to the timeout.
+                # Other errors (e.g. a bad file descriptor) are raised right away
+                deadline = time.monotonic() + BaseInvoice.invoice_seq_lock_timeout()
+                while True:
+                    try:
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError as error:
+                        if error.errno not in (errno.EDEADLOCK, errno.EACCES):
+                            raise
+                        if time.monotonic() >= deadline:
+                            raise TimeoutError(f"The invoice sequence file is locked by another run for more than "
+                                               f"{BaseInvoice.invoice_seq_lock_timeout()} seconds") from error
+                try:
+                    yield
+                finally:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    @contextmanager
+    def invoice_numbers(count: int) -> Iterator[List[str]]:
+        """
+        Reserves a contiguous block of invoice numbers for a batch of invoices.
+        The lock of the sequence file is held for the whole batch and the next number is written
+        only when the block exits without an error. A failed or killed batch leaves the sequence unchanged,
+        so its numbers are handed out again by the next batch (gap-free), and no other run can take
+        the same numbers in the meantime (no duplicates)
+
+        :param count: number of the invoices
+        :return: context manager with the list of the numbers as strings (for example ['1111112345', '1111112346'])
+        """
+        if count < 1:
+            yield []
+            return
+        seq_file = BaseInvoice.invoice_seq_file()
+        with BaseInvoice.invoice_seq_lock():
+            with open(seq_file, "r") as f:
+                first_number = int(f.readline())
+            yield [str(number) for number in range(first_number, first_number + count)]
+            BaseInvoice.update_invoice_number(seq_file, first_number + count)
+
+    @staticmethod
+    def reserve_invoice_numbers(count: int) -> List[str]:
+        """
+        Reserves a contiguous block of invoice numbers in one locked read-and-update of the sequence file.
+        The numbers are committed right away, so a batch which may fail should use invoice_numbers() instead.
+        The file is replaced atomically, so a crash leaves either the old or the new number, never an empty file
+
+        :param count: number of the invoices
+        :return: list with the reserved numbers as strings (for example ['1111112345', '1111112346'])
+        """
+        with BaseInvoice.invoice_numbers(count) as numbers:
+            pass
+        return numbers
+
     @staticmethod
     def get_invoice_number() -> str:
         """
         It gets a number from a .txt file, adds 1 to be ready for the next invoice seq number
         :return: seq number as a string to be used as invoice number (for example 1111112345)
         """
-        seq_file = BaseInvoice.invoice_seq_file()
-        f = open(seq_file, "r+")
-        value = f.readline()
-        invoice_current_number = value
-        new_number = int(invoice_current_number) + 1
-        f.truncate(0)
-        f.close()
-        BaseInvoice.update_invoice_number(seq_file, new_number)
-        return invoice_current_number
+        return BaseInvoice.reserve_invoice_numbers(1)[0]
 
     @staticmethod
     def update_invoice_number(path, new_number) -> None:
         """
-        Clear the file with the previous invoice number and replaced it with a new number (old number + 1)
+        Replaces the file with the previous invoice number with a new number (old number + the reserved count).
+        The number is written to a temporary file which atomically replaces the old one
         :param path: path to the file which contains one number, the number of the current invoice
         :param new_number: new number with which the old number from the .txt must be replaced (for example 1111111113)
         :return: nothing
         """
-        f = open(path, "r+")
-        f.write(str(new_number))
-        f.close()
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        with open(temp_path, "w") as f:
+            f.write(str(new_number))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
 
     @staticmethod
-    def create_invoice(recipient: str, price: float, data_dict: dict) -> None:
+    def create_invoice(recipient: str, price: float, data_dict: dict, invoice_path: str = None,
+                       invoice_number: str = None) -> None:
         """
         During the data aggregation for the .xlsx reports for each company, this function generates an invoice on a
         employee/service level
@@ -84,10 +192,10 @@ class BaseInvoice:
         :param data_dict: the data from the dataframe, converted into dictionary in the following format:
         {('NICKNAME', 'COMPANY:Description in Bulgarian | Description in English'): quantity(int)}
         example: {('TORADGRA', 'QuantumPeak:Тренинг за лидери на живо | Leadership training in person'): 1}
+        :param invoice_path: relative path for the invoice export folder (default: invoice_filepath())
+        :param invoice_number: already taken invoice number (default: the next number from get_invoice_number())
         :return: nothing
         """
-        # setup language
-        os.environ["INVOICE_LANG"] = "en"
         # create objects for the invoice creation
         client = Client(recipient)
         provider = Provider(summary='CouchMe', address='Couching str. 55A', zip_code='1000', city='Sofia',
@@ -107,7 +215,7 @@ class BaseInvoice:
         invoice.currency = 'BGN'
 
         # a way to use a number for the invoices (alternative right after)
-        invoice.number = BaseInvoice.get_invoice_number()
+        invoice.number = invoice_number if invoice_number is not None else BaseInvoice.get_invoice_number()
 
         # or use manual input
         # invoice.number = 0
@@ -133,7 +241,8 @@ class BaseInvoice:
         document = SimpleInvoice(invoice)
 
         # get the invoice default relative path
-        invoice_path = BaseInvoice.invoice_filepath()
+        if invoice_path is None:
+            invoice_path = BaseInvoice.invoice_filepath()
 
         # generate an invoice
         document.gen(f"{invoice_path}invoice_{recipient}.pdf")
@@ -1,11 +1,16 @@
 # coding: utf8
-import gc
 from abc import ABC, abstractmethod
-from typing import Dict
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import glob
+import os
+from typing import Callable, Dict, List
 import pandas as pd
 import logging
 from project.file_operations import Import, Export, ZipFiles, Clearing
 from project.transformations import Transformation
+from project.cache import TransformationCache
+from project.instrumentation import Instrumentation
 from tqdm import tqdm
 
 logging.basicConfig(filename='info.log', encoding='utf-8',
@@ -29,11 +34,25 @@ class BaseReport(ABC):
 
     Methods
     -------
-    build_report_base() -> Dict[str, pd.DataFrame]:
+    build_report_base(report_path: str = None, limitations_path: str = None, chosen_month: str = None,
+                      cache_mode: str = "use", compact: bool = False) -> Dict[str, pd.DataFrame]:
         Imports two standard files from the local PC which are
         needed fundament/base for the further data validation/transformation
         and returns dataframes objects for different reporting purposes
 
+    create_report_instances(dataframes_dictionary: Dict[str, pd.DataFrame], exports_path: str = "exports/",
+                            workers: int = 0, csv_compression: str = None) -> List[BaseReport]:
+        Creates all report instances in the order of their exporting
+
+    report_dependencies() -> Dict[str, List[str]]:
+        The reports which must be exported before a report (by report name)
+
+    report_outputs() -> Dict[str, List[str]]:
+        The files made by a report (by report name)
+
+    report_files(report_name: str, exports_path: str = "exports/") -> List[str]:
+        Finds the files made by the report (they are ready when the report is exported)
+
     export_report(self):
         An abstract method which links particular Export function to a
         child class instance and trigger the final formatting/conversion
@@ -55,15 +74,122 @@ class BaseReport(ABC):
         self.export_function = export_function
 
     @staticmethod
-    def build_report_base() -> Dict[str, pd.DataFrame]:
+    def build_report_base(report_path: str = None,
+                          limitations_path: str = None,
+                          chosen_month: str = None,
+                          cache_mode: str = "use",
+                          compact: bool = False) -> Dict[str, pd.DataFrame]:
         """
         Transform the monthly and the annual df columns
+        (the missing paths and month are asked from the user).
+        The annual transformations are taken from the TransformationCache
+        when the imports and the code are unchanged (see TransformationCache.cache_modes()).
+        With compact=True the dataframes use categoricals and downcasted integers
         """
-        original_report: pd.DataFrame = Import.import_report()
-        limitations_file: pd.DataFrame = Import.import_limitations()
-        dataframes_dict = Transformation.main(original_report, limitations_file)
+        original_report: pd.DataFrame = Import.import_report(report_path)
+        limitations_file: pd.DataFrame = Import.import_limitations(limitations_path)
+        full_dfs_dict = TransformationCache.full_history(original_report, limitations_file, cache_mode)
+        dataframes_dict = Transformation.monthly(full_dfs_dict, chosen_month)
+        if compact:
+            dataframes_dict = Transformation.compact_dtypes(dataframes_dict)
         return dataframes_dict
 
+    @staticmethod
+    def create_report_instances(dataframes_dictionary: Dict[str, pd.DataFrame],
+                                exports_path: str = "exports/",
+                                workers: int = 0,
+                                csv_compression: str = None) -> List["BaseReport"]:
+        """
+        Creates all report instances in the order of their exporting
+        (the reports which depend on other reports are listed in report_dependencies())
+
+        :param dataframes_dictionary: the dataframes from build_report_base()
+        :param exports_path: relative path of the 'exports' folder
+        :param workers: number of the processes for the invoices and the .docx reports of
+                'Companies' and 'Trainers' (0 or 1 for no process pool) and
+                number of the LibreOffice instances for the PDF conversion of the BulkReports and
+                number of the processes formatting the .csv files
+        :param csv_compression: None for plain .csv files, 'gzip' or 'zstd' (see CsvStream.compressions())
+        :return: list with the report instances
+        """
+        reference_path = f"{exports_path}for_reference/"
+        templates_path = f"{exports_path}from_templates/"
+        pool_options = {'workers': workers}
+        csv_options = {'compression': csv_compression, 'workers': workers}
+        return [
+            Report("Raw_Full", reference_path, "df_to_csv", "full_raw_report_df", dataframes_dictionary, csv_options),
+            Report("Raw_Mont", reference_path, "df_to_csv", "monthly_raw_report_df", dataframes_dictionary,
+                   csv_options),
+            Report("New_Full", reference_path, "df_to_csv", "new_full_data_df", dataframes_dictionary, csv_options),
+            Report("New_Mont", reference_path, "df_to_csv", "new_monthly_data_df", dataframes_dictionary,
+                   csv_options),
+            Report("Companies", exports_path, "companies_df_to_excel", "new_monthly_data_df", dataframes_dictionary,
+                   pool_options),
+            Report("Companies_Out_Of_Scope", exports_path, "companies_df_to_excel", "new_monthly_data_df",
+                   dataframes_dictionary, pool_options),
+            Report("Trainers", exports_path, "trainers_df_to_excel", "new_monthly_data_df", dataframes_dictionary,
+                   pool_options),
+            MultiReport("Generic", reference_path, "generic_df_to_excel", dataframes_dictionary),
+            Report("Stats_Mont", reference_path, "stats_mont_df_to_excel", "monthly_stats_cube",
+                   dataframes_dictionary),
+            Report("Stats_Full", reference_path, "stats_full_df_to_excel", "full_stats_cube", dataframes_dictionary),
+            BulkReport("by_calendar", f"{templates_path}by_calendar", "convert_docx_to_pdf", pool_options),
+            BulkReport("by_company", f"{templates_path}by_company", "convert_docx_to_pdf", pool_options),
+            BulkReport("by_company_x", f"{templates_path}by_company_x", "convert_docx_to_pdf", pool_options),
+        ]
+
+    @staticmethod
+    def report_dependencies() -> Dict[str, List[str]]:
+        """
+        The explicit report graph: the reports which must be exported before a report.
+        The reports which are not in the dictionary do not depend on other reports
+
+        :return: dictionary with the names of the needed reports by report name
+        """
+        return {
+            # the invoice numbers of the out of scope companies follow the ones of the companies in scope
+            "Companies_Out_Of_Scope": ["Companies"],
+            # the BulkReports convert the .docx reports made by 'Companies', 'Companies_Out_Of_Scope' and 'Trainers'
+            "by_calendar": ["Trainers"],
+            "by_company": ["Companies", "Companies_Out_Of_Scope"],
+            "by_company_x": ["Companies", "Companies_Out_Of_Scope"],
+        }
+
+    @staticmethod
+    def report_outputs() -> Dict[str, List[str]]:
+        """
+        The files made by a report as glob patterns relative to the 'exports' folder
+        (a file must not match the patterns of a report which may run at the same time)
+
+        :return: dictionary with the glob patterns by report name
+        """
+        company_files = ["invoices/*", "from_templates/by_company/*.docx", "from_templates/by_company_x/*.docx"]
+        return {
+            "Raw_Full": ["for_reference/Raw_Full.csv*"],
+            "Raw_Mont": ["for_reference/Raw_Mont.csv*"],
+            "New_Full": ["for_reference/New_Full.csv*"],
+            "New_Mont": ["for_reference/New_Mont.csv*"],
+            "Companies": ["Companies.xlsx", *company_files],
+            "Companies_Out_Of_Scope": ["Companies_Out_Of_Scope.xlsx", *company_files],
+            "Trainers": ["Trainers.xlsx", "from_templates/by_calendar/*.docx"],
+            "Generic": ["for_reference/Generic.xlsx"],
+            "Stats_Mont": ["for_reference/Stats_Mont.xlsx"],
+            "Stats_Full": ["for_reference/Stats_Full.xlsx"],
+            "by_calendar": ["from_templates/by_calendar/PDFs/*.pdf"],
+            "by_company": ["from_templates/by_company/PDFs/*.pdf"],
+            "by_company_x": ["from_templates/by_company_x/PDFs/*.pdf"],
+        }
+
+    @staticmethod
+    def report_files(report_name: str, exports_path: str = "exports/") -> List[str]:
+        """
+        :param report_name: the name of the report
+        :param exports_path: relative path of the 'exports' folder
+        :return: paths of the existing files which match the report_outputs() of the report
+        """
+        return sorted(file for pattern in BaseReport.report_outputs().get(report_name, [])
+                      for file in glob.glob(os.path.join(exports_path, pattern)) if os.path.isfile(file))
+
     def get_function_by_name(self):
         function = [f[1] for f in BaseReport._export_functions_dict.items()
                     if f[0] == self.export_function][0]
@@ -94,6 +220,10 @@ class Report(BaseReport):
         the function from project.transformations Export which handle the report exporting
     df_name : str
         the dataframe variable name which links the dataframe object itself
+    df_dict : Dict[str, pd.DataFrame]
+        the dictionary with all dataframes from build_report_base()
+    export_options : dict
+        additional keyword arguments for the export function (e.g. 'workers')
 
     Methods
     -------
@@ -106,16 +236,20 @@ class Report(BaseReport):
         in the dataframes dictionary
     """
 
-    def __init__(self, name, path: str, export_function: str, df_name: str = ""):
+    def __init__(self, name, path: str, export_function: str, df_name: str = "",
+                 df_dict: Dict[str, pd.DataFrame] = None, export_options: dict = None):
         super().__init__(name, path, export_function)
         self.df_name = df_name
+        self.df_dict = df_dict
+        self.export_options = export_options or {}
 
     def get_dataframe_obj(self):
-        dataframe_obj = [d[1] for d in dataframes_dictionary.items()
+        dataframe_obj = [d[1] for d in self.df_dict.items()
                          if d[0] == self.df_name][0]
 
         return dataframe_obj
 
+    @Instrumentation.measured
     def export_report(self):
         """
         Find the needed dataframe and execute the right function for this class object
@@ -123,7 +257,7 @@ class Report(BaseReport):
         logging.info(f"Initiate exporting of the {self.name} report")
         function = self.get_function_by_name()
         df_obj = self.get_dataframe_obj()
-        function(self.name, df_obj, self.path)
+        function(self.name, df_obj, self.path, **self.export_options)
         logging.info(f"Exporting of the {self.name} report was successfully done")
 
 
@@ -140,6 +274,8 @@ class BulkReport(BaseReport):
        a string with the target export path
    export_function : str
        the function from project.transformations Export which handle the report exporting
+   export_options : dict
+       additional keyword arguments for the export function (e.g. 'workers')
 
    Methods
    -------
@@ -152,16 +288,18 @@ class BulkReport(BaseReport):
        in the dataframes dictionary
    """
 
-    def __init__(self, name, path: str, export_function: str):
+    def __init__(self, name, path: str, export_function: str, export_options: dict = None):
         super().__init__(name, path, export_function)
+        self.export_options = export_options or {}
 
+    @Instrumentation.measured
     def export_report(self):
         """
         Find and execute the right function for this class object
         """
         logging.info(f"Initiate exporting of the {self.name} report")
         function = self.get_function_by_name()
-        function(self.path)
+        function(self.path, **self.export_options)
         logging.info(f"Exporting of the {self.name} report was successfully done")
 
 
@@ -188,6 +326,7 @@ class MultiReport(BaseReport):
         super().__init__(name, path, export_function)
         self.df_dict = df_dict
 
+    @Instrumentation.measured
     def export_report(self):
         """
         Find and execute the right function for this class object
@@ -197,33 +336,200 @@ class MultiReport(BaseReport):
         function(self.name, self.df_dict, self.path)
         logging.info(f"Exporting of the {self.name} report was successfully done")
 
-if __name__ =='__main__':
-
-    # Remove all files in the 'exports' folder and sub-folders saved during previous runs
-    Clearing.delete_files_from_export_subfolders()
-
-    # Get a dictionary with the based on the imported initial report dataframes
-    dataframes_dictionary = BaseReport.build_report_base()
-
-    # Create all report instances
-    raw_full = Report("Raw_Full", "exports/for_reference/", "df_to_csv", "full_raw_report_df")
-    raw_mont = Report("Raw_Mont", "exports/for_reference/", "df_to_csv", "monthly_raw_report_df")
-    new_full = Report("New_Full", "exports/for_reference/", "df_to_csv", "new_full_data_df")
-    new_mont = Report("New_Mont", "exports/for_reference/", "df_to_csv", "new_monthly_data_df")
-    companies = Report("Companies", "exports/", "companies_df_to_excel", "new_monthly_data_df")
-    companies_out_of_scope = Report("Companies_Out_Of_Scope", "exports/", "companies_df_to_excel", "new_monthly_data_df")
-    trainers = Report("Trainers", "exports/", "trainers_df_to_excel", "new_monthly_data_df")
-    generic = MultiReport("Generic", "exports/for_reference/", "generic_df_to_excel", dataframes_dictionary)
-    stats_mont = Report("Stats_Mont", "exports/for_reference/", "stats_mont_df_to_excel", "new_monthly_data_df")
-    stats_full = Report("Stats_Full", "exports/for_reference/", "stats_full_df_to_excel", "new_full_data_df")
-    by_calendar = BulkReport("by_calendar", "exports/from_templates/by_calendar", "convert_docx_to_pdf")
-    by_company = BulkReport("by_company", "exports/from_templates/by_company", "convert_docx_to_pdf")
-    by_company_x = BulkReport("by_company_x", "exports/from_templates/by_company_x", "convert_docx_to_pdf")
-
-    # Get a list of all report instances and initiate progress tracking
-    report_instances = [r for r in gc.get_objects() if isinstance(r, BaseReport)]
-    for i in tqdm(range(len(report_instances))):
-        report_instances[i].export_report()
-
-    # Zip all files and folders in 'exports' folder
-    ZipFiles.zip_export_folder()
+
+class ReportScheduler:
+    """Class used to export the reports in the order of the report graph (BaseReport.report_dependencies()).
+        The reports without pending dependencies run concurrently on a thread pool
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        report_names(report_instances: List[BaseReport], names: List[str]) -> List[str]:
+            Matches the given names (case insensitive) with the report names
+
+        select(report_instances: List[BaseReport], dependencies: Dict[str, List[str]], only: List[str] = None,
+               skip: List[str] = None) -> List[BaseReport]:
+            Selects a subset of the reports (with their dependencies, without the dependents of the skipped ones)
+
+        ordered(report_instances: List[BaseReport], dependencies: Dict[str, List[str]]) -> List[BaseReport]:
+            Sorts the reports so every report follows its dependencies
+
+        run(report_instances: List[BaseReport], dependencies: Dict[str, List[str]], workers: int = 0,
+            desc: str = None, on_done: Callable[[BaseReport], None] = None) -> None:
+            Exports the reports sequentially or on a thread pool
+    """
+
+    @staticmethod
+    def report_names(report_instances: List[BaseReport], names: List[str]) -> List[str]:
+        """
+        :param report_instances: the report instances
+        :param names: report names in any case
+        :return: the matching report names
+        :raises ValueError: for unknown report names
+        """
+        names_by_lower = {report.name.lower(): report.name for report in report_instances}
+        unknown = [name for name in names if name.lower() not in names_by_lower]
+        if unknown:
+            raise ValueError(f"Unknown reports: {', '.join(unknown)} "
+                             f"(available: {', '.join(names_by_lower.values())})")
+        return [names_by_lower[name.lower()] for name in names]
+
+    @staticmethod
+    def select(report_instances: List[BaseReport],
+               dependencies: Dict[str, List[str]],
+               only: List[str] = None,
+               skip: List[str] = None) -> List[BaseReport]:
+        """
+        Selects a subset of the reports: 'only' adds the reports which the selected ones depend on,
+        'skip' removes also the reports which depend on the skipped ones
+
+        :param report_instances: the report instances
+        :param dependencies: the report graph (BaseReport.report_dependencies())
+        :param only: names of the reports to export (all reports if missing)
+        :param skip: names of the reports not to export
+        :return: the selected report instances in their original order
+        :raises ValueError: for unknown report names
+        """
+        selected = {report.name for report in report_instances}
+        if only:
+            selected = set()
+            pending = ReportScheduler.report_names(report_instances, only)
+            while pending:
+                name = pending.pop()
+                if name not in selected:
+                    selected.add(name)
+                    pending.extend(dependencies.get(name, []))
+        if skip:
+            skipped = set(ReportScheduler.report_names(report_instances, skip))
+            changed = True
+            while changed:
+                dependents = {name for name in selected - skipped
+                              if skipped.intersection(dependencies.get(name, []))}
+                changed = bool(dependents)
+                skipped |= dependents
+            selected -= skipped
+        return [report for report in report_instances if report.name in selected]
+
+    @staticmethod
+    def ordered(report_instances: List[BaseReport], dependencies: Dict[str, List[str]]) -> List[BaseReport]:
+        """
+        Sorts the reports so every report follows its dependencies
+        (otherwise the original order is kept, the dependencies outside of the list are ignored)
+
+        :param report_instances: the report instances
+        :param dependencies: the report graph (BaseReport.report_dependencies())
+        :return: the sorted report instances
+        :raises ValueError: if the dependencies are circular
+        """
+        names = {report.name for report in report_instances}
+        pending = {report.name: set(dependencies.get(report.name, [])) & names for report in report_instances}
+        ordered_reports = []
+        while pending:
+            ready = [report for report in report_instances if report.name in pending and not pending[report.name]]
+            if not ready:
+                raise ValueError(f"Circular report dependencies: {', '.join(pending)}")
+            report = ready[0]
+            ordered_reports.append(report)
+            del pending[report.name]
+            for needed in pending.values():
+                needed.discard(report.name)
+        return ordered_reports
+
+    @staticmethod
+    def run(report_instances: List[BaseReport],
+            dependencies: Dict[str, List[str]],
+            workers: int = 0,
+            desc: str = None,
+            on_done: Callable[[BaseReport], None] = None) -> None:
+        """
+        Exports the reports in the order of the report graph.
+        With workers > 1 every report starts on a thread pool as soon as its dependencies are done,
+        the reports which depend on a failed report are not started
+        and the first error is raised when the running reports are done
+
+        :param report_instances: the report instances
+        :param dependencies: the report graph (BaseReport.report_dependencies())
+        :param workers: number of the threads (0 or 1 to export the reports one by one)
+        :param desc: the description of the progress bar
+        :param on_done: called (in the current thread) with every successfully exported report
+        :return: None
+        """
+        ordered_reports = ReportScheduler.ordered(report_instances, dependencies)
+        with tqdm(total=len(ordered_reports), desc=desc) as progress:
+            if workers <= 1:
+                for report in ordered_reports:
+                    report.export_report()
+                    progress.update()
+                    if on_done:
+                        on_done(report)
+                return
+
+            names = {report.name for report in ordered_reports}
+            pending = {report.name: set(dependencies.get(report.name, [])) & names for report in ordered_reports}
+            reports_by_name = {report.name: report for report in ordered_reports}
+            errors = {}
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                running = {}
+                while pending or running:
+                    for report in ordered_reports:
+                        if report.name in pending and not pending[report.name]:
+                            del pending[report.name]
+                            running[executor.submit(report.export_report)] = report.name
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        progress.update()
+                        if future.exception() is not None:
+                            errors[name] = future.exception()
+                            logging.error(f"Exporting of the {name} report failed: {future.exception()!r}")
+                            continue
+                        for needed in pending.values():
+                            needed.discard(name)
+                        if on_done:
+                            on_done(reports_by_name[name])
+
+            if pending:
+                logging.error(f"Not exported because of failed dependencies: {', '.join(pending)}")
+            if errors:
+                raise next(iter(errors.values()))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Export the reports")
+    parser.add_argument('--only', nargs='+', help="export only these reports (and the reports they depend on)")
+    parser.add_argument('--skip', nargs='+', help="do not export these reports (and the reports depending on them)")
+    parser.add_argument('--report-workers', type=int, default=0,
+                        help="number of the threads for the independent reports (0 to export them one by one)")
+    parser.add_argument('--metrics', help="measure the stages: append them to this JSON lines file "
+                                          "and print a summary table at the end")
+    arguments = parser.parse_args()
+    if arguments.metrics:
+        Instrumentation.enable(arguments.metrics)
+    try:
+        # Remove all files in the 'exports' folder and sub-folders saved during previous runs
+        Clearing.delete_files_from_export_subfolders()
+
+        # Get a dictionary with the based on the imported initial report dataframes
+        dataframes_dictionary = BaseReport.build_report_base()
+
+        # Create the selected report instances
+        report_graph = BaseReport.report_dependencies()
+        report_instances = ReportScheduler.select(BaseReport.create_report_instances(dataframes_dictionary),
+                                                  report_graph, arguments.only, arguments.skip)
+
+        # Export the reports in the order of the report graph (with progress tracking)
+        ReportScheduler.run(report_instances, report_graph, arguments.report_workers)
+
+        # Zip all files and folders in 'exports' folder
+        ZipFiles.zip_export_folder()
+    finally:
+        # the metrics of a failed run are also closed and summarized
+        if arguments.metrics:
+            Instrumentation.disable()
+            Instrumentation.log_summary()
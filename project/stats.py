@@ -0,0 +1,134 @@
+# coding: utf8
+from typing import List
+import pandas as pd
+from project.instrumentation import Instrumentation
+from project.dimensions import Dimensions
+
+
+class StatsCube:
+    """Class used to pre-aggregate the trainings once per run in a small count/sum cube
+        (company x trainer x nickname x year x month x short_type x bgn_per_hour).
+        The Stats_Mont and Stats_Full sheets are derived from the cube instead of scanning the whole dataframes,
+        so a new stats sheet over these dimensions costs a group-by of the cube only
+
+        Attributes
+        ----------
+        No attributes
+
+        Methods
+        -------
+        dimensions() -> List[str]:
+            :return: the columns by which the trainings are aggregated
+
+        measures() -> List[str]:
+            :return: the aggregated columns of the cube
+
+        build(df: pd.DataFrame) -> pd.DataFrame:
+            Aggregates the trainings of the dataframe in a cube
+
+        period(cube: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+            Takes the part of the cube with the year/month periods of the dataframe
+
+        plain(cube: pd.DataFrame) -> pd.DataFrame:
+            Converts the categoricals and the downcasted integers of the cube back to plain values
+
+        value_counts(cube: pd.DataFrame, keys: List[str], normalize: bool = False,
+                     measure: str = 'count') -> pd.Series:
+            The DataFrame.value_counts() of the original dataframe computed from the cube
+    """
+
+    @staticmethod
+    def dimensions() -> List[str]:
+        """
+        :return: the columns by which the trainings are aggregated
+        """
+        return ['company', 'trainer', 'nickname', 'year', 'month', 'short_type', 'bgn_per_hour']
+
+    @staticmethod
+    def measures() -> List[str]:
+        """
+        :return: the aggregated columns of the cube:
+                'count' - number of the trainings
+                'concat_emp_company' - number of the trainings with employee|company value
+                'bgn_sum' - sum of the paid rates (NaN for the trainings without a rate)
+                'one_session' - number of the trainings of employees with only one session
+        """
+        return ['count', 'concat_emp_company', 'bgn_sum', 'one_session']
+
+    @staticmethod
+    @Instrumentation.measured
+    def build(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Aggregates the trainings of the dataframe in a cube (one full scan of the dataframe).
+        The missing trainer/short_type/rate values are kept as a separate group,
+        so every training is counted in the cube. The rate is a dimension, so the trainings without a rate
+        keep a NaN 'bgn_sum' and are left out of the pivot_table() margins as in the original dataframe.
+        The company, trainer and nickname are grouped by their integer keys (Dimensions)
+        and their labels are joined back to the cube
+
+        :param df: new_full_data_df (or any dataframe with its columns)
+        :return: dataframe with the dimensions() and the measures() columns
+        """
+        keys = {column: key for column, key in Dimensions.key_columns().items() if key in df.columns}
+        one_session = (df['returns_or_not'] == 'only one session').astype('int64')
+        cube = df.assign(one_session=one_session) \
+            .groupby([keys.get(column, column) for column in StatsCube.dimensions()],
+                     dropna=False, sort=False, observed=True) \
+            .agg(count=('company', 'size'),
+                 concat_emp_company=('concat_emp_company', 'count'),
+                 bgn_sum=('bgn_per_hour', 'sum'),
+                 one_session=('one_session', 'sum')) \
+            .reset_index()
+        for column, key in keys.items():
+            cube[key] = Dimensions.take(Dimensions.labels(df, key, column), cube[key].to_numpy())
+        cube = cube.rename(columns={key: column for column, key in keys.items()})
+        # the rates of a cell are all missing or all present
+        cube['bgn_sum'] = cube['bgn_sum'].where(cube['bgn_per_hour'].notna())
+        return cube
+
+    @staticmethod
+    def period(cube: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        :param cube: the cube of the full history
+        :param df: the dataframe of the period (e.g. new_monthly_data_df)
+        :return: the part of the cube with the year/month values of the dataframe
+        """
+        periods = df[['year', 'month']].drop_duplicates()
+        return cube.merge(periods, on=['year', 'month'], how='inner')
+
+    @staticmethod
+    def plain(cube: pd.DataFrame) -> pd.DataFrame:
+        """
+        The cube may be converted by Transformation.compact_dtypes(), the categoricals are aggregated
+        as plain values (otherwise the results include the unobserved categories and are not sorted)
+
+        :param cube: the cube
+        :return: the cube with object instead of categorical dimensions and int64 measures
+        """
+        dtypes = {column: object for column in cube.select_dtypes('category').columns}
+        dtypes.update({column: 'int64' for column in ['count', 'concat_emp_company', 'one_session']})
+        return cube.astype(dtypes)
+
+    @staticmethod
+    def value_counts(cube: pd.DataFrame, keys: List[str], normalize: bool = False,
+                     measure: str = 'count') -> pd.Series:
+        """
+        The DataFrame.value_counts() of the original dataframe computed from the cube:
+        the counts of the observed key combinations (without missing keys), sorted in descending order
+
+        :param cube: the cube (after plain())
+        :param keys: the dimensions to count by
+        :param normalize: return the proportions instead of the counts
+        :param measure: 'count' for all trainings or 'one_session' for the trainings of the employees
+                with only one session
+        :return: the same Series as df[keys].value_counts(normalize=normalize) of the original dataframe
+        """
+        cube = cube[cube[measure] > 0]
+        counts = cube.groupby(keys)[measure].sum().rename(None)
+        counts = counts.sort_values(ascending=False)
+        if normalize:
+            counts /= counts.sum()
+        # DataFrame.value_counts() has MultiIndex also for a single column
+        if len(keys) == 1:
+            counts.index = pd.MultiIndex.from_arrays([counts.index], names=[counts.index.name])
+        return counts
@@ -1,6 +1,72 @@
-from typing import List
+from functools import lru_cache
+import io
+from typing import Dict, List
 import pandas as pd
 from docxtpl import DocxTemplate
+from jinja2 import Environment, Template
+from project._collections import Collection
+from project.dataframes import BaseDataframe
+
+
+class CachingEnvironment(Environment):
+    """jinja2 Environment which compiles every template source only once per process.
+        The .docx templates are rendered once per company/trainer, so the same xml sources
+        are compiled again and again without the cache
+
+        Attributes
+        ----------
+        compiled_templates: Dict[str, Template]
+            the compiled templates by their source
+
+        Methods
+        -------
+        from_string(source, globals=None, template_class=None) -> Template:
+            Returns the compiled template of the source (compiles it on the first call only)
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.compiled_templates: Dict[str, Template] = {}
+
+    def from_string(self, source, globals=None, template_class=None) -> Template:
+        """
+        :param source: the jinja2 source
+        :param globals: extra globals for the template (the template is not cached with them)
+        :param template_class: the template class (the template is not cached with it)
+        :return: the compiled template
+        """
+        if globals is not None or template_class is not None or not isinstance(source, str):
+            return super().from_string(source, globals, template_class)
+        template = self.compiled_templates.get(source)
+        if template is None:
+            template = self.compiled_templates[source] = super().from_string(source)
+        return template
+
+
+class CachedDocxTemplate(DocxTemplate):
+    """DocxTemplate which patches (cleans) the xml of a template part only once per process.
+        The patched xml depends only on the source xml, so it is shared by all rendered documents
+
+        Attributes
+        ----------
+        patched_xml: Dict[str, str]
+            the patched xml by the source xml (class attribute shared by all instances)
+
+        Methods
+        -------
+        patch_xml(src_xml: str) -> str:
+            Returns the jinja2 ready xml of the source xml (patches it on the first call only)
+    """
+    patched_xml: Dict[str, str] = {}
+
+    def patch_xml(self, src_xml: str) -> str:
+        """
+        :param src_xml: the xml of a template part
+        :return: the xml understandable by jinja2 (see DocxTemplate.patch_xml())
+        """
+        patched_xml = CachedDocxTemplate.patched_xml.get(src_xml)
+        if patched_xml is None:
+            patched_xml = CachedDocxTemplate.patched_xml[src_xml] = super().patch_xml(src_xml)
+        return patched_xml
 
 
 class ReportFromTemplate:
@@ -8,6 +74,7 @@ class ReportFromTemplate:
         .docx template.
         By idea it serves the BulkReport report class and creates separate
         reports for each company or trainer filtered in the new monthly dataframe.
+        The templates are read, cleaned and compiled once per process and reused for every report
 
         Attributes
         ----------
@@ -15,20 +82,37 @@ class ReportFromTemplate:
 
         Methods
         -------
-        create_by_calendar_report_from_docx_template(name: str, df: pd.DataFrame, total_hours: float, total_pay: float
-                                                    ) -> None:
+        template_kinds() -> List[str]:
+            :return: the kinds of the .docx templates ('by_calendar', 'by_company', 'by_company_x')
+
+        template_bytes(kind: str) -> bytes:
+            Reads the .docx template of the kind once per process
+
+        jinja_env() -> CachingEnvironment:
+            :return: the jinja2 environment shared by all rendered reports of the process
+
+        rows(df: pd.DataFrame) -> List[list]:
+            :return: the records of the dataframe as lists with the dates as text (the 'invoice_list' of the templates)
+
+        create_report_from_docx_template(kind: str, name: str, df: pd.DataFrame, context: dict,
+                                         exports_path: str = "exports/") -> None:
+            Render the template of the kind with the records of the dataframe and the context and save the report
+
+        create_by_calendar_report_from_docx_template(name: str, df: pd.DataFrame, total_hours: float, total_pay: float,
+                                                     exports_path: str = "exports/") -> None:
 
             Render and save a separate .docx report for every trainer by his/her name
 
         create_by_company_report_from_docx_template(company: str, df: pd.DataFrame, total_hours: float, start_date,
-                                                    end_date ) -> None:
+                                                    end_date, exports_path: str = "exports/") -> None:
 
             Render and save a separate .docx report for every company by name and
             is_valid column (excludes out of scope services).
             *with more details compared with the by_company_x template
 
         create_by_company_x_report_from_docx_template(company: str, df: pd.DataFrame, total_hours: float,
-                                                      start_date, end_date):
+                                                      start_date, end_date,
+                                                      exports_path: str = "exports/"):
 
             Render and save a separate .docx report for every company by name and
             is_valid column (excludes out of scope services)
@@ -36,10 +120,78 @@ class ReportFromTemplate:
             **with less details compared with the by_company_x template
         """
     @staticmethod
+    def template_kinds() -> List[str]:
+        """
+        :return: the kinds of the .docx templates, the template of a kind is 'imports/Reports_{kind}.docx'
+        """
+        return ['by_calendar', 'by_company', 'by_company_x']
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def template_bytes(kind: str) -> bytes:
+        """
+        Reads the .docx template of the kind once per process
+
+        :param kind: one of the template_kinds()
+        :return: the content of the .docx template
+        :raises ValueError: for unknown kind
+        """
+        if kind not in ReportFromTemplate.template_kinds():
+            raise ValueError(f"Unknown template kind '{kind}'")
+        with open(f"imports/Reports_{kind}.docx", 'rb') as file:
+            return file.read()
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def jinja_env() -> CachingEnvironment:
+        """
+        :return: the jinja2 environment shared by all rendered reports of the process
+        """
+        return CachingEnvironment()
+
+    @staticmethod
+    def rows(df: pd.DataFrame) -> List[list]:
+        """
+        row_list combined with the {{...}} values from the templates
+        are the magic of the looping trough the records and
+        replacing/adding them in the template
+
+        :param df: the records of the report
+        :return: the records as lists with the values in the order of the columns
+                (the datetime columns formatted as text, see BaseDataframe.format_dates())
+        """
+        df = BaseDataframe.format_dates(df)
+        return [list(row) for row in df.itertuples(index=False, name=None)]
+
+    @staticmethod
+    def create_report_from_docx_template(kind: str,
+                                         name: str,
+                                         df: pd.DataFrame,
+                                         context: dict,
+                                         exports_path: str = "exports/"
+                                         ) -> None:
+        """
+        Renders the .docx template of the kind with the records of the dataframe as 'invoice_list'
+        and the rest of the context and saves the report
+        as 'from_templates/{kind}/Reports_{kind}_{name}.docx' in the 'exports' folder
+
+        :param kind: one of the template_kinds()
+        :param name: the name of the company or trainer
+        :param df: the records of the report
+        :param context: the other {{...}} values of the template
+        :param exports_path: relative path of the 'exports' folder
+        :return: None
+        """
+        doc = CachedDocxTemplate(io.BytesIO(ReportFromTemplate.template_bytes(kind)))
+        doc.render({**context, "invoice_list": ReportFromTemplate.rows(df)}, ReportFromTemplate.jinja_env())
+        doc.save(f"{exports_path}from_templates/{kind}/Reports_{kind}_{name}.docx")
+
+    @staticmethod
     def create_by_calendar_report_from_docx_template(name: str,
                                                      df: pd.DataFrame,
                                                      total_hours: float,
-                                                     total_pay: float
+                                                     total_pay: float,
+                                                     exports_path: str = "exports/"
                                                      ) -> None:
         """
         The function gets filtered and aggregated data from the
@@ -52,22 +204,11 @@ class ReportFromTemplate:
         :param df: The dataframe records filtered by the name of the trainer
         :param total_hours: The sum of the total hours/trainings for the particular trainer
         :param total_pay: total_hours multiplied by bgn_per_hour dataframe column value (depends on company contract)
+        :param exports_path: relative path of the 'exports' folder
         :return: None
         """
         # get the Month-Year report period
-        period = str(df['training_datetime'].iloc[0])[3:11]
-
-        # Make variable with the template object with the path to the .docx template
-        doc = DocxTemplate("imports/Reports_by_calendar.docx")
-
-        # row_list combined with the {{...}} values from the template
-        # are the magic of the looping trough the records and
-        # replacing/adding them in the template
-        row_list: List[list] = []
-        df_columns = df.columns
-        for i in df.index:
-            row = [df[col][i] for col in df_columns]
-            row_list.append(row)
+        period = df['training_datetime'].iloc[0].strftime(Collection.period_format())
 
         total_hours = int(total_hours)
         total_hours_sum = f"{total_pay:.2f}"
@@ -75,24 +216,23 @@ class ReportFromTemplate:
         minus_value = 0
         to_receive = f"{(float(total_hours_sum) - minus_value):.2f}"
 
-        doc.render({
+        ReportFromTemplate.create_report_from_docx_template('by_calendar', name, df, {
             "calendar": name,
             "period": period,
-            "invoice_list": row_list,
             "status": "Проведен",
             "total_hours": total_hours,
             "total_hours_sum": total_hours_sum,
             "minus_description": minus_description,
             "minus_value": minus_value,
             "to_receive": to_receive,
-        })
-        doc.save(f"exports/from_templates/by_calendar/Reports_by_calendar_{name}.docx")
+        }, exports_path)
 
     @staticmethod
     def create_by_company_report_from_docx_template(company: str,
                                                     df: pd.DataFrame,
                                                     total_hours: float,
-                                                    start_date, end_date
+                                                    start_date, end_date,
+                                                    exports_path: str = "exports/"
                                                     ) -> None:
         """
         The function gets filtered and aggregated data from the
@@ -106,21 +246,9 @@ class ReportFromTemplate:
         :param total_hours: The sum of the total hours/trainings for all of the company employees
         :param start_date: the first available date of employee training for the current month
         :param end_date: the last available date of employee training for the current month
+        :param exports_path: relative path of the 'exports' folder
         :return: None
         """
-
-        # Make variable with the template object with the path to the .docx template
-        doc = DocxTemplate("imports/Reports_by_company.docx")
-
-        # row_list combined with the {{...}} values from the template
-        # are the magic of the looping trough the records and
-        # replacing/adding them in the template
-        row_list: List[list] = []
-        df_columns = df.columns
-        for i in df.index:
-            row = [df[col][i] for col in df_columns]
-            row_list.append(row)
-
         total_hours = int(total_hours)
 
         # empty strings can be used in future
@@ -130,26 +258,24 @@ class ReportFromTemplate:
         default = 0
         total_used = total_hours
 
-        doc.render({
-
+        ReportFromTemplate.create_report_from_docx_template('by_company', company, df, {
             "company": company,
             "period_start": start_date,
             "period_end": end_date,
-            "invoice_list": row_list,
             "total_hours": total_hours,
             "prepaid": prepaid,
             "remaining": remaining,
             "default": default,
             "upcoming": upcoming,
             "total_used": total_used,
-        })
-        doc.save(f"exports/from_templates/by_company/Reports_by_company_{company}.docx")
+        }, exports_path)
 
     @staticmethod
     def create_by_company_x_report_from_docx_template(company: str,
                                                       df: pd.DataFrame,
                                                       total_hours: float,
-                                                      start_date, end_date):
+                                                      start_date, end_date,
+                                                      exports_path: str = "exports/"):
         """
         The function gets filtered and aggregated data from the
         'new_monthly_data_df' for every company,
@@ -162,35 +288,21 @@ class ReportFromTemplate:
         :param total_hours: The sum of the total hours/trainings for all of the company employees
         :param start_date: the first available date of employee training for the current month
         :param end_date: the last available date of employee training for the current month
+        :param exports_path: relative path of the 'exports' folder
         :return: None
         """
-
-        # Make variable with the template object with the path to the .docx template
-        doc = DocxTemplate("imports/Reports_by_company_x.docx")
-
-        # row_list combined with the {{...}} values from the template
-        # are the magic of the looping trough the records and
-        # replacing/adding them in the template
-        row_list: List[list] = []
-        df_columns = df.columns
-        for i in df.index:
-            row = [df[col][i] for col in df_columns]
-            row_list.append(row)
-
         total_hours = int(total_hours)
         # empty string can be used in future
         upcoming = ""
         default = 0
         total_used = total_hours
 
-        doc.render({
+        ReportFromTemplate.create_report_from_docx_template('by_company_x', company, df, {
             "company": company,
             "period_start": start_date,
             "period_end": end_date,
-            "invoice_list": row_list,
             "total_hours": total_hours,
             "default": default,
             "upcoming": upcoming,
             "total_used": total_used,
-        })
-        doc.save(f"exports/from_templates/by_company_x/Reports_by_company_x_{company}.docx")
+        }, exports_path)
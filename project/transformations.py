@@ -1,8 +1,13 @@
 import re
 from datetime import datetime
+from typing import Dict
+import numpy as np
 import pandas as pd
 from project._collections import Collection
 from project.dataframes import BaseDataframe
+from project.stats import StatsCube
+from project.dimensions import Dimensions
+from project.instrumentation import Instrumentation
 
 
 class Transformation:
@@ -14,20 +19,84 @@ class Transformation:
 
         Methods
         -------
-        annual_to_monthly_report_df(report_dataframe: pd.DataFrame, datetime_format: str) -> pd.DataFrame:
+        month_index(report_dataframe: pd.DataFrame) -> Dict[str, np.ndarray]:
+            Partitions the rows by the year-month of 'start_time' in a single pass
+
+        period_report_df(report_dataframe: pd.DataFrame, first_month: str, last_month: str = None,
+                         month_index: Dict[str, np.ndarray] = None) -> pd.DataFrame:
+            Takes the rows of a month or of a range of months (e.g. a quarter) using the month index
+
+        annual_to_monthly_report_df(report_dataframe: pd.DataFrame, datetime_format: str,
+                                    chosen_month: str = None,
+                                    month_index: Dict[str, np.ndarray] = None) -> pd.DataFrame:
             The function takes a piece from the data
             which is related only for the chosen from the user month
             and creates the raw dataframe for the monthly reports: 'monthly_raw_report_df'
 
-        main(dataframe: pd.DataFrame, limitations_dataframe: pd.DataFrame) -> dict:
+        main(dataframe: pd.DataFrame, limitations_dataframe: pd.DataFrame, chosen_month: str = None) -> dict:
             Uses the original .csv imported reports (initial report and the limitations files)
             to control the transformation of the dataframes
             (BaseDataframe functions + adding additional series/columns)
+
+        full_history(dataframe: pd.DataFrame, limitations_dataframe: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+            Runs the BaseDataframe transformations on the whole history
+            (the month independent part of main())
+
+        full_history_dfs(full_raw_report_df: pd.DataFrame, limitations_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+            Defines the full history dataframes (and the full stats cube) from the transformed raw dataframe
+
+        monthly(full_dfs_dict: Dict[str, pd.DataFrame], chosen_month: str = None,
+                month_index: Dict[str, np.ndarray] = None) -> Dict[str, pd.DataFrame]:
+            Takes the chosen month from the full history dataframes
+            and creates the dataframes dictionary for further reporting use
+
+        compact_dtypes(dfs_dict: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+            Opt-in compact representation of the dataframes from main():
+            categoricals for the low-cardinality columns and downcasted integers
+        """
+
+    @staticmethod
+    def month_index(report_dataframe: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """
+        Partitions the rows by the year-month of 'start_time' in a single pass,
+        so any month (or range of months) is taken with a direct lookup instead of a scan of the whole history.
+        Build it once and pass it to monthly() when more than one month is reported
+
+        :param report_dataframe: the (transformed) general report with 'start_time' column
+        :return: dictionary with 'YYYY-MM' keys and the positions of the rows (in the original order) as values
+        """
+        start_time = report_dataframe['start_time']
+        month_codes = (start_time.dt.year * 100 + start_time.dt.month).values
+        rows_by_month = pd.Series(np.arange(len(report_dataframe))).groupby(month_codes).indices
+        return {f"{int(code) // 100:04d}-{int(code) % 100:02d}": rows for code, rows in rows_by_month.items()}
+
+    @staticmethod
+    def period_report_df(report_dataframe: pd.DataFrame,
+                         first_month: str,
+                         last_month: str = None,
+                         month_index: Dict[str, np.ndarray] = None) -> pd.DataFrame:
+        """
+        Takes the rows of a month or of a range of months (e.g. a quarter) using the month index
+
+        :param report_dataframe: the (transformed) general report with 'start_time' column
+        :param first_month: the first period in scope as 'YYYY-MM'
+        :param last_month: the last period in scope as 'YYYY-MM' (included), only the first month if missing
+        :param month_index: the month_index() of the report_dataframe (built if missing)
+        :return: dataframe with the rows of the period in the original order
         """
+        if month_index is None:
+            month_index = Transformation.month_index(report_dataframe)
+        last_month = last_month or first_month
+        months_in_scope = [month for month in month_index if first_month <= month <= last_month]
+        rows = np.sort(np.concatenate([month_index[month] for month in months_in_scope])) \
+            if months_in_scope else np.array([], dtype=int)
+        return report_dataframe.iloc[rows].reset_index(drop=True)
 
     @staticmethod
     def annual_to_monthly_report_df(report_dataframe: pd.DataFrame,
-                                    datetime_format: str) -> pd.DataFrame:
+                                    datetime_format: str,
+                                    chosen_month: str = None,
+                                    month_index: Dict[str, np.ndarray] = None) -> pd.DataFrame:
         """
         The function takes a piece from the data
         which is related only for the chosen from the user month
@@ -35,11 +104,15 @@ class Transformation:
 
         :param report_dataframe:
         :param datetime_format:
+        :param chosen_month: the period in scope as 'YYYY-MM', if missing the user is asked for it
+        :param month_index: the month_index() of the report_dataframe (built if missing)
         :return: dataframe with records/rows/lines only for the chosen month
+        :raises ValueError: if the given chosen_month is not in the 'YYYY-MM' format
         """
 
-        correct_input = False
-        chosen_month = None
+        if chosen_month is not None and not re.fullmatch(r'\d{4}-\d{2}', chosen_month.strip()):
+            raise ValueError(f"The chosen month '{chosen_month}' is not in the 'YYYY-MM' format")
+        correct_input = chosen_month is not None
         # Make variables for the first and the last period(month-year)
         # to use them as an example range
         min_datetime = report_dataframe['start_time'].iloc[0]
@@ -58,23 +131,21 @@ class Transformation:
 
             correct_input = re.search(r'(\d{4}-\d{2})', chosen_month.strip())
 
-        # transform the period to an object for further filtering use
+        # transform the period to an object (validates the month number)
         chosen_month_obj = datetime.strptime(chosen_month.strip() +
                                              "-01 00:00:00",
                                              datetime_format)
 
-        chosen_month = pd.Series(chosen_month_obj).dt.to_period('M')
-
-        # filter the data fo only one particular period (month from a year)
-        monthly_data_df = report_dataframe.loc[report_dataframe['start_time'].
-            dt.to_period('M').
-            isin(chosen_month)]. \
-            reset_index(drop=True)
+        # take the data for only one particular period (month from a year)
+        monthly_data_df = Transformation.period_report_df(report_dataframe,
+                                                          f"{chosen_month_obj:%Y-%m}",
+                                                          month_index=month_index)
         return monthly_data_df
 
     @staticmethod
     def main(dataframe: pd.DataFrame,
-             limitations_dataframe: pd.DataFrame
+             limitations_dataframe: pd.DataFrame,
+             chosen_month: str = None
              ) -> dict:
         """
         Uses the original .csv imported reports
@@ -84,19 +155,35 @@ class Transformation:
 
         :param dataframe:
         :param limitations_dataframe:
+        :param chosen_month: the period in scope for the monthly reports as 'YYYY-MM' (asked for if missing)
         :return: dictionary with dataframes for further reporting use
         """
-        flags_data_df = pd.DataFrame(Collection.flags_dict())
+        full_dfs_dict = Transformation.full_history(dataframe, limitations_dataframe)
+        return Transformation.monthly(full_dfs_dict, chosen_month)
+
+    @staticmethod
+    @Instrumentation.measured
+    def full_history(dataframe: pd.DataFrame,
+                     limitations_dataframe: pd.DataFrame
+                     ) -> Dict[str, pd.DataFrame]:
+        """
+        Runs the BaseDataframe transformations on the whole history.
+        This is the month independent (and the most expensive) part of main()
+
+        :param dataframe:
+        :param limitations_dataframe:
+        :return: dictionary with 'new_full_data_df', 'limitations_df', 'flags_data_df', 'full_raw_report_df'
+                and 'full_stats_cube'
+        """
         limitations_df = BaseDataframe.limitations_func(limitations_dataframe)
         df = BaseDataframe.rename_original_report_columns(dataframe)
 
-        # add column for issues
-        df['flags'] = ""
+        # add column for issues (bitmask of the flags from the _collections)
+        df['flags'] = 0
         df['emp_names_input'] = '|' + df['f_name'] + '|' + df['l_name'] + '|'
 
         # rough cleaning of the columns data
-        df = BaseDataframe.unwanted_chars(df)
-        df = BaseDataframe.trim_all_columns(df)
+        df = BaseDataframe.clean_string_columns(df)
 
         # transliteration of the employee names from cyrillic to latin chars
         df["first_name"] = BaseDataframe.transliterate_bg_to_en(df, "f_name", "first_name")
@@ -108,13 +195,14 @@ class Transformation:
         # get only the company name and if the training was IN PERSON/LIVE or ONLINE
         df = BaseDataframe.company_subtraction(df)
 
-        # merge the columns from limitations_df to the monthly/annual df
-        df = pd.merge(
-            left=df,
-            right=limitations_df,
-            left_on='company',
-            right_on='company',
-            how='left')
+        # different employees of the same company can not share a nickname (they would be counted together)
+        df = BaseDataframe.unique_nicknames(df)
+
+        # integer keys of the employees and the companies (and of their pairs) for the counts and the merges
+        df = Dimensions.add_keys(df, ['nickname', 'company'])
+
+        # add the columns of the contract in force (from limitations_df) to the monthly/annual df
+        df = BaseDataframe.assign_contracts(df, limitations_df)
 
         # add columns for counting unique emp|company values w/ totals
         df = BaseDataframe.training_per_emp(df)
@@ -124,35 +212,47 @@ class Transformation:
 
         # substring trainers from calendar via regex.
         df = BaseDataframe.trainer(df)
+        df = Dimensions.add_keys(df, ['trainer'])
 
         # check if the training date is between the dates when company contract starts and ends
         df = BaseDataframe.active_contracts(df)
 
         # create a Month name column
-        df["month"] = [pd.Timestamp(x).month_name() for x in df["start_time"]]
+        df["month"] = df["start_time"].dt.month_name()
 
         # create a Year name column
-        df["year"] = [pd.Timestamp(x).year for x in df["start_time"]]
+        df["year"] = df["start_time"].dt.year
 
         # add column with the name of the day when training was take place
         df['dayname'] = df['start_time'].dt.day_name()
 
-        # reformat start_time
+        # reformat start_time (the dates stay datetime64, they are formatted as text only at the export)
         df['training_datetime'] = BaseDataframe.datetime_normalize(df['start_time'])
 
         # change from datetime to date only
         df['scheduled_date'] = BaseDataframe.date_normalize(df['scheduled_on'])
         df['training_end'] = BaseDataframe.date_normalize(df['end_time'])
 
-        # define the raw dataframes
-        full_raw_report_df = df
+        return Transformation.full_history_dfs(df, limitations_df)
 
-        full_raw_report_df.attrs['name'] = "raw_full"
+    @staticmethod
+    def full_history_dfs(full_raw_report_df: pd.DataFrame,
+                         limitations_df: pd.DataFrame
+                         ) -> Dict[str, pd.DataFrame]:
+        """
+        Defines the full history dataframes from the transformed raw dataframe.
+        The stats cube of the full history is built here once per run, every monthly() call takes its period
 
-        monthly_raw_report_df = Transformation.annual_to_monthly_report_df(
-            full_raw_report_df, Collection.datetime_final_format())
+        :param full_raw_report_df: the transformed general/initial report
+        :param limitations_df: the transformed limitations
+        :return: dictionary with 'new_full_data_df', 'limitations_df', 'flags_data_df', 'full_raw_report_df'
+                and 'full_stats_cube'
+        """
+        flags_data_df = pd.DataFrame(Collection.flags_dict())
+        # number of the flagged rows in the full history
+        flags_data_df['flag_count'] = BaseDataframe.flag_counts(full_raw_report_df['flags']).values
 
-        monthly_raw_report_df.attrs['name'] = "raw_mont"
+        full_raw_report_df.attrs['name'] = "raw_full"
 
         # separate and select only needed columns for new pd sets
         columns_list = Collection.new_data_columns()
@@ -160,21 +260,86 @@ class Transformation:
         # define the new dataframes
         new_full_data_df = full_raw_report_df[columns_list]
 
+        full_dfs_dict = {
+            "new_full_data_df": new_full_data_df,
+            "limitations_df": limitations_df,
+            "flags_data_df": flags_data_df,
+            "full_raw_report_df": full_raw_report_df,
+            "full_stats_cube": StatsCube.build(new_full_data_df)
+        }
+
+        return full_dfs_dict
+
+    @staticmethod
+    @Instrumentation.measured
+    def monthly(full_dfs_dict: Dict[str, pd.DataFrame],
+                chosen_month: str = None,
+                month_index: Dict[str, np.ndarray] = None
+                ) -> Dict[str, pd.DataFrame]:
+        """
+        Takes the chosen month from the full history dataframes
+        and creates the dataframes dictionary for further reporting use
+
+        :param full_dfs_dict: the dictionary from full_history()
+        :param chosen_month: the period in scope for the monthly reports as 'YYYY-MM' (asked for if missing)
+        :param month_index: the month_index() of full_raw_report_df (built if missing)
+        :return: dictionary with dataframes for further reporting use
+        """
+        full_raw_report_df = full_dfs_dict["full_raw_report_df"]
+        new_full_data_df = full_dfs_dict["new_full_data_df"]
+
+        monthly_raw_report_df = Transformation.annual_to_monthly_report_df(
+            full_raw_report_df, Collection.datetime_final_format(), chosen_month, month_index)
+
+        monthly_raw_report_df.attrs['name'] = "raw_mont"
+
+        # separate and select only needed columns for new pd sets
+        columns_list = Collection.new_data_columns()
+
         new_monthly_data_df = monthly_raw_report_df[columns_list]
 
         # define the training session dataframes
         total_trainings_df, report_trainers_df = \
             BaseDataframe.total_trainings_func(new_monthly_data_df, new_full_data_df)
 
+        # the stats sheets are derived from one pre-aggregated cube built by full_history_dfs()
+        # (the monthly one is a part of the full one)
+        full_stats_cube = full_dfs_dict["full_stats_cube"]
+        monthly_stats_cube = StatsCube.period(full_stats_cube, new_monthly_data_df)
+
         dfs_dict = {
             "total_trainings_df": total_trainings_df,
             "report_trainers_df": report_trainers_df,
             "new_monthly_data_df": new_monthly_data_df,
             "new_full_data_df": new_full_data_df,
-            "limitations_df": limitations_df,
-            "flags_data_df": flags_data_df,
+            "limitations_df": full_dfs_dict["limitations_df"],
+            "flags_data_df": full_dfs_dict["flags_data_df"],
             "full_raw_report_df": full_raw_report_df,
-            "monthly_raw_report_df": monthly_raw_report_df
+            "monthly_raw_report_df": monthly_raw_report_df,
+            "full_stats_cube": full_stats_cube,
+            "monthly_stats_cube": monthly_stats_cube
         }
 
         return dfs_dict
+
+    @staticmethod
+    def compact_dtypes(dfs_dict: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """
+        Opt-in compact representation of the dataframes from main():
+        the low-cardinality string columns from the _collections become categoricals
+        and the integer columns are downcasted to the smallest integer type.
+        The float columns are kept as float64, so the sums and the describe() statistics are not changed
+
+        :param dfs_dict: dictionary with dataframes from main() or monthly()
+        :return: dictionary with the same dataframes in compact dtypes
+        """
+        compact_dfs_dict = {}
+        for name, df in dfs_dict.items():
+            dtypes = {column: 'category' for column in Collection.compact_columns() if column in df.columns}
+            # the timedelta columns are also selected as 'integer', so they are filtered out
+            for column in df.select_dtypes(include='integer').columns:
+                if not pd.api.types.is_integer_dtype(df[column]):
+                    continue
+                dtypes[column] = pd.to_numeric(df[column], downcast='integer').dtype
+            compact_dfs_dict[name] = df.astype(dtypes)
+        return compact_dfs_dict
@@ -0,0 +1,119 @@
+# coding: utf8
+"""
+Tests of the invoice number allocator (BaseInvoice.invoice_numbers()): the numbers of a batch are committed
+only when the batch succeeds, so a failed batch loses no numbers. The Windows lock of the sequence file
+is tested with a fake msvcrt module.
+
+Usage (from the repository root):
+    python -m unittest discover -s tests -t .
+"""
+import errno
+import os
+import tempfile
+import threading
+import types
+import unittest
+from unittest import mock
+import pandas as pd
+from project.file_operations import Export
+from project.invoices import BaseInvoice
+
+
+class InvoiceNumbersTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        # the sequence file is relative to the working folder
+        self.current_dir = os.getcwd()
+        self.folder = tempfile.TemporaryDirectory()
+        os.chdir(self.folder.name)
+        os.makedirs('imports')
+        with open(BaseInvoice.invoice_seq_file(), 'w') as f:
+            f.write('1000')
+
+    def tearDown(self) -> None:
+        os.chdir(self.current_dir)
+        self.folder.cleanup()
+
+    @staticmethod
+    def next_number() -> int:
+        with open(BaseInvoice.invoice_seq_file()) as f:
+            return int(f.readline())
+
+    def test_blocks_are_contiguous(self) -> None:
+        with BaseInvoice.invoice_numbers(3) as numbers:
+            self.assertEqual(numbers, ['1000', '1001', '1002'])
+        self.assertEqual(BaseInvoice.reserve_invoice_numbers(2), ['1003', '1004'])
+        self.assertEqual(self.next_number(), 1005)
+
+    def test_failed_batch_keeps_the_sequence(self) -> None:
+        with self.assertRaises(RuntimeError):
+            with BaseInvoice.invoice_numbers(3):
+                raise RuntimeError("the invoice rendering failed")
+        self.assertEqual(self.next_number(), 1000)
+        # the numbers of the failed batch are handed out again
+        with BaseInvoice.invoice_numbers(2) as numbers:
+            self.assertEqual(numbers, ['1000', '1001'])
+        self.assertEqual(self.next_number(), 1002)
+
+    def test_batch_blocks_other_threads(self) -> None:
+        other_numbers = []
+        with BaseInvoice.invoice_numbers(2) as numbers:
+            other = threading.Thread(target=lambda: other_numbers.extend(BaseInvoice.reserve_invoice_numbers(1)))
+            other.start()
+            other.join(0.2)
+            # the other thread waits until the batch is committed
+            self.assertTrue(other.is_alive())
+        other.join()
+        self.assertEqual(numbers, ['1000', '1001'])
+        self.assertEqual(other_numbers, ['1002'])
+
+    def test_failed_company_artifacts_keep_the_sequence(self) -> None:
+        dataframe = pd.DataFrame({'company': ['ACME', 'ACME', 'GLOBEX'],
+                                  'nickname': ['AAAAAAAA', 'BBBBBBBB', 'CCCCCCCC'],
+                                  'is_valid': [1, 1, 1], 'type': ['ACME | Online', 'ACME | Online', 'GLOBEX | Online'],
+                                  'bgn_per_hour': [50.0, 50.0, 60.0],
+                                  'training_datetime': pd.to_datetime(['2023-02-01 10:00', '2023-02-02 10:00',
+                                                                       '2023-02-03 10:00'])})
+        with mock.patch.object(Export, 'run_work_items', side_effect=RuntimeError("a worker died")):
+            with self.assertRaises(RuntimeError):
+                Export.companies_df_to_excel('Companies', dataframe, os.path.join(self.folder.name, ''))
+        self.assertEqual(self.next_number(), 1000)
+
+    @staticmethod
+    def windows(locking: mock.Mock):
+        """
+        :param locking: the mock of msvcrt.locking()
+        :return: context manager which makes invoice_seq_lock() use the Windows branch with the fake msvcrt module
+        """
+        msvcrt = types.SimpleNamespace(LK_LOCK=1, LK_UNLCK=0, locking=locking)
+        return mock.patch.dict('sys.modules', msvcrt=msvcrt)
+
+    def test_windows_lock_retries_on_contention(self) -> None:
+        locking = mock.Mock(side_effect=[OSError(errno.EDEADLOCK, 'locked'), OSError(errno.EACCES, 'locked'),
+                                         None, None])
+        with self.windows(locking), mock.patch('project.invoices.os.name', 'nt'):
+            self.assertEqual(BaseInvoice.reserve_invoice_numbers(1), ['1000'])
+        # two failed attempts, the lock and the unlock
+        self.assertEqual(locking.call_count, 4)
+        self.assertEqual(self.next_number(), 1001)
+
+    def test_windows_lock_raises_other_errors(self) -> None:
+        locking = mock.Mock(side_effect=OSError(errno.EBADF, 'bad file descriptor'))
+        with self.windows(locking), mock.patch('project.invoices.os.name', 'nt'):
+            with self.assertRaises(OSError) as raised:
+                BaseInvoice.reserve_invoice_numbers(1)
+        self.assertEqual(raised.exception.errno, errno.EBADF)
+        self.assertEqual(locking.call_count, 1)
+        self.assertEqual(self.next_number(), 1000)
+
+    def test_windows_lock_times_out(self) -> None:
+        locking = mock.Mock(side_effect=OSError(errno.EDEADLOCK, 'locked'))
+        with self.windows(locking), mock.patch('project.invoices.os.name', 'nt'), \
+                mock.patch.object(BaseInvoice, 'invoice_seq_lock_timeout', return_value=0):
+            with self.assertRaises(TimeoutError):
+                BaseInvoice.reserve_invoice_numbers(1)
+        self.assertEqual(self.next_number(), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# coding: utf8
+"""
+Tests of the nicknames shared by different employees of the same company
+(BaseDataframe.nickname_persons(), BaseDataframe.unique_nicknames() and the incremental store).
+
+Usage (from the repository root):
+    python -m unittest discover -s tests -t .
+"""
+import logging
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from project.cache import TransformationCache
+from project.dataframes import BaseDataframe
+from project.file_operations import Import
+
+IMPORTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'project', 'imports')
+
+
+def employees(rows: list) -> pd.DataFrame:
+    """
+    :param rows: tuples (nickname, company, employee_names, work_email)
+    :return: dataframe with the columns used by the nickname checks
+    """
+    df = pd.DataFrame(rows, columns=['nickname', 'company', 'employee_names', 'work_email'])
+    return df.assign(pvt_email='', flags=0)
+
+
+class UniqueNicknamesTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        logging.disable(logging.WARNING)
+
+    def tearDown(self) -> None:
+        logging.disable(logging.NOTSET)
+
+    def test_same_company_collision_is_renamed_and_flagged(self) -> None:
+        df = employees([('EDURUKUR', 'ACME', 'Eda Rukur', 'eru@acme.com'),
+                        ('EDURUKUR', 'ACME', 'Edi Rukurov', 'zru@acme.com'),
+                        ('EDURUKUR', 'ACME', 'Eda Rukur', 'eru@acme.com')])
+        df = BaseDataframe.unique_nicknames(df)
+        self.assertEqual(df['nickname'].tolist(), ['EDURUKUR', 'EDURUKU2', 'EDURUKUR'])
+        self.assertTrue(BaseDataframe.has_flag(df['flags'], 10).all())
+
+    def test_same_nickname_in_different_companies_is_unchanged(self) -> None:
+        df = employees([('EDURUKUR', 'ACME', 'Eda Rukur', 'eru@acme.com'),
+                        ('EDURUKUR', 'GLOBEX', 'Edi Rukurov', 'zru@globex.com')])
+        df = BaseDataframe.unique_nicknames(df)
+        self.assertEqual(df['nickname'].tolist(), ['EDURUKUR', 'EDURUKUR'])
+        self.assertFalse(BaseDataframe.has_flag(df['flags'], 10).any())
+
+    def test_rows_linked_by_names_or_email_are_one_employee(self) -> None:
+        # a changed work email (rows 0-1), differently written names (rows 1-2) and a chain through them (0-2)
+        df = employees([('EDURUKUR', 'ACME', 'Eda Rukur', 'eru@acme.com'),
+                        ('EDURUKUR', 'ACME', 'Eda Rukur', 'eru@newacme.com'),
+                        ('EDURUKUR', 'ACME', 'Eda Rukur-Ivanova', 'eru@newacme.com')])
+        persons = BaseDataframe.nickname_persons(df)
+        self.assertEqual(persons['person'].tolist(), [1, 1, 1])
+        self.assertEqual(persons['persons'].tolist(), [1, 1, 1])
+        self.assertEqual(BaseDataframe.unique_nicknames(df)['nickname'].tolist(), ['EDURUKUR'] * 3)
+
+    def test_missing_nickname_or_company_is_skipped(self) -> None:
+        df = employees([(np.nan, 'ACME', 'A B', 'ab@acme.com'),
+                        (np.nan, 'ACME', 'C D', 'cd@acme.com'),
+                        ('EDURUKUR', np.nan, 'Eda Rukur', 'eru@acme.com'),
+                        ('EDURUKUR', np.nan, 'Edi Rukurov', 'zru@acme.com')])
+        persons = BaseDataframe.nickname_persons(df)
+        self.assertEqual(persons['persons'].tolist(), [0, 0, 0, 0])
+        df = BaseDataframe.unique_nicknames(df)
+        self.assertEqual(df['nickname'].tolist()[2:], ['EDURUKUR', 'EDURUKUR'])
+        self.assertFalse(BaseDataframe.has_flag(df['flags'], 10).any())
+
+
+class IncrementalCollisionTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        logging.disable(logging.WARNING)
+        self.folder = tempfile.TemporaryDirectory()
+        self.report_df = Import.import_report(os.path.join(IMPORTS_DIR, 'schedule2023-04-18.csv'))
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def assert_incremental_equal(self, report_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        :return: the full_raw_report_df of the incremental store after checking it against a full transform
+        """
+        def limitations() -> pd.DataFrame:
+            return Import.import_limitations(os.path.join(IMPORTS_DIR, 'limitations.csv'))
+
+        incremental = TransformationCache.full_history(report_df.copy(), limitations(), 'incremental',
+                                                       self.folder.name)
+        full = TransformationCache.full_history(report_df.copy(), limitations(), 'bypass')
+        for name, df in full.items():
+            pd.testing.assert_frame_equal(df.reset_index(drop=True), incremental[name].reset_index(drop=True))
+        return incremental['full_raw_report_df']
+
+    def test_collision_added_and_removed(self) -> None:
+        # the first run writes the store, the sample data has no shared nicknames in a company
+        df = self.assert_incremental_equal(self.report_df)
+        self.assertFalse(BaseDataframe.has_flag(df['flags'], 10).any())
+
+        # the last appointment becomes another employee of the company of the first one with the same nickname
+        collision_df = self.report_df.copy()
+        first, last = 0, collision_df.index[-1]
+        work_email = [column for column in collision_df.columns if column.startswith('Служебен')][0]
+        company = collision_df.columns[16]
+        for column in ('First Name', 'Last Name'):
+            collision_df.loc[last, column] = str(collision_df.loc[first, column]).strip() + 'ова'
+        collision_df.loc[last, work_email] = 'z' + str(collision_df.loc[first, work_email]).strip()[1:]
+        collision_df.loc[last, 'Email'] = collision_df.loc[last, work_email]
+        for column in ('Type', company):
+            collision_df.loc[last, column] = collision_df.loc[first, column]
+
+        df = self.assert_incremental_equal(collision_df)
+        flagged = df.loc[BaseDataframe.has_flag(df['flags'], 10), ['nickname', 'company']].drop_duplicates()
+        self.assertEqual(len(flagged), 2)
+        self.assertEqual(flagged['company'].nunique(), 1)
+
+        df = self.assert_incremental_equal(self.report_df)
+        self.assertFalse(BaseDataframe.has_flag(df['flags'], 10).any())
+
+
+if __name__ == '__main__':
+    unittest.main()